@@ -0,0 +1,50 @@
+from fastapi import APIRouter, HTTPException, Depends
+from app.schemas.entity import IndexUsage, CacheStats, MatchingIndexStats, PoolStats, HistoryWriterStats, SearchIndexStats
+from app.services.matching import matching_index
+from app.services.search import search_index
+from app.core.config import settings
+from app.core.database import mongodb
+from app.core.indexes import get_index_stats
+from app.core.cache import entity_cache
+from app.utils.history_writer import history_writer
+from app.services.entity_types import schema_registry
+from app.api.v1.endpoints.token import verify_token, token_cache
+
+router = APIRouter()
+
+
+@router.get("/indexes/stats", response_model=dict[str, list[IndexUsage]], dependencies=[Depends(verify_token)])
+async def read_index_stats():
+    try:
+        return await get_index_stats(mongodb.db)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Unexpected error: {str(e)}")
+
+
+@router.get("/cache/stats", response_model=dict[str, CacheStats], dependencies=[Depends(verify_token)])
+async def read_cache_stats():
+    return {"entities": entity_cache.stats(), "tokens": token_cache.stats(), "validators": schema_registry.stats()}
+
+
+@router.get("/matching/stats", response_model=MatchingIndexStats, dependencies=[Depends(verify_token)])
+async def read_matching_stats():
+    return matching_index.stats()
+
+
+@router.get("/search/stats", response_model=SearchIndexStats, dependencies=[Depends(verify_token)])
+async def read_search_stats():
+    return search_index.stats()
+
+
+@router.get("/pool/stats", response_model=PoolStats, dependencies=[Depends(verify_token)])
+async def read_pool_stats():
+    return {
+        "max_pool_size": settings.MONGO_MAX_POOL_SIZE,
+        "min_pool_size": settings.MONGO_MIN_POOL_SIZE,
+        **mongodb.pool_listener.stats(),
+    }
+
+
+@router.get("/history_writer/stats", response_model=HistoryWriterStats, dependencies=[Depends(verify_token)])
+async def read_history_writer_stats():
+    return history_writer.stats()
@@ -0,0 +1,37 @@
+from fastapi import APIRouter, HTTPException, Depends, Query
+from typing import List
+from app.schemas.entity import AggregateRollup
+from app.services.aggregates import DIMENSIONS, get_rollup, get_rollups
+from app.api.v1.endpoints.token import verify_token
+
+router = APIRouter()
+
+
+def _check_dimension(dimension: str):
+    if dimension not in DIMENSIONS:
+        raise HTTPException(status_code=400, detail=f"Invalid dimension '{dimension}'; expected one of {', '.join(DIMENSIONS)}")
+
+
+@router.get("/aggregates/{dimension}", response_model=List[AggregateRollup], dependencies=[Depends(verify_token)])
+async def read_rollups(dimension: str, limit: int = Query(100, ge=1, le=1000)):
+    try:
+        _check_dimension(dimension)
+        return await get_rollups(dimension, limit)
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Unexpected error: {str(e)}")
+
+
+@router.get("/aggregates/{dimension}/{value}", response_model=AggregateRollup, dependencies=[Depends(verify_token)])
+async def read_rollup(dimension: str, value: str):
+    try:
+        _check_dimension(dimension)
+        rollup = await get_rollup(dimension, value)
+        if rollup is None:
+            raise HTTPException(status_code=404, detail=f"No entities with {dimension}={value}")
+        return rollup
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Unexpected error: {str(e)}")
@@ -0,0 +1,36 @@
+from fastapi import APIRouter, HTTPException, Depends, Query
+from typing import Optional
+from app.schemas.entity import ChangeBatch, WatermarkAck
+from app.services.changes import DEFAULT_BATCH_SIZE, MAX_BATCH_SIZE, ack_consumer_watermark, get_changes, get_consumer_watermark
+from app.api.v1.endpoints.token import verify_token
+from app.utils.serialization import TrustedJSONResponse
+
+router = APIRouter()
+
+
+@router.get("/", response_model=ChangeBatch, dependencies=[Depends(verify_token)])
+async def read_changes(
+    after: Optional[str] = Query(None, description="Watermark returned by the previous batch"),
+    consumer: Optional[str] = Query(None, description="Resume from this consumer's acknowledged watermark when after is not given"),
+    limit: int = Query(DEFAULT_BATCH_SIZE, ge=1, le=MAX_BATCH_SIZE),
+    full: bool = Query(False, description="Resolve deltas into the full entity state"),
+):
+    try:
+        if after is None and consumer is not None:
+            after = await get_consumer_watermark(consumer)
+        # History payloads hold ObjectIds and datetimes, so they are encoded directly
+        return TrustedJSONResponse(await get_changes(after, limit, full))
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Unexpected error: {str(e)}")
+
+
+@router.post("/{consumer}/ack", response_model=WatermarkAck, dependencies=[Depends(verify_token)])
+async def acknowledge_changes(consumer: str, ack: WatermarkAck):
+    try:
+        return {"watermark": await ack_consumer_watermark(consumer, ack.watermark)}
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Unexpected error: {str(e)}")
@@ -1,45 +1,282 @@
-from fastapi import APIRouter, HTTPException, Depends
-from app.schemas.entity import CustomerCreate, CustomerOut, CustomerUpdate, CustomerHistoryOut
-from app.services.entity import create_entity, list_entities, get_entity_by_id, update_entity, delete_entity, get_entity_history_by_id, get_entity_by_attribute
-from typing import List
+from fastapi import APIRouter, HTTPException, Depends, Header, Query, Request, Response
+from fastapi.responses import JSONResponse, StreamingResponse
+from app.schemas.entity import CustomerCreate, CustomerOut, CustomerUpdate, CustomerHistoryOut, BulkIngestResult, EntityCreateResult, MatchResult, SearchResult, EntityAsOf, AsOfRequest, AsOfResult
+from app.services.matching import matching_index
+from app.services.search import SEARCH_FIELDS, search_index
+from app.schemas.query import EntityQuery, EntityQueryResult
+from app.services.query import query_entities
+from app.services.history import get_entities_as_of
+from app.schemas.fieldsets import projected_list_adapter, projected_model
+from pydantic import TypeAdapter
+from app.services.entity import parse_entity_fields, DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, DEFAULT_BULK_CHUNK_SIZE, MAX_BULK_CHUNK_SIZE, create_entity, bulk_create_entities, list_entities, stream_entities, get_entity_by_id, update_entity, delete_entity, get_entity_history_by_id, get_entity_by_attribute, DEFAULT_HISTORY_PAGE_SIZE, MAX_HISTORY_PAGE_SIZE, get_entity_version, list_entity_versions, get_attribute_versions, get_entity_history_versions
+from typing import List, Optional, Union
+from bson import ObjectId
+from bson.errors import InvalidId
+from datetime import datetime
 from app.api.v1.endpoints.token import verify_token
 from app.core.config import settings
+from app.core.database import causal_session
+from app.core.metrics import validation_phase
+from app.utils.utils import etag_matches, fields_variant, make_etag, make_page_etag, parse_expected_version
+from app.utils.serialization import CUSTOMER_OUT_FIELDS, TrustedJSONResponse, trusted_customer
+import json
 
 router = APIRouter()
 
+FIELDS_DESCRIPTION = "Comma separated field paths to return, e.g. customerId,personalInfo,contactInfo.email"
+IF_NONE_MATCH_DESCRIPTION = "ETag from an earlier response; 304 without a body if it still matches"
+
+
+def _not_modified(etag: str) -> Response:
+    return Response(status_code=304, headers={"ETag": etag})
+
+
+def _list_etag(pairs: list, has_more: bool, limit: int, after: Optional[str], fields: Optional[tuple]) -> str:
+    return make_page_etag("list", pairs, has_more, limit, after, fields)
+
+
+def _attribute_etag(entity_attribute: str, entity_value: str, pairs: list, fields: Optional[tuple]) -> str:
+    return make_page_etag("attribute", entity_attribute, entity_value, sorted(pairs), fields)
+
+
+def _history_etag(entity_id: str, versions: list, next_version: Optional[int]) -> str:
+    return make_page_etag("history", entity_id, versions, next_version)
+
+
+def _object_id(entity_id: str) -> ObjectId:
+    try:
+        return ObjectId(entity_id)
+    except (InvalidId, TypeError):
+        raise HTTPException(status_code=400, detail=f"Invalid entity id: {entity_id}")
+
+
+def _sparse_response(fields: tuple, data, response: Response) -> JSONResponse:
+    """Validate and encode a projected read with a model shaped like the projection instead of CustomerOut"""
+    with validation_phase():
+        if isinstance(data, list):
+            adapter = projected_list_adapter(fields)
+            content = adapter.dump_python(adapter.validate_python(data), mode="json", by_alias=True)
+        else:
+            content = projected_model(fields).model_validate(data).model_dump(mode="json", by_alias=True)
+    return JSONResponse(content=content, headers=dict(response.headers))
+
+
+_customer_adapter = TypeAdapter(CustomerOut)
+_customer_list_adapter = TypeAdapter(List[CustomerOut])
+
+
+def _validated_response(data, response: Response) -> JSONResponse:
+    """Validate and encode full documents against CustomerOut, the work response_model would otherwise do untimed"""
+    adapter = _customer_list_adapter if isinstance(data, list) else _customer_adapter
+    with validation_phase():
+        content = adapter.dump_python(adapter.validate_python(data), mode="json", by_alias=True)
+    return JSONResponse(content=content, headers=dict(response.headers))
+
+
+def _trusted_response(data, response: Response) -> TrustedJSONResponse:
+    """Encode stored documents directly, skipping response_model validation (FAST_SERIALIZATION)"""
+    with validation_phase():
+        if isinstance(data, list):
+            content = [trusted_customer(doc) for doc in data]
+        else:
+            content = trusted_customer(data)
+    return TrustedJSONResponse(content=content, headers=dict(response.headers))
+
+
+async def _prepend(first, rest):
+    if first is None:
+        return
+    yield first
+    async for item in rest:
+        yield item
+
+
+def _parse_ndjson_line(line: bytes):
+    try:
+        return json.loads(line)
+    except ValueError as e:
+        return ValueError(f"Invalid JSON: {e}")
+
+
+async def _read_bulk_rows(request: Request):
+    """Yield rows from a JSON array body, or incrementally from an NDJSON body"""
+    if "ndjson" in request.headers.get("content-type", ""):
+        buffer = b""
+        async for chunk in request.stream():
+            buffer += chunk
+            *lines, buffer = buffer.split(b"\n")
+            for line in lines:
+                if line.strip():
+                    yield _parse_ndjson_line(line)
+        if buffer.strip():
+            yield _parse_ndjson_line(buffer)
+        return
 
-@router.post("/create_entity/", response_model=str, dependencies=[Depends(verify_token)])
-async def add_entity(payload: CustomerCreate):
     try:
-        entity_id = await create_entity(payload.dict())
+        body = await request.json()
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Body must be a JSON array or NDJSON")
+    if not isinstance(body, list):
+        raise HTTPException(status_code=400, detail="Body must be a JSON array or NDJSON")
+    for row in body:
+        yield row
+
+
+@router.post("/create_entity/", response_model=Union[str, EntityCreateResult], dependencies=[Depends(verify_token)])
+async def add_entity(
+    payload: CustomerCreate,
+    include_matches: bool = Query(False, description="Also return existing entities that look like duplicates of this one"),
+):
+    try:
+        data = payload.dict()
+        matches = matching_index.match(data) if include_matches and settings.MATCHING_ENABLED else None
+        entity_id = await create_entity(data)
+        if include_matches:
+            return {"id": entity_id, "matches": matches or [], "index_ready": matching_index.ready}
         return entity_id
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Unexpected error: {str(e)}")
 
+@router.post("/match_entity/", response_model=MatchResult, dependencies=[Depends(verify_token)])
+async def match_entity(
+    payload: CustomerCreate,
+    threshold: Optional[float] = Query(None, ge=0, le=1),
+    limit: int = Query(10, ge=1, le=100),
+):
+    if not settings.MATCHING_ENABLED:
+        raise HTTPException(status_code=503, detail="Matching is disabled")
+    return {"matches": matching_index.match(payload.dict(), threshold, limit), "index_ready": matching_index.ready}
+
+@router.get("/search/", response_model=SearchResult, dependencies=[Depends(verify_token)])
+async def search_entities(
+    q: str = Query(..., min_length=1, max_length=100, description="Prefix of a first or last name, full name, email or loyalty id"),
+    limit: int = Query(10, ge=1, le=50),
+    fields: Optional[str] = Query(None, description=f"Comma separated subset of {', '.join(SEARCH_FIELDS)}"),
+):
+    if not settings.SEARCH_ENABLED:
+        raise HTTPException(status_code=503, detail="Search is disabled")
+    selected = SEARCH_FIELDS
+    if fields:
+        selected = tuple(field.strip() for field in fields.split(",") if field.strip())
+        unknown = [field for field in selected if field not in SEARCH_FIELDS]
+        if unknown or not selected:
+            raise HTTPException(status_code=400, detail=f"Unknown search fields: {', '.join(unknown)}")
+    return {"query": q, "hits": search_index.search(q, limit, selected), "index_ready": search_index.ready}
+
+@router.post(
+    "/bulk_create_entity/",
+    response_model=BulkIngestResult,
+    dependencies=[Depends(verify_token)],
+    openapi_extra={
+        "requestBody": {
+            "required": True,
+            "content": {
+                "application/json": {"schema": {"type": "array", "items": {"$ref": "#/components/schemas/CustomerCreate"}}},
+                "application/x-ndjson": {"schema": {"type": "string", "description": "One CustomerCreate JSON object per line"}},
+            },
+        }
+    },
+)
+async def bulk_add_entities(
+    request: Request,
+    upsert_key: Optional[str] = Query(None, description="Field that identifies an existing entity to update instead of inserting, e.g. identifiers.loyaltyId"),
+    chunk_size: int = Query(DEFAULT_BULK_CHUNK_SIZE, ge=1, le=MAX_BULK_CHUNK_SIZE),
+):
+    try:
+        return await bulk_create_entities(_read_bulk_rows(request), upsert_key, chunk_size)
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Unexpected error: {str(e)}")
+
 @router.get("/", response_model=List[CustomerOut], dependencies=[Depends(verify_token)])
-async def get_entities():
+async def get_entities(
+    response: Response,
+    limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE),
+    after: Optional[str] = Query(None, description="Opaque cursor from the X-Next-Cursor header of the previous page"),
+    stream: bool = Query(False, description="Stream every matching entity as application/x-ndjson"),
+    fields: Optional[str] = Query(None, description=FIELDS_DESCRIPTION),
+    if_none_match: Optional[str] = Header(None, description=IF_NONE_MATCH_DESCRIPTION),
+):
     try:
-        return list_entities()
+        projected = parse_entity_fields(fields)
+        if stream:
+            # Validate the cursor before the response starts so a bad one is still a 400
+            lines = stream_entities(after, limit, projected)
+            first = await anext(lines, None)
+            return StreamingResponse(_prepend(first, lines), media_type="application/x-ndjson")
+
+        page_size = limit or DEFAULT_PAGE_SIZE
+        if if_none_match:
+            # The page's ids and versions decide its content, so compare before reading whole documents
+            pairs = await list_entity_versions(page_size, after)
+            etag = _list_etag(pairs[:page_size], len(pairs) > page_size, page_size, after, projected)
+            if etag_matches(if_none_match, etag):
+                return _not_modified(etag)
+
+        trusted = settings.FAST_SERIALIZATION and not projected
+        entities, next_cursor = await list_entities(page_size, after, CUSTOMER_OUT_FIELDS if trusted else projected)
+        if next_cursor:
+            response.headers["X-Next-Cursor"] = next_cursor
+        pairs = [(entity["id"], entity.get("version", 1)) for entity in entities]
+        response.headers["ETag"] = _list_etag(pairs, next_cursor is not None, page_size, after, projected)
+        if projected:
+            return _sparse_response(projected, entities, response)
+        if trusted:
+            return _trusted_response(entities, response)
+        return _validated_response(entities, response)
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Unexpected error: {str(e)}")
 
 @router.get("/get_entity/id/{entity_id}", response_model=CustomerOut, dependencies=[Depends(verify_token)])
-def read_entity_by_id(entity_id: str):
+async def read_entity_by_id(
+    entity_id: str,
+    response: Response,
+    fields: Optional[str] = Query(None, description=FIELDS_DESCRIPTION),
+    if_none_match: Optional[str] = Header(None, description=IF_NONE_MATCH_DESCRIPTION),
+):
     try:
-        entity = get_entity_by_id(entity_id)
+        projected = parse_entity_fields(fields)
+        variant = fields_variant(projected)
+        if if_none_match:
+            version = await get_entity_version(entity_id)
+            if version is not None and etag_matches(if_none_match, make_etag(entity_id, version, variant)):
+                return _not_modified(make_etag(entity_id, version, variant))
+        entity = await get_entity_by_id(entity_id, projected)
         if not entity:
             raise HTTPException(status_code=404, detail="Entity not found")
-        return entity
+        response.headers["ETag"] = make_etag(entity["id"], entity.get("version", 1), variant)
+        if projected:
+            return _sparse_response(projected, entity, response)
+        if settings.FAST_SERIALIZATION:
+            return _trusted_response(entity, response)
+        return _validated_response(entity, response)
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Unexpected error: {str(e)}")
 
 @router.patch("/{entity_id}", response_model=CustomerOut, dependencies=[Depends(verify_token)])
-async def update_existing_entity(entity_id: str, entity_data:CustomerUpdate):
+async def update_existing_entity(
+    entity_id: str,
+    entity_data: CustomerUpdate,
+    response: Response,
+    if_match: Optional[str] = Header(None, description="ETag (or version) the update is based on; 409 if it is stale"),
+    expected_version: Optional[int] = Query(None, ge=1, description="Alternative to If-Match"),
+):
     try:
-        success = await update_entity(entity_id, entity_data)
-        if not success:
-            raise HTTPException(status_code=404, detail="Entity not found or no changes")
-        return get_entity_by_id(entity_id)
+        if expected_version is None:
+            try:
+                expected_version = parse_expected_version(if_match)
+            except ValueError as e:
+                raise HTTPException(status_code=400, detail=str(e))
+        updated = await update_entity(entity_id, entity_data, expected_version)
+        response.headers["ETag"] = make_etag(updated["id"], updated["version"])
+        return _validated_response(updated, response)
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Unexpected error: {str(e)}")
 
@@ -50,25 +287,113 @@ async def delete_existing_entity(entity_id: str):
         if not success:
             raise HTTPException(status_code=404, detail="Entity not found")
         return {"detail": "Entity deleted"}
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Unexpected error: {str(e)}")
 
 @router.get("/entities/{entity_id}/history", response_model=list[CustomerHistoryOut], dependencies=[Depends(verify_token)])
-async def get_entity_history(entity_id: str):
+async def get_entity_history(
+    entity_id: str,
+    response: Response,
+    from_version: Optional[int] = Query(None, ge=1, description="First version to return"),
+    to_version: Optional[int] = Query(None, ge=1, description="Last version to return"),
+    limit: int = Query(DEFAULT_HISTORY_PAGE_SIZE, ge=1, le=MAX_HISTORY_PAGE_SIZE),
+    if_none_match: Optional[str] = Header(None, description=IF_NONE_MATCH_DESCRIPTION),
+):
     try:
-        history = get_entity_history_by_id(entity_id)
+        _object_id(entity_id)
+        # History is read from secondaries when configured; one causal session keeps the ETag check,
+        # the page and its replay from observing different points of the history
+        async with causal_session() as session:
+            if if_none_match:
+                versions = await get_entity_history_versions(entity_id, from_version, to_version, limit, session=session)
+                if versions:
+                    etag = _history_etag(entity_id, versions[:limit], versions[limit] if len(versions) > limit else None)
+                    if etag_matches(if_none_match, etag):
+                        return _not_modified(etag)
+            history, next_version = await get_entity_history_by_id(entity_id, from_version, to_version, limit, session=session)
         if not history:
             raise HTTPException(status_code=404, detail="No history found for this entity")
+        if next_version is not None:
+            response.headers["X-Next-Version"] = str(next_version)
+        response.headers["ETag"] = _history_etag(entity_id, [record.version for record in history], next_version)
         return history
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Unexpected error: {str(e)}")
+
+@router.get("/entities/{entity_id}/as_of", response_model=EntityAsOf, dependencies=[Depends(verify_token)])
+async def get_entity_as_of(entity_id: str, timestamp: datetime = Query(..., description="ISO 8601 instant; naive values are UTC")):
+    try:
+        object_id = _object_id(entity_id)
+        entities = await get_entities_as_of([object_id], timestamp)
+        if not entities:
+            raise HTTPException(status_code=404, detail="Entity did not exist at this time")
+        return entities[0]
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Unexpected error: {str(e)}")
+
+@router.post("/as_of/", response_model=AsOfResult, dependencies=[Depends(verify_token)])
+async def get_entities_as_of_bulk(request: AsOfRequest):
+    try:
+        object_ids = list(dict.fromkeys(_object_id(entity_id) for entity_id in request.ids))
+        entities = await get_entities_as_of(object_ids, request.timestamp)
+        found = {entity["id"] for entity in entities}
+        return {
+            "timestamp": request.timestamp,
+            "entities": entities,
+            "missing": [str(object_id) for object_id in object_ids if str(object_id) not in found],
+        }
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Unexpected error: {str(e)}")
 
 @router.get("/get_entity/{entity_attribute},{entity_value}", response_model=List[CustomerOut], dependencies=[Depends(verify_token)])
-async def read_entity_by_field(entity_attribute: str, entity_value:str):
+async def read_entity_by_field(
+    entity_attribute: str,
+    entity_value: str,
+    response: Response,
+    fields: Optional[str] = Query(None, description=FIELDS_DESCRIPTION),
+    if_none_match: Optional[str] = Header(None, description=IF_NONE_MATCH_DESCRIPTION),
+):
     try:
-        entity = get_entity_by_attribute(entity_attribute, entity_value)
+        projected = parse_entity_fields(fields)
+        if if_none_match:
+            pairs = await get_attribute_versions(entity_attribute, entity_value)
+            etag = _attribute_etag(entity_attribute, entity_value, pairs, projected)
+            if pairs and etag_matches(if_none_match, etag):
+                return _not_modified(etag)
+        trusted = settings.FAST_SERIALIZATION and not projected
+        entity = await get_entity_by_attribute(entity_attribute, entity_value, CUSTOMER_OUT_FIELDS if trusted else projected)
         if not entity:
             raise HTTPException(status_code=404, detail="Entity not found")
-        return entity
+        pairs = [(doc["id"], doc.get("version", 1)) for doc in entity]
+        response.headers["ETag"] = _attribute_etag(entity_attribute, entity_value, pairs, projected)
+        if projected:
+            return _sparse_response(projected, entity, response)
+        if trusted:
+            return _trusted_response(entity, response)
+        return _validated_response(entity, response)
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Unexpected error: {str(e)}")
+
+@router.post("/query/", response_model=EntityQueryResult, dependencies=[Depends(verify_token)])
+async def query_entities_endpoint(query: EntityQuery):
+    try:
+        projected = parse_entity_fields(query.fields)
+        result = await query_entities(query, projected)
+        adapter = projected_list_adapter(projected) if projected else _customer_list_adapter
+        with validation_phase():
+            result["items"] = adapter.dump_python(adapter.validate_python(result["items"]), mode="json", by_alias=True)
+        return result
+    except HTTPException:
+        raise
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Unexpected error: {str(e)}")
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=f"Unexpected error: {str(e)}")
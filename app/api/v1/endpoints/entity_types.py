@@ -0,0 +1,84 @@
+from fastapi import APIRouter, HTTPException, Depends, Query, Request, Response
+from typing import List, Optional
+from app.schemas.entity import BulkIngestResult, EntityTypeCreate, EntityTypeOut
+from app.services.entity import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE
+from app.services.entity_types import schema_out, schema_registry, create_typed_entity, bulk_create_typed_entities, get_typed_entity, list_typed_entities
+from app.api.v1.endpoints.token import verify_token
+
+router = APIRouter()
+
+
+@router.get("/", response_model=List[EntityTypeOut], dependencies=[Depends(verify_token)])
+async def read_entity_types():
+    return await schema_registry.list_types()
+
+
+@router.post("/{type_name}/schemas", response_model=EntityTypeOut, dependencies=[Depends(verify_token)])
+async def register_schema(type_name: str, payload: EntityTypeCreate):
+    """Register the next schema version of a type, creating the type on its first version"""
+    try:
+        fields = {name: spec.model_dump(exclude_none=True) for name, spec in payload.fields.items()}
+        return await schema_registry.register(type_name, fields, payload.description)
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Unexpected error: {str(e)}")
+
+
+@router.get("/{type_name}/schemas", response_model=EntityTypeOut, dependencies=[Depends(verify_token)])
+async def read_schema(type_name: str, version: Optional[int] = Query(None, ge=1, description="Schema version (default: latest)")):
+    doc = await schema_registry.get_schema(type_name, version)
+    if doc is None:
+        raise HTTPException(status_code=404, detail=f"Unknown schema {type_name}" + (f" v{version}" if version else ""))
+    return schema_out(doc)
+
+
+@router.post("/{type_name}/entities/", response_model=str, dependencies=[Depends(verify_token)])
+async def add_typed_entity(type_name: str, request: Request):
+    try:
+        payload = await request.json()
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Body must be a JSON object")
+    try:
+        return await create_typed_entity(type_name, payload)
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Unexpected error: {str(e)}")
+
+
+@router.post("/{type_name}/entities/bulk/", response_model=BulkIngestResult, dependencies=[Depends(verify_token)])
+async def bulk_add_typed_entities(type_name: str, request: Request):
+    try:
+        rows = await request.json()
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Body must be a JSON array")
+    if not isinstance(rows, list):
+        raise HTTPException(status_code=400, detail="Body must be a JSON array")
+    try:
+        return await bulk_create_typed_entities(type_name, rows)
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Unexpected error: {str(e)}")
+
+
+@router.get("/{type_name}/entities/", response_model=List[dict], dependencies=[Depends(verify_token)])
+async def read_typed_entities(
+    type_name: str,
+    response: Response,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    after: Optional[str] = Query(None, description="Opaque cursor from the X-Next-Cursor header of the previous page"),
+):
+    entities, next_cursor = await list_typed_entities(type_name, limit, after)
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+    return entities
+
+
+@router.get("/{type_name}/entities/{entity_id}", response_model=dict, dependencies=[Depends(verify_token)])
+async def read_typed_entity(type_name: str, entity_id: str):
+    entity = await get_typed_entity(type_name, entity_id)
+    if entity is None:
+        raise HTTPException(status_code=404, detail="Entity not found")
+    return entity
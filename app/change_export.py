@@ -0,0 +1,69 @@
+"""
+Push mode for the change feed: tail entity_history and write compressed NDJSON chunk files.
+
+    python -m app.change_export --consumer warehouse --sink /data/exports [--full] [--once]
+
+Each batch becomes <sink>/<consumer>/<first>-<last>.ndjson.gz, written to a temporary name, fsynced
+and renamed, and only then is the consumer's watermark persisted. A restart therefore resumes after
+the last complete file; a crash between rename and acknowledgement re-exports that one batch.
+"""
+import argparse
+import asyncio
+import gzip
+import os
+
+from app.core.database import connect_to_mongo, close_mongo_connection
+from app.services.changes import DEFAULT_BATCH_SIZE, ack_consumer_watermark, get_changes, get_consumer_watermark
+from app.utils.utils import to_ndjson_line
+
+
+def write_chunk(directory: str, changes: list) -> str:
+    name = f"{changes[0]['id']}-{changes[-1]['id']}.ndjson.gz"
+    path = os.path.join(directory, name)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as raw:
+        with gzip.GzipFile(fileobj=raw, mode="wb") as out:
+            for change in changes:
+                out.write(to_ndjson_line(change))
+        raw.flush()
+        os.fsync(raw.fileno())
+    os.replace(tmp_path, path)
+    return path
+
+
+async def export(consumer: str, sink: str, batch_size: int, full: bool, once: bool, poll_seconds: float):
+    directory = os.path.join(sink, consumer)
+    os.makedirs(directory, exist_ok=True)
+    watermark = await get_consumer_watermark(consumer)
+    exported = 0
+    while True:
+        batch = await get_changes(watermark, batch_size, full)
+        if batch["changes"]:
+            path = await asyncio.to_thread(write_chunk, directory, batch["changes"])
+            watermark = await ack_consumer_watermark(consumer, batch["watermark"])
+            exported += len(batch["changes"])
+            print(f"[export] {consumer}: {len(batch['changes'])} changes -> {path} ({exported:,} total)")
+        if batch["has_more"]:
+            continue
+        if once:
+            return exported
+        await asyncio.sleep(poll_seconds)
+
+
+async def main(args):
+    connect_to_mongo()
+    try:
+        await export(args.consumer, args.sink, args.batch_size, args.full, args.once, args.poll_seconds)
+    finally:
+        close_mongo_connection()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--consumer", required=True)
+    parser.add_argument("--sink", required=True, help="directory that receives the chunk files")
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE)
+    parser.add_argument("--full", action="store_true", help="resolve deltas into full entity state")
+    parser.add_argument("--once", action="store_true", help="exit once caught up instead of tailing")
+    parser.add_argument("--poll-seconds", type=float, default=5.0)
+    asyncio.run(main(parser.parse_args()))
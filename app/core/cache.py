@@ -0,0 +1,165 @@
+# app/core/cache.py
+
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Any, Hashable, Optional
+import time
+from app.core.config import settings
+
+_MISSING = object()
+
+
+class TTLCache:
+    """
+    Size-bounded LRU cache whose entries also expire after a TTL.
+    Not thread-safe: it is meant to be used from the event loop of one worker.
+    """
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: OrderedDict = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        entry = self._data.get(key, _MISSING)
+        if entry is _MISSING:
+            self.misses += 1
+            return default
+        value, expires_at = entry
+        if expires_at <= time.monotonic():
+            del self._data[key]
+            self.expirations += 1
+            self.misses += 1
+            return default
+        self._data.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None):
+        ttl = self.ttl if ttl is None else ttl
+        if ttl <= 0:
+            return
+        self._data[key] = (value, time.monotonic() + ttl)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+            self.evictions += 1
+
+    def delete(self, key: Hashable):
+        self._data.pop(key, None)
+
+    def clear(self):
+        self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
+
+
+class VersionBackend(ABC):
+    """
+    Shared store of the latest known version per key, consulted by every worker so a
+    version bumped in one worker invalidates the copies cached by the others.
+    Implementations over a shared service (e.g. Redis) subclass this.
+    """
+
+    @abstractmethod
+    async def get_version(self, key: str) -> Optional[int]:
+        ...
+
+    @abstractmethod
+    async def set_version(self, key: str, version: int, ttl: float):
+        ...
+
+
+class InMemoryVersionBackend(VersionBackend):
+    """Process-local stand-in for a shared VersionBackend, for tests and single-worker deployments"""
+
+    def __init__(self):
+        self._versions = TTLCache(maxsize=1_000_000, ttl=3600)
+
+    async def get_version(self, key: str) -> Optional[int]:
+        return self._versions.get(key)
+
+    async def set_version(self, key: str, version: int, ttl: float):
+        self._versions.set(key, version, ttl)
+
+
+DELETED_VERSION = 2 ** 62
+
+
+class VersionedCache:
+    """
+    Read-through cache of versioned documents.
+    invalidate() records the new version as a floor, so a reader that fetched an older
+    version concurrently with a write can never put it back into the cache.
+    """
+
+    def __init__(self, maxsize: int, ttl: float, enabled: bool = True, backend: Optional[VersionBackend] = None):
+        self.enabled = enabled
+        self.backend = backend
+        self._entries = TTLCache(maxsize, ttl)
+        self._floors = TTLCache(maxsize, ttl)
+        self.stale = 0
+
+    def set_backend(self, backend: Optional[VersionBackend]):
+        self.backend = backend
+        self._entries.clear()
+
+    async def get(self, key: str) -> Optional[dict]:
+        if not self.enabled:
+            return None
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        version, doc = entry
+        if self.backend is not None:
+            current = await self.backend.get_version(key)
+            if current is not None and current != version:
+                self._entries.delete(key)
+                self.stale += 1
+                return None
+        return dict(doc)
+
+    async def set(self, key: str, doc: dict):
+        if not self.enabled:
+            return
+        version = doc.get("version", 1)
+        if version < self._floors.get(key, 0):
+            return
+        if self.backend is not None:
+            current = await self.backend.get_version(key)
+            if current is not None and version < current:
+                return
+        self._entries.set(key, (version, dict(doc)))
+
+    async def invalidate(self, key: str, version: int = DELETED_VERSION):
+        self._entries.delete(key)
+        self._floors.set(key, version)
+        if self.backend is not None:
+            await self.backend.set_version(key, version, self._entries.ttl)
+
+    def stats(self) -> dict:
+        return {**self._entries.stats(), "stale": self.stale, "shared_backend": type(self.backend).__name__ if self.backend else None}
+
+
+entity_cache = VersionedCache(
+    maxsize=settings.ENTITY_CACHE_MAX_SIZE,
+    ttl=settings.ENTITY_CACHE_TTL_SECONDS,
+    enabled=settings.ENTITY_CACHE_ENABLED,
+)
@@ -1,4 +1,5 @@
 # app/core/config.py
+from typing import Literal, Optional
 from pydantic_settings import BaseSettings
 
 class Settings(BaseSettings):
@@ -8,6 +9,99 @@ class Settings(BaseSettings):
     ALGORITHM: str
     ACCESS_TOKEN_EXPIRE_MINUTES: int
 
+    # Connection pool and client options (the same values apply per worker process)
+    MONGO_MAX_POOL_SIZE: int = 100
+    MONGO_MIN_POOL_SIZE: int = 0
+    MONGO_MAX_IDLE_TIME_MS: Optional[int] = None
+    MONGO_WAIT_QUEUE_TIMEOUT_MS: Optional[int] = None
+    MONGO_CONNECT_TIMEOUT_MS: int = 20000
+    MONGO_SERVER_SELECTION_TIMEOUT_MS: int = 30000
+    # Wire compression in preference order, e.g. ["zstd", "zlib"] (zstd needs the zstandard package)
+    MONGO_COMPRESSORS: list[str] = []
+    # Write concern w, e.g. "majority" or 1; None keeps the server default
+    MONGO_WRITE_CONCERN: Optional[str] = None
+    # Read preference for writes and read-your-writes lookups (by id, by attribute, queries)
+    MONGO_READ_PREFERENCE: str = "primary"
+    # Read preference for heavy reads: list pages, streams, history, the change feed and exports
+    MONGO_HEAVY_READ_PREFERENCE: str = "primary"
+    MONGO_HEAVY_READ_MAX_STALENESS_SECONDS: int = -1
+
+    # Single-field indexes created on the entities collection at startup
+    ENTITY_INDEXED_FIELDS: list[str] = [
+        "customerId",
+        "contactInfo.email",
+        "identifiers.loyaltyId",
+        "identifiers.externalSystemIds.id",
+    ]
+
+    # In-process read-through cache in front of get_entity_by_id and the If-None-Match version check.
+    # Other workers' writes only reach it through a shared VersionBackend (entity_cache.set_backend), so
+    # it stays off unless the deployment runs a single worker or installs one
+    ENTITY_CACHE_ENABLED: bool = False
+    ENTITY_CACHE_MAX_SIZE: int = 10000
+    ENTITY_CACHE_TTL_SECONDS: float = 60.0
+
+    # Write the entity update and its history record in one multi-document transaction (requires a replica set)
+    MONGO_TRANSACTIONS: bool = False
+
+    # entity_history stores a full snapshot every N versions and field-level deltas in between
+    HISTORY_SNAPSHOT_INTERVAL: int = 10
+
+    # sync: each write waits for its history insert. write_behind: history records are queued and
+    # group-committed by a background task, trading the last few records on a crash for fewer round trips
+    HISTORY_WRITE_MODE: Literal["sync", "write_behind"] = "sync"
+    HISTORY_QUEUE_MAX_SIZE: int = 10000
+    HISTORY_FLUSH_BATCH_SIZE: int = 500
+    HISTORY_FLUSH_INTERVAL_MS: float = 50
+
+    # Serve list and attribute reads straight from the stored documents (validated on write) with orjson,
+    # skipping the CustomerOut re-validation
+    FAST_SERIALIZATION: bool = False
+
+    # In-memory matching index used to flag duplicate candidates on create
+    MATCHING_ENABLED: bool = True
+    MATCHING_THRESHOLD: float = 0.7
+    MATCHING_MAX_BLOCK_SIZE: int = 1000
+    MATCHING_REFRESH_SECONDS: float = 5.0
+
+    # In-memory prefix index behind the typeahead search endpoint
+    SEARCH_ENABLED: bool = True
+    SEARCH_REFRESH_SECONDS: float = 5.0
+
+    # Runtime-registered entity types: compiled validators per (type, schema version) and how long a
+    # worker trusts its cached idea of each type's latest version
+    SCHEMA_VALIDATOR_CACHE_SIZE: int = 256
+    SCHEMA_LATEST_TTL_SECONDS: float = 5.0
+
+    # Rollups by city, country and preferred location, maintained incrementally on every entity write
+    AGGREGATES_ENABLED: bool = True
+
+    # The change feed and the in-process index tails hold back entity_history records younger than this,
+    # so a write that allocated its _id earlier but committed later is not skipped
+    CHANGE_FEED_SETTLE_SECONDS: float = 2.0
+
+    # Deleted entities are tombstoned, then archived (or purged) with their history after the retention period
+    SOFT_DELETE_RETENTION_DAYS: float = 30
+    PURGE_ENABLED: bool = True
+    PURGE_MODE: Literal["archive", "purge"] = "archive"
+    PURGE_INTERVAL_SECONDS: float = 3600
+    PURGE_BATCH_SIZE: int = 200
+    # Pause between batches so a large backlog does not compete with foreground requests
+    PURGE_BATCH_PAUSE_SECONDS: float = 0.5
+
+    LOG_LEVEL: str = "INFO"
+
+    # Per-route latency histograms and MongoDB command timings, exposed on /metrics
+    METRICS_ENABLED: bool = True
+    # Also count BSON bytes per command; re-encodes every command and reply, so off by default
+    METRICS_COMMAND_BYTES: bool = False
+    # Log requests slower than this with their per-request DB breakdown (0 disables)
+    SLOW_REQUEST_MS: float = 0
+
+    # Verified JWT claims cached per token until the token's exp
+    TOKEN_CACHE_ENABLED: bool = True
+    TOKEN_CACHE_MAX_SIZE: int = 10000
+
     class Config:
         env_file = ".env"
 
@@ -1,18 +1,73 @@
 # app/core/database.py
 
+from contextlib import asynccontextmanager
+import logging
+from motor.motor_asyncio import AsyncIOMotorClient
 from pymongo import MongoClient
+from pymongo.read_preferences import Nearest, Primary, PrimaryPreferred, Secondary, SecondaryPreferred
 from app.core.config import settings
+from app.core.metrics import CommandMetricsListener, PoolMetricsListener
+
+logger = logging.getLogger(__name__)
+
+READ_PREFERENCES = {
+    "primary": Primary,
+    "primaryPreferred": PrimaryPreferred,
+    "secondary": Secondary,
+    "secondaryPreferred": SecondaryPreferred,
+    "nearest": Nearest,
+}
+
+
+def _read_preference(mode: str, max_staleness: int = -1):
+    if mode not in READ_PREFERENCES:
+        raise ValueError(f"Unknown read preference {mode!r}; expected one of {', '.join(READ_PREFERENCES)}")
+    if mode == "primary":
+        return Primary()
+    return READ_PREFERENCES[mode](max_staleness=max_staleness)
+
+
+def client_options(event_listeners: list = ()) -> dict:
+    """Driver options shared by the API client and the batch job clients"""
+    options = {
+        "maxPoolSize": settings.MONGO_MAX_POOL_SIZE,
+        "minPoolSize": settings.MONGO_MIN_POOL_SIZE,
+        "connectTimeoutMS": settings.MONGO_CONNECT_TIMEOUT_MS,
+        "serverSelectionTimeoutMS": settings.MONGO_SERVER_SELECTION_TIMEOUT_MS,
+        "read_preference": _read_preference(settings.MONGO_READ_PREFERENCE),
+        "event_listeners": list(event_listeners),
+    }
+    if settings.MONGO_MAX_IDLE_TIME_MS is not None:
+        options["maxIdleTimeMS"] = settings.MONGO_MAX_IDLE_TIME_MS
+    if settings.MONGO_WAIT_QUEUE_TIMEOUT_MS is not None:
+        options["waitQueueTimeoutMS"] = settings.MONGO_WAIT_QUEUE_TIMEOUT_MS
+    if settings.MONGO_COMPRESSORS:
+        options["compressors"] = ",".join(settings.MONGO_COMPRESSORS)
+    if settings.MONGO_WRITE_CONCERN is not None:
+        w = settings.MONGO_WRITE_CONCERN
+        options["w"] = int(w) if w.isdigit() else w
+    return options
+
+
+def heavy_read_preference():
+    return _read_preference(settings.MONGO_HEAVY_READ_PREFERENCE, settings.MONGO_HEAVY_READ_MAX_STALENESS_SECONDS)
 
 
 class MongoDB:
     def __init__(self):
         self.client = None
         self.db = None
+        self.pool_listener = PoolMetricsListener()
 
     def connect(self):
-        self.client = MongoClient(settings.MONGO_URI)
+        # Pool occupancy backs the admin pool stats and costs a few counter updates per checkout, so it
+        # is always tracked; per-command timing is the part METRICS_ENABLED switches off
+        listeners = [self.pool_listener]
+        if settings.METRICS_ENABLED:
+            listeners.insert(0, CommandMetricsListener())
+        self.client = AsyncIOMotorClient(settings.MONGO_URI, **client_options(listeners))
         self.db = self.client[settings.MONGO_DB]
-        print("[MongoDB] Connected to DB:", self.db.name)
+        logger.info("Connected to MongoDB database %s", self.db.name)
 
     def close(self):
         if self.client:
@@ -25,3 +80,26 @@ def connect_to_mongo():
 
 def close_mongo_connection():
     mongodb.close()
+
+def create_sync_client() -> MongoClient:
+    """Blocking client for batch jobs that run outside the API event loop"""
+    return MongoClient(settings.MONGO_URI, **client_options())
+
+@asynccontextmanager
+async def causal_session():
+    """
+    Causally consistent session for a sequence of reads that may be served by different secondaries:
+    each read observes at least everything the previous ones did.
+    """
+    async with await mongodb.client.start_session(causal_consistency=True) as session:
+        yield session
+
+@asynccontextmanager
+async def snapshot_session():
+    """
+    Session whose reads all see the data as of one cluster time (MongoDB 5.0+), so several reads
+    can be compared against each other. The snapshot must stay within the server's history window
+    (minSnapshotHistoryWindowInSeconds, 5 minutes by default) or reads fail with SnapshotTooOld.
+    """
+    async with await mongodb.client.start_session(snapshot=True) as session:
+        yield session
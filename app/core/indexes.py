@@ -0,0 +1,123 @@
+# app/core/indexes.py
+
+import logging
+from typing import Optional
+from pymongo import ASCENDING, DESCENDING, IndexModel
+from pymongo.errors import OperationFailure
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+def _field_index(field: str, **options) -> IndexModel:
+    return IndexModel([(field, ASCENDING)], name=f"{field}_1", **options)
+
+
+def _live_index(field: str) -> IndexModel:
+    # Partial on live entities: tombstones awaiting purge do not bloat the indexes reads go through
+    return IndexModel([(field, ASCENDING)], name=f"{field}_1_live", partialFilterExpression={"deleted": False})
+
+
+def get_index_registry() -> dict[str, list[IndexModel]]:
+    """Indexes every collection is expected to carry, keyed by collection name"""
+    return {
+        "entities": [
+            *(_live_index(field) for field in settings.ENTITY_INDEXED_FIELDS),
+            IndexModel([("deleted_at", ASCENDING)], name="deleted_at_1_tombstones", partialFilterExpression={"deleted": True}),
+        ],
+        "entity_history": [
+            IndexModel([("entity_id", ASCENDING), ("version", ASCENDING)], name="entity_id_1_version_1"),
+            IndexModel(
+                [("entity_id", ASCENDING), ("timestamp", ASCENDING), ("version", ASCENDING)],
+                name="entity_id_1_timestamp_1_version_1",
+            ),
+        ],
+        "entity_history_archive": [
+            IndexModel([("entity_id", ASCENDING), ("version", ASCENDING)], name="entity_id_1_version_1"),
+        ],
+        "entity_aggregates": [
+            IndexModel([("dimension", ASCENDING), ("entities", DESCENDING)], name="dimension_1_entities_-1"),
+        ],
+        "entity_schemas": [
+            IndexModel([("name", ASCENDING), ("version", DESCENDING)], name="name_1_version_-1", unique=True),
+        ],
+        "users": [
+            _field_index("username", unique=True),
+            _field_index("email", unique=True),
+        ],
+    }
+
+
+def indexed_fields(collection_name: str) -> set[str]:
+    """Fields that lead a registered index on the collection, i.e. fields a query can seek on"""
+    fields = {"_id"}
+    for model in get_index_registry().get(collection_name, []):
+        fields.add(next(iter(model.document["key"])))
+    return fields
+
+
+def get_superseded_indexes() -> dict[str, dict[str, str]]:
+    """Indexes a registered one replaces, as {collection: {registered name: old name}}"""
+    return {
+        # The non-partial indexes created before soft delete; same keys as their partial replacements
+        "entities": {f"{field}_1_live": f"{field}_1" for field in settings.ENTITY_INDEXED_FIELDS},
+    }
+
+
+async def _ensure_index(collection, model: IndexModel, replaces: Optional[str], existing: set[str]):
+    try:
+        await collection.create_indexes([model])
+    except OperationFailure:
+        if replaces not in existing:
+            raise
+        # The server refuses a second index on the same keys; queries go without one until it is rebuilt
+        logger.warning("Dropping index %s on %s so that %s can replace it", replaces, collection.name, model.document["name"])
+        await collection.drop_index(replaces)
+        existing.discard(replaces)
+        await collection.create_indexes([model])
+    if replaces in existing:
+        await collection.drop_index(replaces)
+        logger.info("Dropped index %s on %s, superseded by %s", replaces, collection.name, model.document["name"])
+
+
+async def ensure_indexes(db):
+    """
+    Create every registered index and drop the ones they supersede; safe to run on each startup since
+    existing indexes are left untouched. Each index is handled on its own, so one that cannot be
+    created (e.g. same name, different options) neither stops the API from starting nor holds back the rest.
+    """
+    superseded = get_superseded_indexes()
+    for collection_name, models in get_index_registry().items():
+        collection = db[collection_name]
+        replaced = superseded.get(collection_name, {})
+        existing = set(await collection.index_information()) if replaced else set()
+        for model in models:
+            name = model.document["name"]
+            try:
+                await _ensure_index(collection, model, replaced.get(name), existing)
+            except OperationFailure as e:
+                logger.warning("Could not create index %s on %s: %s", name, collection_name, e)
+
+
+async def get_index_stats(db) -> dict[str, list[dict]]:
+    """Per-index usage counters from $indexStats for every registered collection"""
+    registry = get_index_registry()
+    stats = {}
+    for collection_name, models in registry.items():
+        declared = {model.document["name"] for model in models}
+        rows = []
+        async for row in db[collection_name].aggregate([{"$indexStats": {}}]):
+            rows.append({
+                "name": row["name"],
+                "key": dict(row["key"]),
+                "ops": row.get("accesses", {}).get("ops", 0),
+                "since": row.get("accesses", {}).get("since"),
+                "declared": row["name"] in declared,
+            })
+        present = {row["name"] for row in rows}
+        rows.extend(
+            {"name": name, "key": None, "ops": 0, "since": None, "declared": True, "missing": True}
+            for name in sorted(declared - present)
+        )
+        stats[collection_name] = rows
+    return stats
@@ -0,0 +1,16 @@
+# app/core/log_utils.py
+
+import logging
+from app.core.config import settings
+
+LOG_FORMAT = "%(asctime)s %(levelname)s [%(name)s] %(message)s"
+
+
+def setup_logging():
+    """Route the app's loggers to stderr at LOG_LEVEL; uvicorn keeps its own handlers"""
+    logger = logging.getLogger("app")
+    if not logger.handlers:
+        handler = logging.StreamHandler()
+        handler.setFormatter(logging.Formatter(LOG_FORMAT))
+        logger.addHandler(handler)
+    logger.setLevel(settings.LOG_LEVEL.upper())
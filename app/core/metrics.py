@@ -0,0 +1,333 @@
+# app/core/metrics.py
+
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Optional
+import logging
+import threading
+import time
+
+import bson
+from pymongo import monitoring
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(names: tuple, values: tuple) -> str:
+    if not names:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in zip(names, values)) + "}"
+
+
+class Histogram:
+    """
+    Prometheus-style histogram with fixed buckets, one series per label tuple.
+    Observations arrive from the event loop and from Motor's executor threads, hence the lock.
+    """
+
+    def __init__(self, name: str, help: str, labels: tuple = (), buckets: tuple = DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.label_names = labels
+        self.buckets = buckets
+        self._series: dict = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *labels):
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][bisect_left(self.buckets, value)] += 1
+            series[1] += value
+
+    def totals(self) -> tuple[int, float]:
+        """Observation count and sum across all series"""
+        with self._lock:
+            return sum(sum(counts) for counts, _ in self._series.values()), sum(total for _, total in self._series.values())
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            snapshot = [(labels, list(counts), total) for labels, (counts, total) in self._series.items()]
+        for labels, counts, total in sorted(snapshot):
+            cumulative = 0
+            for bound, count in zip((*self.buckets, "+Inf"), counts):
+                cumulative += count
+                lines.append(f"{self.name}_bucket{_labels((*self.label_names, 'le'), (*labels, bound))} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.label_names, labels)} {total}")
+            lines.append(f"{self.name}_count{_labels(self.label_names, labels)} {cumulative}")
+        return lines
+
+
+class Counter:
+    def __init__(self, name: str, help: str, labels: tuple = ()):
+        self.name = name
+        self.help = help
+        self.label_names = labels
+        self._values: dict = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, *labels):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def total(self) -> float:
+        with self._lock:
+            return sum(self._values.values())
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            values = sorted(self._values.items())
+        lines.extend(f"{self.name}{_labels(self.label_names, labels)} {value}" for labels, value in values)
+        return lines
+
+
+class Gauge:
+    def __init__(self, name: str, help: str):
+        self.name = name
+        self.help = help
+        self.value = 0
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1):
+        with self._lock:
+            self.value += amount
+
+    def dec(self, amount: float = 1):
+        with self._lock:
+            self.value -= amount
+
+    def render(self) -> list[str]:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} gauge", f"{self.name} {self.value}"]
+
+
+REQUEST_LATENCY = Histogram("http_request_duration_seconds", "HTTP request latency by route", ("method", "route", "status"))
+REQUESTS_IN_FLIGHT = Gauge("http_requests_in_flight", "HTTP requests currently being served")
+REQUEST_PHASE = Histogram("http_request_phase_seconds", "Time spent per request in auth, validation and database phases", ("route", "phase"))
+MONGO_COMMAND_LATENCY = Histogram("mongo_command_duration_seconds", "MongoDB command round-trip time", ("command",))
+MONGO_COMMAND_FAILURES = Counter("mongo_command_failures_total", "MongoDB commands that failed", ("command",))
+MONGO_BYTES = Counter("mongo_command_bytes_total", "BSON bytes sent to and received from MongoDB", ("command", "direction"))
+POOL_CHECKOUT_WAIT = Histogram("mongo_pool_checkout_wait_seconds", "Time spent waiting to check a connection out of the pool")
+POOL_CHECKOUT_FAILURES = Counter("mongo_pool_checkout_failures_total", "Connection checkouts that failed", ("reason",))
+POOL_CONNECTIONS_OPEN = Gauge("mongo_pool_connections_open", "Connections currently open across all pools")
+POOL_CONNECTIONS_IN_USE = Gauge("mongo_pool_connections_in_use", "Connections currently checked out")
+POOL_CHECKOUTS_WAITING = Gauge("mongo_pool_checkouts_waiting", "Operations currently waiting for a connection")
+ENTITY_VALIDATIONS = Counter("entity_validations_total", "Entity payloads validated, by entity type and outcome", ("entity_type", "result"))
+ENTITY_VALIDATION_SECONDS = Histogram(
+    "entity_validation_duration_seconds", "Time to validate one request's payloads, by entity type", ("entity_type",),
+    buckets=(0.00001, 0.00005, 0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0),
+)
+
+REGISTRY = [
+    REQUEST_LATENCY, REQUESTS_IN_FLIGHT, REQUEST_PHASE, MONGO_COMMAND_LATENCY, MONGO_COMMAND_FAILURES, MONGO_BYTES,
+    POOL_CHECKOUT_WAIT, POOL_CHECKOUT_FAILURES, POOL_CONNECTIONS_OPEN, POOL_CONNECTIONS_IN_USE, POOL_CHECKOUTS_WAITING,
+    ENTITY_VALIDATIONS, ENTITY_VALIDATION_SECONDS,
+]
+
+
+def render_metrics() -> str:
+    return "\n".join(line for metric in REGISTRY for line in metric.render()) + "\n"
+
+
+class RequestStats:
+    """Time and database work attributed to one request, shared with Motor's executor threads"""
+
+    def __init__(self):
+        self.auth_seconds = 0.0
+        self.validation_seconds = 0.0
+        self.db_seconds = 0.0
+        self.db_commands = 0
+        self.db_bytes_sent = 0
+        self.db_bytes_received = 0
+        self.by_command: dict = {}
+        self._lock = threading.Lock()
+
+    def add_command(self, command: str, seconds: float, sent: int, received: int):
+        with self._lock:
+            self.db_commands += 1
+            self.db_seconds += seconds
+            self.db_bytes_sent += sent
+            self.db_bytes_received += received
+            count, total = self.by_command.get(command, (0, 0.0))
+            self.by_command[command] = (count + 1, total + seconds)
+
+    def breakdown(self) -> str:
+        return ", ".join(f"{name} x{count} {total * 1000:.1f}ms" for name, (count, total) in sorted(self.by_command.items()))
+
+
+current_request: ContextVar[Optional[RequestStats]] = ContextVar("current_request", default=None)
+
+
+def record_auth(seconds: float):
+    stats = current_request.get()
+    if stats is not None:
+        stats.auth_seconds += seconds
+
+
+def record_validation(seconds: float):
+    stats = current_request.get()
+    if stats is not None:
+        stats.validation_seconds += seconds
+
+
+@contextmanager
+def validation_phase():
+    """
+    Attribute the enclosed model validation or serialization to the request's validation phase.
+    Only work the app does itself is timed this way; FastAPI's parsing of request parameters and
+    bodies happens before the endpoint runs and is left out of the phase.
+    """
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_validation(time.perf_counter() - started)
+
+
+class CommandMetricsListener(monitoring.CommandListener):
+    """
+    Times every MongoDB command and attributes it to the request in progress.
+    Motor runs PyMongo in executor threads under a copy of the caller's context, so the
+    ContextVar set by the middleware is visible here.
+    """
+
+    def __init__(self):
+        self._sent: dict = {}
+
+    def started(self, event):
+        if settings.METRICS_COMMAND_BYTES:
+            self._sent[event.request_id] = len(bson.encode(event.command))
+
+    def succeeded(self, event):
+        self._finish(event, len(bson.encode(event.reply)) if settings.METRICS_COMMAND_BYTES else 0)
+
+    def failed(self, event):
+        MONGO_COMMAND_FAILURES.inc(1, event.command_name)
+        self._finish(event, 0)
+
+    def _finish(self, event, received: int):
+        seconds = event.duration_micros / 1e6
+        sent = self._sent.pop(event.request_id, 0)
+        MONGO_COMMAND_LATENCY.observe(seconds, event.command_name)
+        if sent or received:
+            MONGO_BYTES.inc(sent, event.command_name, "sent")
+            MONGO_BYTES.inc(received, event.command_name, "received")
+        stats = current_request.get()
+        if stats is not None:
+            stats.add_command(event.command_name, seconds, sent, received)
+
+
+class PoolMetricsListener(monitoring.ConnectionPoolListener):
+    """Connection pool occupancy and checkout wait time, the signals for sizing maxPoolSize"""
+
+    def __init__(self):
+        self.checkouts = 0
+        self.max_in_use = 0
+        self.max_waiting = 0
+
+    def connection_created(self, event):
+        POOL_CONNECTIONS_OPEN.inc()
+
+    def connection_closed(self, event):
+        POOL_CONNECTIONS_OPEN.dec()
+
+    def connection_check_out_started(self, event):
+        POOL_CHECKOUTS_WAITING.inc()
+        self.max_waiting = max(self.max_waiting, POOL_CHECKOUTS_WAITING.value)
+
+    def connection_checked_out(self, event):
+        POOL_CHECKOUTS_WAITING.dec()
+        POOL_CONNECTIONS_IN_USE.inc()
+        POOL_CHECKOUT_WAIT.observe(event.duration)
+        self.checkouts += 1
+        self.max_in_use = max(self.max_in_use, POOL_CONNECTIONS_IN_USE.value)
+
+    def connection_check_out_failed(self, event):
+        POOL_CHECKOUTS_WAITING.dec()
+        POOL_CHECKOUT_FAILURES.inc(1, event.reason)
+
+    def connection_checked_in(self, event):
+        POOL_CONNECTIONS_IN_USE.dec()
+
+    def connection_ready(self, event):
+        pass
+
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        pass
+
+    def pool_closed(self, event):
+        pass
+
+    def stats(self) -> dict:
+        waits, wait_seconds = POOL_CHECKOUT_WAIT.totals()
+        return {
+            "connections_open": POOL_CONNECTIONS_OPEN.value,
+            "connections_in_use": POOL_CONNECTIONS_IN_USE.value,
+            "checkouts_waiting": POOL_CHECKOUTS_WAITING.value,
+            "max_in_use": self.max_in_use,
+            "max_waiting": self.max_waiting,
+            "checkouts": self.checkouts,
+            "checkout_failures": POOL_CHECKOUT_FAILURES.total(),
+            "checkout_wait_ms_mean": wait_seconds / waits * 1000 if waits else 0.0,
+        }
+
+
+class MetricsMiddleware:
+    """ASGI middleware recording per-route latency, in-flight requests and the slow-request log"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        stats = RequestStats()
+        token = current_request.set(stats)
+        status = 500
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        REQUESTS_IN_FLIGHT.inc()
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            elapsed = time.perf_counter() - started
+            REQUESTS_IN_FLIGHT.dec()
+            current_request.reset(token)
+            # The templated path keeps the label set bounded; unmatched paths share one series
+            route = getattr(scope.get("route"), "path", "unmatched")
+            REQUEST_LATENCY.observe(elapsed, scope["method"], route, status)
+            REQUEST_PHASE.observe(stats.auth_seconds, route, "auth")
+            REQUEST_PHASE.observe(stats.validation_seconds, route, "validation")
+            REQUEST_PHASE.observe(stats.db_seconds, route, "db")
+            if settings.SLOW_REQUEST_MS and elapsed * 1000 >= settings.SLOW_REQUEST_MS:
+                logger.warning(
+                    "Slow request %s %s -> %s in %.1fms (auth %.1fms, validation %.1fms, db %.1fms over %d commands, %d bytes in/%d out): %s",
+                    scope["method"], scope["path"], status, elapsed * 1000, stats.auth_seconds * 1000,
+                    stats.validation_seconds * 1000, stats.db_seconds * 1000, stats.db_commands, stats.db_bytes_received, stats.db_bytes_sent,
+                    stats.breakdown() or "no commands",
+                )
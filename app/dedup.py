@@ -0,0 +1,252 @@
+"""
+Full-collection duplicate detection for data stewardship.
+
+    python -m app.dedup [--run-id ID] [--workers N] [--threshold 0.7]
+
+The job runs in three restartable stages, checkpointed in dedup_runs:
+
+1. keys     stream entities in _id-ordered partitions and write each entity's blocking keys
+            (with its compact match record) to the dedup_keys scratch collection
+2. compare  group dedup_keys into blocks in key order and score every pair inside a block on a
+            process pool; pairs above the threshold are upserted into entity_match_pairs
+3. cluster  union-find over the run's pairs, written as clusters to entity_match_clusters
+
+Re-running with the same --run-id resumes after the last checkpoint.
+"""
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+import os
+import time
+
+from bson import ObjectId
+from pymongo import ASCENDING, InsertOne, UpdateOne
+
+from app.core.config import settings
+from app.core.database import create_sync_client
+from app.services.matching import MATCH_PROJECTION, MatchRecord, blocking_keys, score, to_record, trigrams
+from app.utils.utils import live
+
+
+def _pack(record: MatchRecord) -> list:
+    return [record.entity_id, record.first, record.last, record.dob, record.email, record.phone, sorted(record.identifiers)]
+
+
+def _unpack(packed: list) -> MatchRecord:
+    entity_id, first, last, dob, email, phone, identifiers = packed
+    return MatchRecord(entity_id, first, last, trigrams(f"{first} {last}"), dob, email, phone, frozenset(identifiers))
+
+
+def compare_blocks(blocks: list, threshold: float) -> tuple[int, list]:
+    """Process-pool worker: score all pairs inside each block, return (pairs compared, matches)"""
+    compared = 0
+    matches = []
+    for members in blocks:
+        records = [_unpack(member) for member in members]
+        for i in range(len(records)):
+            for j in range(i + 1, len(records)):
+                compared += 1
+                value, rule, matched = score(records[i], records[j])
+                if value >= threshold:
+                    a, b = sorted((records[i].entity_id, records[j].entity_id))
+                    matches.append((a, b, value, rule, matched))
+    return compared, matches
+
+
+class DedupJob:
+    def __init__(self, db, run_id: str, args):
+        self.db = db
+        self.run_id = run_id
+        self.args = args
+        self.runs = db["dedup_runs"]
+        self.keys = db["dedup_keys"]
+        self.pairs = db["entity_match_pairs"]
+        self.clusters = db["entity_match_clusters"]
+
+    def checkpoint(self, **fields):
+        self.runs.update_one({"_id": self.run_id}, {"$set": {**fields, "updated_at": datetime.utcnow()}}, upsert=True)
+
+    def state(self) -> dict:
+        return self.runs.find_one({"_id": self.run_id}) or {"stage": "keys"}
+
+    def build_keys(self, state: dict):
+        self.keys.create_index([("run", ASCENDING), ("k", ASCENDING)])
+        last_id = state.get("last_entity_id")
+        # Keys written after the last checkpoint belong to a partition that did not finish
+        self.keys.delete_many({"run": self.run_id, "e": {"$gt": last_id}} if last_id else {"run": self.run_id})
+
+        entities = self.db["entities"]
+        started = time.perf_counter()
+        total = state.get("entities", 0)
+        while True:
+            query = live({"_id": {"$gt": last_id}} if last_id else {})
+            partition = list(entities.find(query, MATCH_PROJECTION).sort("_id", 1).limit(self.args.partition_size))
+            if not partition:
+                break
+            operations = []
+            for doc in partition:
+                record = to_record(str(doc["_id"]), doc)
+                packed = _pack(record)
+                operations.extend(InsertOne({"run": self.run_id, "k": key, "e": doc["_id"], "r": packed}) for key in blocking_keys(record))
+            if operations:
+                self.keys.bulk_write(operations, ordered=False)
+            last_id = partition[-1]["_id"]
+            total += len(partition)
+            self.checkpoint(stage="keys", last_entity_id=last_id, entities=total)
+            print(f"[keys] {total:,} entities ({total / (time.perf_counter() - started):,.0f}/s)")
+        self.checkpoint(stage="compare", entities=total)
+
+    def _blocks(self, after_key):
+        match = {"run": self.run_id}
+        if after_key is not None:
+            match["k"] = {"$gt": after_key}
+        pipeline = [
+            {"$match": match},
+            {"$sort": {"k": 1}},
+            # Keep one more than the limit so oversized blocks can be recognised and skipped
+            {"$group": {"_id": "$k", "members": {"$firstN": {"n": self.args.max_block_size + 1, "input": "$r"}}}},
+            {"$sort": {"_id": 1}},
+        ]
+        for block in self.keys.aggregate(pipeline, allowDiskUse=True):
+            yield block["_id"], block["members"]
+
+    def _chunks(self, after_key):
+        """Group blocks into chunks of roughly chunk_pairs comparisons, remembering the last key of each"""
+        chunk, pairs, skipped = [], 0, 0
+        for key, members in self._blocks(after_key):
+            if len(members) < 2:
+                continue
+            if len(members) > self.args.max_block_size:
+                skipped += 1
+                continue
+            chunk.append(members)
+            pairs += len(members) * (len(members) - 1) // 2
+            if pairs >= self.args.chunk_pairs:
+                yield chunk, key, skipped
+                chunk, pairs, skipped = [], 0, 0
+        yield chunk, None, skipped
+
+    def compare(self, state: dict):
+        self.totals = {
+            "pairs_compared": state.get("pairs_compared", 0),
+            "pairs_matched": state.get("pairs_matched", 0),
+            "blocks_skipped": state.get("blocks_skipped", 0),
+        }
+        self.compared_here = 0
+        self.started = time.perf_counter()
+
+        with ProcessPoolExecutor(max_workers=self.args.workers) as pool:
+            pending = []
+            # A bounded window of chunks is in flight; results are consumed in key order so the
+            # checkpointed key never runs ahead of an unfinished chunk
+            for chunk, last_key, skipped in self._chunks(state.get("last_key")):
+                pending.append((pool.submit(compare_blocks, chunk, self.args.threshold), last_key, skipped))
+                if len(pending) >= self.args.workers * 2:
+                    self._collect(*pending.pop(0))
+            for item in pending:
+                self._collect(*item)
+        self.checkpoint(stage="cluster")
+
+    def _collect(self, future, last_key, skipped):
+        compared, matches = future.result()
+        if matches:
+            self.pairs.bulk_write([
+                UpdateOne(
+                    {"_id": f"{self.run_id}:{a}:{b}"},
+                    {"$set": {"run_id": self.run_id, "a": a, "b": b, "score": value, "rule": rule, "matched_on": matched}},
+                    upsert=True,
+                )
+                for a, b, value, rule, matched in matches
+            ], ordered=False)
+        self.compared_here += compared
+        self.totals["pairs_compared"] += compared
+        self.totals["pairs_matched"] += len(matches)
+        self.totals["blocks_skipped"] += skipped
+        fields = {"stage": "compare", **self.totals}
+        if last_key is not None:
+            fields["last_key"] = last_key
+        self.checkpoint(**fields)
+        rate = self.compared_here / (time.perf_counter() - self.started)
+        print(f"[compare] {self.totals['pairs_compared']:,} pairs compared, "
+              f"{self.totals['pairs_matched']:,} matched ({rate:,.0f} pairs/s)")
+
+    def cluster(self):
+        parent = {}
+
+        def find(x):
+            parent.setdefault(x, x)
+            while parent[x] != x:
+                parent[x] = parent[parent[x]]
+                x = parent[x]
+            return x
+
+        edges = list(self.pairs.find({"run_id": self.run_id}, {"a": 1, "b": 1, "score": 1, "rule": 1}))
+        for edge in edges:
+            root_a, root_b = find(edge["a"]), find(edge["b"])
+            if root_a != root_b:
+                parent[root_b] = root_a
+
+        clusters = {}
+        for edge in edges:
+            cluster = clusters.setdefault(find(edge["a"]), {"members": set(), "pairs": []})
+            cluster["members"].update((edge["a"], edge["b"]))
+            cluster["pairs"].append({"a": edge["a"], "b": edge["b"], "score": edge["score"], "rule": edge["rule"]})
+
+        self.clusters.delete_many({"run_id": self.run_id})
+        now = datetime.utcnow()
+        documents = [
+            {
+                "run_id": self.run_id,
+                "members": sorted(cluster["members"]),
+                "size": len(cluster["members"]),
+                "max_score": max(pair["score"] for pair in cluster["pairs"]),
+                "min_score": min(pair["score"] for pair in cluster["pairs"]),
+                "pairs": cluster["pairs"],
+                "created_at": now,
+            }
+            for cluster in clusters.values()
+        ]
+        for start in range(0, len(documents), 1000):
+            self.clusters.insert_many(documents[start:start + 1000])
+        self.clusters.create_index([("run_id", ASCENDING), ("size", ASCENDING)])
+        self.keys.delete_many({"run": self.run_id})
+        self.checkpoint(stage="done", clusters=len(documents), finished_at=now)
+        print(f"[cluster] {len(documents):,} clusters from {len(edges):,} pairs")
+
+    def run(self):
+        state = self.state()
+        self.checkpoint(stage=state["stage"], threshold=self.args.threshold)
+        if state["stage"] == "keys":
+            self.build_keys(state)
+            state = self.state()
+        if state["stage"] == "compare":
+            self.compare(state)
+            state = self.state()
+        if state["stage"] == "cluster":
+            self.cluster()
+
+
+def main(args):
+    client = create_sync_client()
+    try:
+        db = client[settings.MONGO_DB]
+        run_id = args.run_id or str(ObjectId())
+        print(f"[dedup] run {run_id} with {args.workers} workers")
+        started = time.perf_counter()
+        DedupJob(db, run_id, args).run()
+        state = db["dedup_runs"].find_one({"_id": run_id})
+        elapsed = time.perf_counter() - started
+        print(f"[dedup] {state.get('pairs_compared', 0):,} pairs, {state.get('clusters', 0):,} clusters in {elapsed:,.1f}s")
+    finally:
+        client.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--run-id", help="resume this run instead of starting a new one")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--threshold", type=float, default=settings.MATCHING_THRESHOLD)
+    parser.add_argument("--partition-size", type=int, default=10000, help="entities read per checkpointed partition")
+    parser.add_argument("--chunk-pairs", type=int, default=200000, help="comparisons sent to a worker at a time")
+    parser.add_argument("--max-block-size", type=int, default=settings.MATCHING_MAX_BLOCK_SIZE)
+    main(parser.parse_args())
@@ -0,0 +1,153 @@
+"""
+Full snapshot export of the entities collection for warehouse reloads.
+
+    python -m app.export --out /data/exports/2024-06-01 [--partitions 16] [--workers 8] [--fields a,b.c]
+
+The _id space is split into contiguous ranges from a random sample of ids, and each range is read
+by its own cursor on a thread pool and written to part-NNNNN.ndjson.gz. Every worker streams its
+cursor straight into the gzip file, so memory stays constant regardless of collection size.
+manifest.json records each part's _id range, row count, byte size and sha256 together with the
+total throughput; it is written last, so its presence marks a complete export.
+"""
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+import gzip
+import hashlib
+import json
+import os
+import time
+from typing import Optional
+
+from app.core.config import settings
+from app.core.database import create_sync_client, heavy_read_preference
+from app.schemas.fieldsets import build_projection, parse_fields
+from app.services.entity import FIELDSET_PATHS, STREAM_BATCH_SIZE
+from app.utils.utils import live, to_ndjson_line
+
+SAMPLES_PER_PARTITION = 20
+
+
+class _HashingWriter:
+    """File wrapper that hashes the compressed bytes as they are written"""
+
+    def __init__(self, raw):
+        self.raw = raw
+        self.sha256 = hashlib.sha256()
+        self.size = 0
+
+    def write(self, data) -> int:
+        self.sha256.update(data)
+        self.size += len(data)
+        return self.raw.write(data)
+
+    def flush(self):
+        self.raw.flush()
+
+
+def split_points(collection, partitions: int) -> list:
+    """Pick partitions - 1 _id boundaries from a random sample, without scanning the collection"""
+    if partitions < 2:
+        return []
+    size = partitions * SAMPLES_PER_PARTITION
+    sample = sorted(doc["_id"] for doc in collection.aggregate([{"$sample": {"size": size}}, {"$project": {"_id": 1}}]))
+    if len(sample) < partitions:
+        return []
+    step = len(sample) / partitions
+    return sorted({sample[int(step * i)] for i in range(1, partitions)})
+
+
+def _ranges(points: list) -> list:
+    bounds = [None, *points, None]
+    return list(zip(bounds, bounds[1:]))
+
+
+def export_partition(collection, index: int, lower, upper, projection: Optional[dict], directory: str) -> dict:
+    query = live({})
+    if lower is not None:
+        query.setdefault("_id", {})["$gte"] = lower
+    if upper is not None:
+        query.setdefault("_id", {})["$lt"] = upper
+    name = f"part-{index:05d}.ndjson.gz"
+    path = os.path.join(directory, name)
+    started = time.perf_counter()
+    rows = 0
+    with open(path + ".tmp", "wb") as raw:
+        writer = _HashingWriter(raw)
+        with gzip.GzipFile(fileobj=writer, mode="wb", compresslevel=6) as out:
+            for doc in collection.find(query, projection).sort("_id", 1).batch_size(STREAM_BATCH_SIZE):
+                out.write(to_ndjson_line(doc))
+                rows += 1
+        raw.flush()
+        os.fsync(raw.fileno())
+    os.replace(path + ".tmp", path)
+    return {
+        "file": name,
+        "min_id": str(lower) if lower is not None else None,
+        "max_id_exclusive": str(upper) if upper is not None else None,
+        "rows": rows,
+        "bytes": writer.size,
+        "sha256": writer.sha256.hexdigest(),
+        "seconds": round(time.perf_counter() - started, 3),
+    }
+
+
+def run_export(db, directory: str, partitions: int, workers: int, fields: Optional[tuple[str, ...]] = None) -> dict:
+    os.makedirs(directory, exist_ok=True)
+    collection = db["entities"].with_options(read_preference=heavy_read_preference())
+    projection = build_projection(fields) if fields else None
+    started_at = datetime.utcnow()
+    started = time.perf_counter()
+    ranges = _ranges(split_points(collection, partitions))
+    print(f"[export] {len(ranges)} partitions on {workers} workers -> {directory}")
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = [
+            pool.submit(export_partition, collection, index, lower, upper, projection, directory)
+            for index, (lower, upper) in enumerate(ranges)
+        ]
+        parts = []
+        for future in futures:
+            part = future.result()
+            parts.append(part)
+            print(f"[export] {part['file']}: {part['rows']:,} rows, {part['bytes']:,} bytes")
+
+    elapsed = time.perf_counter() - started
+    rows = sum(part["rows"] for part in parts)
+    manifest = {
+        "collection": "entities",
+        "format": "ndjson.gz",
+        "fields": list(fields) if fields else None,
+        "started_at": started_at.isoformat(),
+        "finished_at": datetime.utcnow().isoformat(),
+        "rows": rows,
+        "bytes": sum(part["bytes"] for part in parts),
+        "seconds": round(elapsed, 3),
+        "docs_per_second": round(rows / elapsed, 1) if elapsed else None,
+        "partitions": parts,
+    }
+    with open(os.path.join(directory, "manifest.json"), "w") as f:
+        json.dump(manifest, f, indent=2)
+    return manifest
+
+
+def main(args):
+    try:
+        fields = parse_fields(args.fields, FIELDSET_PATHS)
+    except ValueError as e:
+        raise SystemExit(str(e))
+    client = create_sync_client()
+    try:
+        manifest = run_export(client[settings.MONGO_DB], args.out, args.partitions, args.workers, fields)
+        print(f"[export] {manifest['rows']:,} rows in {manifest['seconds']:,.1f}s ({manifest['docs_per_second']:,.0f} docs/s)")
+    finally:
+        client.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--out", required=True, help="directory that receives the part files and manifest")
+    parser.add_argument("--partitions", type=int, default=(os.cpu_count() or 1) * 2)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--fields", help="comma-separated field paths to export (default: whole documents)")
+    main(parser.parse_args())
@@ -1,26 +1,63 @@
+import asyncio
 from fastapi import FastAPI, Depends
+from fastapi.responses import PlainTextResponse
 from contextlib import asynccontextmanager 
-from app.api.v1.endpoints import entity, token
+from app.api.v1.endpoints import admin, analytics, changes, entity, entity_types, token
 from app.core.database import connect_to_mongo, close_mongo_connection, mongodb
+from app.core.indexes import ensure_indexes
+from app.core.log_utils import setup_logging
+from app.core.metrics import MetricsMiddleware, render_metrics
+from app.core.config import settings
+from app.services.matching import matching_index
+from app.services.search import search_index
+from app.services.purge import tombstone_purger
+from app.utils.history_writer import history_writer
 from fastapi.security import HTTPBearer
 from fastapi.openapi.utils import get_openapi
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
+    setup_logging()
     connect_to_mongo()
     assert mongodb.db is not None, "MongoDB connection failed"
+    await ensure_indexes(mongodb.db)
+    background_tasks = []
+    if settings.MATCHING_ENABLED:
+        background_tasks.append(asyncio.create_task(matching_index.run()))
+    if settings.SEARCH_ENABLED:
+        background_tasks.append(asyncio.create_task(search_index.run()))
+    if settings.PURGE_ENABLED:
+        background_tasks.append(asyncio.create_task(tombstone_purger.run()))
+    if settings.HISTORY_WRITE_MODE == "write_behind":
+        background_tasks.append(asyncio.create_task(history_writer.run()))
     yield
+    # Drain buffered history before the client goes away
+    await history_writer.close()
+    for task in background_tasks:
+        task.cancel()
+    await asyncio.gather(*background_tasks, return_exceptions=True)
     close_mongo_connection()
 
 app = FastAPI(lifespan=lifespan)
 
+if settings.METRICS_ENABLED:
+    app.add_middleware(MetricsMiddleware)
+
 app.include_router(token.router, prefix="/api/v1", tags=["Auth"])
 app.include_router(entity.router, prefix="/api/v1/entities", tags=["Entities"])
+app.include_router(changes.router, prefix="/api/v1/changes", tags=["Changes"])
+app.include_router(analytics.router, prefix="/api/v1/analytics", tags=["Analytics"])
+app.include_router(entity_types.router, prefix="/api/v1/types", tags=["Entity types"])
+app.include_router(admin.router, prefix="/api/v1/admin", tags=["Admin"])
 
 @app.get("/", tags=["Health"])
 def ping():
     return {"status": "ok"}
 
+@app.get("/metrics", include_in_schema=False)
+def metrics():
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
+
 bearer_scheme = HTTPBearer()
 
 def custom_openapi():
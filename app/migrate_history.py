@@ -0,0 +1,94 @@
+"""
+Rewrite legacy full-copy entity_history records into the snapshot + delta layout.
+
+    python -m app.migrate_history [--dry-run] [--batch-size 1000]
+
+Records are walked in (entity_id, version) order. Every HISTORY_SNAPSHOT_INTERVAL-th version,
+and the first record of each entity, stays a full snapshot; the rest are replaced by a
+field-level delta against the previous version. Already converted records are left as they
+are, so the migration can be interrupted and re-run. The report compares BSON bytes before
+and after.
+"""
+import argparse
+import asyncio
+
+import bson
+from pymongo import ReplaceOne
+
+from app.core.database import connect_to_mongo, close_mongo_connection
+from app.utils.history import DELTA, SNAPSHOT, apply_delta, diff_documents, is_snapshot, is_snapshot_version
+from app.utils.utils import get_entity_history_collection
+
+
+def convert_record(record: dict, previous_state):
+    """Return (converted record or None if unchanged, full state at this record's version)"""
+    if "kind" in record:
+        if record["kind"] == DELTA:
+            return None, apply_delta(previous_state, record["delta"]) if previous_state is not None else None
+        return None, record["data"]
+
+    state = record["data"]
+    if previous_state is None or is_snapshot_version(record.get("version", 1)):
+        return {**record, "kind": SNAPSHOT}, state
+    converted = {key: value for key, value in record.items() if key != "data"}
+    converted["kind"] = DELTA
+    converted["delta"] = diff_documents(previous_state, state)
+    return converted, state
+
+
+async def migrate(batch_size: int, dry_run: bool) -> dict:
+    collection = get_entity_history_collection()
+    report = {"records": 0, "converted": 0, "deltas": 0, "bytes_before": 0, "bytes_after": 0}
+    operations = []
+    entity_id = None
+    state = None
+
+    cursor = collection.find({}).sort([("entity_id", 1), ("version", 1)]).batch_size(batch_size)
+    async for record in cursor:
+        if record["entity_id"] != entity_id:
+            entity_id = record["entity_id"]
+            state = None
+        converted, state = convert_record(record, state)
+
+        size_before = len(bson.encode(record))
+        report["records"] += 1
+        report["bytes_before"] += size_before
+        if converted is None:
+            report["bytes_after"] += size_before
+            continue
+        report["converted"] += 1
+        report["deltas"] += not is_snapshot(converted)
+        report["bytes_after"] += len(bson.encode(converted))
+        if not dry_run:
+            operations.append(ReplaceOne({"_id": record["_id"]}, converted))
+            if len(operations) >= batch_size:
+                await collection.bulk_write(operations, ordered=False)
+                operations = []
+
+    if operations:
+        await collection.bulk_write(operations, ordered=False)
+
+    saved = report["bytes_before"] - report["bytes_after"]
+    report["bytes_saved"] = saved
+    report["saved_ratio"] = round(saved / report["bytes_before"], 4) if report["bytes_before"] else 0.0
+    return report
+
+
+async def main(args):
+    connect_to_mongo()
+    try:
+        report = await migrate(args.batch_size, args.dry_run)
+    finally:
+        close_mongo_connection()
+    mode = "dry run" if args.dry_run else "migrated"
+    print(f"[{mode}] {report['records']} history records, {report['converted']} converted "
+          f"({report['deltas']} to deltas)")
+    print(f"[{mode}] {report['bytes_before']:,} -> {report['bytes_after']:,} BSON bytes, "
+          f"saved {report['bytes_saved']:,} ({report['saved_ratio']:.1%})")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--dry-run", action="store_true", help="only report the storage that would be saved")
+    parser.add_argument("--batch-size", type=int, default=1000)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,48 @@
+"""
+Backfill the soft-delete flag on entities written before tombstones existed.
+
+    python -m app.migrate_soft_delete [--batch-size 1000]
+
+Read paths only return entities with deleted=false (the condition the partial indexes are built
+on), so existing documents must carry the flag before this release serves traffic. Entities are
+walked in _id order and updated a batch at a time; re-running only touches documents still missing
+the flag. The old non-partial <field>_1 indexes on entities are replaced by their partial
+<field>_1_live counterparts when the API starts (see ensure_indexes).
+"""
+import argparse
+import asyncio
+
+from app.core.database import connect_to_mongo, close_mongo_connection
+from app.utils.utils import get_entity_collection
+
+
+async def backfill(batch_size: int) -> int:
+    collection = get_entity_collection()
+    updated = 0
+    last_id = None
+    while True:
+        query = {"deleted": {"$exists": False}}
+        if last_id is not None:
+            query["_id"] = {"$gt": last_id}
+        ids = [doc["_id"] async for doc in collection.find(query, {"_id": 1}).sort("_id", 1).limit(batch_size)]
+        if not ids:
+            return updated
+        result = await collection.update_many({"_id": {"$in": ids}, "deleted": {"$exists": False}}, {"$set": {"deleted": False}})
+        updated += result.modified_count
+        last_id = ids[-1]
+        print(f"[backfill] {updated:,} entities flagged")
+
+
+async def main(args):
+    connect_to_mongo()
+    try:
+        updated = await backfill(args.batch_size)
+    finally:
+        close_mongo_connection()
+    print(f"[backfill] done, {updated:,} entities updated")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--batch-size", type=int, default=1000)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,132 @@
+"""
+Recompute the entity_aggregates rollups from scratch and report drift from the stored values.
+
+    python -m app.rebuild_aggregates [--verify-only] [--tolerance 1e-6]
+
+One $group pipeline per dimension runs over live entities. Each recomputed rollup is compared with
+the stored one (entity count, and sum and count per metric); the pipelines and the read of the stored
+rollups share a snapshot session, so both sides describe the same point in time. With --verify-only
+the exit status is 1 when drift is found, for use from a scheduled check.
+
+Without --verify-only the drift is corrected with an $inc of (recomputed - stored) per counter rather
+than by replacing the rollups: live writes keep $inc-ing the rollups while the rebuild runs, and a
+replace would throw away every increment applied after the snapshot. Rollups that end up with no
+entities are removed. The one remaining window is a write whose entity change is in the snapshot but
+whose rollup $inc lands after it; that change is counted twice, so re-run with --verify-only to confirm.
+"""
+import argparse
+import asyncio
+from datetime import datetime
+import sys
+
+from pymongo import UpdateOne
+
+from app.core.database import connect_to_mongo, close_mongo_connection, snapshot_session
+from app.services.aggregates import DIMENSIONS, METRICS, get_aggregate_collection, rollup_id
+from app.utils.utils import get_entity_collection, live
+
+
+def _pipeline(path: str) -> list:
+    group = {"_id": f"${path}", "entities": {"$sum": 1}}
+    for metric, metric_path in METRICS.items():
+        is_number = {"$isNumber": f"${metric_path}"}
+        group[f"sum_{metric}"] = {"$sum": {"$cond": [is_number, f"${metric_path}", 0]}}
+        group[f"count_{metric}"] = {"$sum": {"$cond": [is_number, 1, 0]}}
+    return [{"$match": live({path: {"$type": "string", "$ne": ""}})}, {"$group": group}]
+
+
+async def compute_rollups(session=None) -> dict:
+    entities = get_entity_collection()
+    rollups = {}
+    for dimension, path in DIMENSIONS.items():
+        async for row in entities.aggregate(_pipeline(path), allowDiskUse=True, session=session):
+            rollups[rollup_id(dimension, row["_id"])] = {
+                "dimension": dimension,
+                "value": row["_id"],
+                "entities": row["entities"],
+                "sums": {metric: row[f"sum_{metric}"] for metric in METRICS},
+                "counts": {metric: row[f"count_{metric}"] for metric in METRICS},
+            }
+    return rollups
+
+
+def _counters(doc: dict) -> dict:
+    counters = {"entities": doc.get("entities", 0)}
+    for metric in METRICS:
+        counters[f"sums.{metric}"] = doc.get("sums", {}).get(metric, 0)
+        counters[f"counts.{metric}"] = doc.get("counts", {}).get(metric, 0)
+    return counters
+
+
+def find_drift(expected: dict, stored: dict, tolerance: float) -> list[tuple]:
+    """(rollup id, counter, stored value, expected value) for every counter that disagrees"""
+    drift = []
+    for key in sorted(expected.keys() | stored.keys()):
+        want = _counters(expected.get(key, {}))
+        have = _counters(stored.get(key, {}))
+        for counter, value in want.items():
+            if abs(have[counter] - value) > tolerance * max(1.0, abs(value)):
+                drift.append((key, counter, have[counter], value))
+    return drift
+
+
+def corrections(expected: dict, stored: dict) -> dict:
+    """{rollup id: {counter: recomputed - stored}} for every counter that differs"""
+    delta = {}
+    for key in expected.keys() | stored.keys():
+        want = _counters(expected.get(key, {}))
+        have = _counters(stored.get(key, {}))
+        counters = {counter: value - have[counter] for counter, value in want.items() if value != have[counter]}
+        if counters:
+            delta[key] = counters
+    return delta
+
+
+async def rebuild(verify_only: bool, tolerance: float) -> list[tuple]:
+    collection = get_aggregate_collection()
+    async with snapshot_session() as session:
+        expected = await compute_rollups(session)
+        stored = {doc["_id"]: doc async for doc in collection.find({}, session=session)}
+    drift = find_drift(expected, stored, tolerance)
+    if verify_only:
+        return drift
+
+    now = datetime.utcnow()
+    operations = []
+    for key, counters in corrections(expected, stored).items():
+        doc = expected.get(key) or stored[key]
+        operations.append(UpdateOne(
+            {"_id": key},
+            {"$inc": counters, "$set": {"updated_at": now}, "$setOnInsert": {"dimension": doc["dimension"], "value": doc["value"]}},
+            upsert=True,
+        ))
+    for start in range(0, len(operations), 1000):
+        await collection.bulk_write(operations[start:start + 1000], ordered=False)
+    # Only rollups still empty after the corrections: a live write may have repopulated one meanwhile
+    stale = list(stored.keys() - expected.keys())
+    if stale:
+        await collection.delete_many({"_id": {"$in": stale}, "entities": {"$lte": 0}})
+    return drift
+
+
+async def main(args):
+    connect_to_mongo()
+    try:
+        drift = await rebuild(args.verify_only, args.tolerance)
+    finally:
+        close_mongo_connection()
+    for key, counter, stored, expected in drift[:args.show]:
+        print(f"[drift] {key} {counter}: stored {stored} != recomputed {expected}")
+    rollups = len({key for key, *_ in drift})
+    print(f"[aggregates] {len(drift)} drifted counters in {rollups} rollups"
+          + ("" if args.verify_only else "; drift corrected"))
+    if args.verify_only and drift:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--verify-only", action="store_true", help="report drift without rewriting the rollups")
+    parser.add_argument("--tolerance", type=float, default=1e-6, help="relative difference ignored for float sums")
+    parser.add_argument("--show", type=int, default=20, help="drifted counters to print")
+    asyncio.run(main(parser.parse_args()))
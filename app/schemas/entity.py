@@ -1,9 +1,10 @@
-from pydantic import BaseModel, Field, validator, EmailStr
-from typing import Optional, Any, List
+from pydantic import BaseModel, Field, validator, model_validator, EmailStr
+from typing import Optional, Any, Dict, List
 from typing_extensions import Literal
 from bson import ObjectId
 from pydantic_core import core_schema
 from datetime import datetime
+import re
 
 # Custom ObjectId support
 class PyObjectId(ObjectId):
@@ -185,4 +186,271 @@ class CustomerHistoryOut(BaseModel):
     class Config:
         populate_by_name = True
         arbitrary_types_allowed = True
-        json_encoders = {ObjectId: str} 
\ No newline at end of file
+        json_encoders = {ObjectId: str}
+
+
+class EntityAsOf(BaseModel):
+    id: str
+    version: int
+    valid_from: datetime
+    data: dict
+
+
+class AsOfRequest(BaseModel):
+    ids: List[str] = Field(..., min_length=1, max_length=10000)
+    timestamp: datetime
+
+
+class AsOfResult(BaseModel):
+    timestamp: datetime
+    entities: List[EntityAsOf]
+    missing: List[str]
+
+
+#Bulk ingest models
+
+class BulkRowResult(BaseModel):
+    index: int
+    status: Literal["created", "updated", "error"]
+    id: Optional[str] = None
+    error: Optional[str] = None
+
+
+class BulkIngestResult(BaseModel):
+    total: int
+    created: int
+    updated: int
+    failed: int
+    elapsed_seconds: float
+    rows_per_second: float
+    results: List[BulkRowResult]
+
+
+#Admin models
+
+class IndexUsage(BaseModel):
+    name: str
+    key: Optional[dict] = None
+    ops: int = 0
+    since: Optional[datetime] = None
+    declared: bool = False
+    missing: bool = False
+
+
+class CacheStats(BaseModel):
+    size: int
+    maxsize: int
+    hits: int
+    misses: int
+    evictions: int
+    expirations: int
+    hit_ratio: float
+    stale: int = 0
+    shared_backend: Optional[str] = None
+
+
+class PoolStats(BaseModel):
+    max_pool_size: int
+    min_pool_size: int
+    connections_open: int
+    connections_in_use: int
+    checkouts_waiting: int
+    max_in_use: int
+    max_waiting: int
+    checkouts: int
+    checkout_failures: int
+    checkout_wait_ms_mean: float
+
+
+class HistoryWriterStats(BaseModel):
+    mode: str
+    queued: int
+    max_queue: int
+    flushes: int
+    written: int
+    failed: int
+    resync_pending: int
+    blocked_submits: int
+    mean_batch_size: float
+
+
+#Matching models
+
+class MatchCandidate(BaseModel):
+    id: str
+    score: float
+    rule: Literal["deterministic", "fuzzy"]
+    matched_on: List[str]
+
+
+class EntityCreateResult(BaseModel):
+    id: str
+    matches: List[MatchCandidate]
+    index_ready: bool
+
+
+class MatchingIndexStats(BaseModel):
+    ready: bool
+    entities: int
+    blocking_keys: int
+    largest_block: int
+
+
+class MatchResult(BaseModel):
+    matches: List[MatchCandidate]
+    index_ready: bool
+
+
+#Search models
+
+class SearchHit(BaseModel):
+    id: str
+    score: float
+    matched_field: str
+    firstName: Optional[str] = None
+    lastName: Optional[str] = None
+    email: Optional[str] = None
+    loyaltyId: Optional[str] = None
+
+
+class SearchResult(BaseModel):
+    query: str
+    hits: List[SearchHit]
+    index_ready: bool
+
+
+class SearchIndexStats(BaseModel):
+    ready: bool
+    entities: int
+    terms: Dict[str, int]
+
+
+#Change feed models
+
+class ChangeRecord(BaseModel):
+    id: str
+    entity_id: str
+    version: int
+    operation: str
+    timestamp: datetime
+    kind: Literal["snapshot", "delta"]
+    data: Optional[dict] = None
+    delta: Optional[dict] = None
+
+
+class ChangeBatch(BaseModel):
+    changes: List[ChangeRecord]
+    watermark: Optional[str] = None
+    has_more: bool
+
+
+class WatermarkAck(BaseModel):
+    watermark: str
+
+
+#Analytics models
+
+class MetricRollup(BaseModel):
+    sum: float
+    count: int
+    mean: Optional[float] = None
+
+
+class AggregateRollup(BaseModel):
+    dimension: str
+    value: str
+    entities: int
+    metrics: Dict[str, MetricRollup]
+    updated_at: Optional[datetime] = None
+
+
+#Entity type models
+
+# Constraints each field type accepts; anything else would only blow up when an entity is validated
+FIELD_SPEC_CONSTRAINTS = {
+    "string": {"enum", "min_length", "max_length", "pattern"},
+    "email": {"min_length", "max_length"},
+    "integer": {"enum", "ge", "le"},
+    "number": {"enum", "ge", "le"},
+    "boolean": set(),
+    "datetime": set(),
+    "object": {"fields"},
+    "array": {"items", "min_length", "max_length"},
+}
+ENUM_VALUE_TYPES = {"string": str, "integer": int, "number": (int, float)}
+FIELD_NAME_PATTERN = re.compile(r"^[A-Za-z][A-Za-z0-9_]{0,63}$")
+# Top-level keys the registry writes on every typed entity
+RESERVED_FIELD_NAMES = {"id", "version", "schema_version", "deleted", "deleted_at", "created_at"}
+
+
+def check_field_name(name: str):
+    if not FIELD_NAME_PATTERN.match(name):
+        raise ValueError(f"Invalid field name '{name}'")
+
+
+class FieldSpec(BaseModel):
+    type: Literal["string", "email", "integer", "number", "boolean", "datetime", "object", "array"]
+    required: bool = False
+    description: Optional[str] = None
+    enum: Optional[List[Any]] = None
+    min_length: Optional[int] = Field(None, ge=0)
+    max_length: Optional[int] = Field(None, ge=0)
+    pattern: Optional[str] = None
+    ge: Optional[float] = None
+    le: Optional[float] = None
+    fields: Optional[Dict[str, "FieldSpec"]] = Field(None, description="Nested fields of an object")
+    items: Optional["FieldSpec"] = Field(None, description="Element spec of an array")
+
+    @model_validator(mode="after")
+    def constraints_fit_type(self):
+        """Reject specs that would only fail once an entity is validated against them"""
+        allowed = FIELD_SPEC_CONSTRAINTS[self.type]
+        misplaced = [key for key in ("enum", "min_length", "max_length", "pattern", "ge", "le", "fields", "items")
+                     if getattr(self, key) is not None and key not in allowed]
+        if misplaced:
+            raise ValueError(f"{', '.join(misplaced)} not allowed on {self.type} fields")
+        if self.type == "object" and not self.fields:
+            raise ValueError("object fields need a non-empty 'fields' mapping")
+        if self.type == "array" and self.items is None:
+            raise ValueError("array fields need an 'items' spec")
+        if self.enum is not None:
+            if not self.enum:
+                raise ValueError("enum needs at least one value")
+            if any(getattr(self, key) is not None for key in ("min_length", "max_length", "pattern", "ge", "le")):
+                raise ValueError("enum cannot be combined with length, pattern or bound constraints")
+            kinds = ENUM_VALUE_TYPES[self.type]
+            if any(isinstance(value, bool) or not isinstance(value, kinds) for value in self.enum):
+                raise ValueError(f"enum values must all be {self.type} values")
+        if self.min_length is not None and self.max_length is not None and self.min_length > self.max_length:
+            raise ValueError("min_length is greater than max_length")
+        if self.ge is not None and self.le is not None and self.ge > self.le:
+            raise ValueError("ge is greater than le")
+        if self.pattern is not None:
+            try:
+                re.compile(self.pattern)
+            except re.error as e:
+                raise ValueError(f"Invalid pattern: {e}")
+        for name in self.fields or {}:
+            check_field_name(name)
+        return self
+
+
+class EntityTypeCreate(BaseModel):
+    description: Optional[str] = None
+    fields: Dict[str, FieldSpec] = Field(..., min_length=1)
+
+    @validator("fields")
+    def field_names_are_free(cls, value):
+        for name in value:
+            check_field_name(name)
+            if name in RESERVED_FIELD_NAMES:
+                raise ValueError(f"Field name '{name}' is reserved")
+        return value
+
+
+class EntityTypeOut(BaseModel):
+    name: str
+    version: int
+    description: Optional[str] = None
+    fields: Dict[str, FieldSpec]
+    created_at: datetime
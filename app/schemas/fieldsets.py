@@ -0,0 +1,116 @@
+from functools import lru_cache
+from typing import Any, List, Optional, Union, get_args, get_origin
+from pydantic import BaseModel, ConfigDict, Field, TypeAdapter, create_model
+from app.schemas.entity import CustomerOut
+
+_ALL = object()
+
+
+def parse_fields(fields: Optional[str], allowed: set[str]) -> Optional[tuple[str, ...]]:
+    """
+    Parse a comma separated fields= parameter into a canonical, hashable tuple.
+    Paths covered by a requested parent (contactInfo.email under contactInfo) are dropped.
+    Raises ValueError for paths that are not in allowed.
+    """
+    if fields is None:
+        return None
+    paths = sorted({path.strip() for path in fields.split(",") if path.strip()})
+    if not paths:
+        return None
+    invalid = [path for path in paths if path not in allowed]
+    if invalid:
+        raise ValueError(f"Invalid fields: {', '.join(invalid)}")
+    kept = []
+    for path in paths:
+        if not any(path.startswith(parent + ".") for parent in kept):
+            kept.append(path)
+    return tuple(kept)
+
+
+def allowed_paths(field_paths: set[str]) -> set[str]:
+    """Every leaf path plus each of its parent paths, e.g. contactInfo.address.city -> contactInfo, contactInfo.address"""
+    paths = set()
+    for path in field_paths:
+        parts = path.split(".")
+        paths.update(".".join(parts[:i]) for i in range(1, len(parts) + 1))
+    return paths
+
+
+def build_projection(fields: tuple[str, ...]) -> dict:
+    return {path: 1 for path in fields}
+
+
+def _tree(fields: tuple[str, ...]) -> dict:
+    tree = {}
+    for path in fields:
+        node = tree
+        parts = path.split(".")
+        for part in parts[:-1]:
+            node = node.setdefault(part, {})
+        node[parts[-1]] = _ALL
+    return tree
+
+
+def _unwrap(annotation):
+    """Strip Optional[...] and List[...] returning (inner type, wrap function)"""
+    if get_origin(annotation) is Union:
+        args = [arg for arg in get_args(annotation) if arg is not type(None)]
+        inner, wrap = _unwrap(args[0])
+        return inner, lambda t: Optional[wrap(t)]
+    if get_origin(annotation) in (list, List):
+        inner, wrap = _unwrap(get_args(annotation)[0])
+        return inner, lambda t: List[wrap(t)]
+    return annotation, lambda t: t
+
+
+def _partial_model(model: type[BaseModel], tree: dict, name: str) -> type[BaseModel]:
+    definitions = {}
+    for field_name, subtree in tree.items():
+        field = model.model_fields[field_name]
+        annotation = field.annotation
+        if subtree is not _ALL:
+            inner, wrap = _unwrap(annotation)
+            annotation = wrap(_partial_model(inner, subtree, f"{name}_{field_name}"))
+        definitions[field_name] = (Optional[annotation], Field(None, alias=field.alias))
+    return create_model(name, __config__=ConfigDict(populate_by_name=True), **definitions)
+
+
+@lru_cache(maxsize=None)
+def leaf_type(path: str):
+    """Scalar type stored at a dotted CustomerOut path, looking through Optional, List and nested models"""
+    model = CustomerOut
+    annotation = None
+    for part in path.split("."):
+        annotation, _ = _unwrap(model.model_fields[part].annotation)
+        model = annotation
+    return annotation
+
+
+@lru_cache(maxsize=256)
+def projected_model(fields: tuple[str, ...]) -> type[BaseModel]:
+    """A CustomerOut-shaped model holding only the requested fields (plus _id)"""
+    model = _partial_model(CustomerOut, _tree(fields), "CustomerProjection")
+    return create_model(
+        "CustomerProjection",
+        __base__=model,
+        id=(str, Field(..., alias="_id")),
+    )
+
+
+@lru_cache(maxsize=256)
+def projected_list_adapter(fields: tuple[str, ...]) -> TypeAdapter:
+    return TypeAdapter(List[projected_model(fields)])
+
+
+def project_document(doc: Any, tree_or_fields) -> Any:
+    """Apply a projection to an in-memory document the way MongoDB would"""
+    tree = _tree(tree_or_fields) if isinstance(tree_or_fields, tuple) else tree_or_fields
+    if isinstance(doc, list):
+        return [project_document(item, tree) for item in doc if isinstance(item, dict)]
+    if not isinstance(doc, dict):
+        return doc
+    projected = {}
+    for key, subtree in tree.items():
+        if key in doc:
+            projected[key] = doc[key] if subtree is _ALL else project_document(doc[key], subtree)
+    return projected
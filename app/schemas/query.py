@@ -0,0 +1,46 @@
+from pydantic import BaseModel, ConfigDict, Field
+from typing import Any, List, Optional, Union
+from typing_extensions import Literal
+
+
+class Condition(BaseModel):
+    field: str = Field(..., description="Dotted entity field path, e.g. behavioralData.lifetimeValue")
+    op: Literal["eq", "ne", "gt", "gte", "lt", "lte", "in", "nin"] = "eq"
+    value: Any
+
+
+class BooleanFilter(BaseModel):
+    and_: Optional[List[Union[Condition, "BooleanFilter"]]] = Field(None, alias="and", min_length=1)
+    or_: Optional[List[Union[Condition, "BooleanFilter"]]] = Field(None, alias="or", min_length=1)
+
+    model_config = ConfigDict(populate_by_name=True)
+
+
+class SortKey(BaseModel):
+    field: str
+    direction: Literal["asc", "desc"] = "asc"
+
+
+class EntityQuery(BaseModel):
+    where: Union[Condition, BooleanFilter]
+    sort: List[SortKey] = []
+    limit: int = Field(100, ge=1, le=1000)
+    fields: Optional[str] = Field(None, description="Comma separated field paths to return")
+    allow_scan: bool = Field(False, description="Run the query even if no index can serve it")
+    explain: bool = Field(False, description="Include a summary of the winning query plan")
+
+
+class QueryExplain(BaseModel):
+    stages: List[str]
+    indexes: List[str]
+    collection_scan: bool
+    keys_examined: Optional[int] = None
+    docs_examined: Optional[int] = None
+    returned: Optional[int] = None
+    execution_ms: Optional[int] = None
+
+
+class EntityQueryResult(BaseModel):
+    count: int
+    items: List[dict]
+    explain: Optional[QueryExplain] = None
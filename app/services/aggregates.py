@@ -0,0 +1,122 @@
+import logging
+from collections import defaultdict
+from datetime import datetime
+from typing import Iterable, Optional
+
+from pymongo import UpdateOne
+from pymongo.errors import PyMongoError
+
+from app.core.config import settings
+from app.core.database import mongodb
+from app.utils.utils import get_by_path
+
+logger = logging.getLogger(__name__)
+
+# Rollup dimension -> entity field it groups by
+DIMENSIONS = {
+    "city": "contactInfo.address.city",
+    "country": "contactInfo.address.country",
+    "preferredLocation": "behavioralData.preferredLocation",
+}
+# Metric -> entity field summed per rollup; means are sum / count over entities that have the field
+METRICS = {
+    "lifetimeValue": "behavioralData.lifetimeValue",
+    "visitsCount": "behavioralData.visitsCount",
+    "averageSpend": "behavioralData.averageSpend",
+}
+
+
+def get_aggregate_collection():
+    if mongodb.db is None:
+        raise RuntimeError("Database not initialized. Did you forget to call connect_to_mongo?")
+    return mongodb.db["entity_aggregates"]
+
+
+def rollup_id(dimension: str, value) -> str:
+    return f"{dimension}:{value}"
+
+
+def contribution(entity: Optional[dict]) -> dict:
+    """What one live entity adds to each rollup it falls in, as {(dimension, value): {counter: amount}}"""
+    if not entity or entity.get("deleted"):
+        return {}
+    amounts = {"entities": 1}
+    for metric, path in METRICS.items():
+        value = get_by_path(entity, path)
+        if isinstance(value, (int, float)) and not isinstance(value, bool):
+            amounts[f"sums.{metric}"] = value
+            amounts[f"counts.{metric}"] = 1
+    contributions = {}
+    for dimension, path in DIMENSIONS.items():
+        value = get_by_path(entity, path)
+        if isinstance(value, str) and value:
+            contributions[(dimension, value)] = amounts
+    return contributions
+
+
+def aggregate_delta(changes: Iterable[tuple]) -> dict:
+    """Net counter changes over (before, after) entity pairs; None stands for a missing or deleted entity"""
+    delta = defaultdict(lambda: defaultdict(int))
+    for before, after in changes:
+        for key, amounts in contribution(after).items():
+            for counter, amount in amounts.items():
+                delta[key][counter] += amount
+        for key, amounts in contribution(before).items():
+            for counter, amount in amounts.items():
+                delta[key][counter] -= amount
+    return {key: {counter: amount for counter, amount in counters.items() if amount} for key, counters in delta.items()}
+
+
+async def apply_changes(changes: Iterable[tuple]):
+    """
+    Fold entity writes into the rollups with one unordered batch of $inc upserts.
+    Rollups are derived data: a failure is logged rather than failing the write it follows, and
+    python -m app.rebuild_aggregates repairs any drift.
+    """
+    if not settings.AGGREGATES_ENABLED:
+        return
+    now = datetime.utcnow()
+    operations = [
+        UpdateOne(
+            {"_id": rollup_id(dimension, value)},
+            {"$inc": counters, "$set": {"updated_at": now}, "$setOnInsert": {"dimension": dimension, "value": value}},
+            upsert=True,
+        )
+        for (dimension, value), counters in aggregate_delta(changes).items()
+        if counters
+    ]
+    if not operations:
+        return
+    try:
+        await get_aggregate_collection().bulk_write(operations, ordered=False)
+    except PyMongoError as e:
+        logger.warning("Could not update entity aggregates: %s", e)
+
+
+def rollup_out(doc: dict) -> dict:
+    sums, counts = doc.get("sums", {}), doc.get("counts", {})
+    return {
+        "dimension": doc["dimension"],
+        "value": doc["value"],
+        "entities": int(doc.get("entities", 0)),
+        "metrics": {
+            metric: {
+                "sum": sums.get(metric, 0),
+                "count": int(counts.get(metric, 0)),
+                "mean": sums.get(metric, 0) / counts[metric] if counts.get(metric) else None,
+            }
+            for metric in METRICS
+        },
+        "updated_at": doc.get("updated_at"),
+    }
+
+
+async def get_rollups(dimension: str, limit: int) -> list[dict]:
+    """The dimension's largest rollups by entity count, straight off the (dimension, entities) index"""
+    cursor = get_aggregate_collection().find({"dimension": dimension, "entities": {"$gt": 0}}).sort("entities", -1).limit(limit)
+    return [rollup_out(doc) async for doc in cursor]
+
+
+async def get_rollup(dimension: str, value: str) -> Optional[dict]:
+    doc = await get_aggregate_collection().find_one({"_id": rollup_id(dimension, value)})
+    return rollup_out(doc) if doc and doc.get("entities", 0) > 0 else None
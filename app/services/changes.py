@@ -0,0 +1,86 @@
+from datetime import datetime
+from typing import Optional
+from bson import ObjectId
+from fastapi import HTTPException
+from pymongo import ReturnDocument
+from app.core.config import settings
+from app.core.database import causal_session, mongodb
+from app.services.history import materialize_versions
+from app.utils.history import is_snapshot
+from app.utils.utils import decode_cursor, encode_cursor, get_entity_history_collection, heavy_reads, settled_history_id
+
+DEFAULT_BATCH_SIZE = 500
+MAX_BATCH_SIZE = 5000
+
+
+def get_watermark_collection():
+    if mongodb.db is None:
+        raise RuntimeError("Database not initialized. Did you forget to call connect_to_mongo?")
+    return mongodb.db["export_watermarks"]
+
+
+def _decode_watermark(watermark: str) -> ObjectId:
+    try:
+        return decode_cursor(watermark)
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"Invalid watermark '{watermark}'")
+
+
+async def get_consumer_watermark(consumer: str) -> Optional[str]:
+    doc = await get_watermark_collection().find_one({"_id": consumer})
+    return encode_cursor(doc["last_id"]) if doc else None
+
+
+async def ack_consumer_watermark(consumer: str, watermark: str) -> str:
+    """Persist a consumer's position; it only ever moves forward"""
+    last_id = _decode_watermark(watermark)
+    doc = await get_watermark_collection().find_one_and_update(
+        {"_id": consumer},
+        {"$max": {"last_id": last_id}, "$set": {"updated_at": datetime.utcnow()}},
+        upsert=True,
+        return_document=ReturnDocument.AFTER,
+    )
+    return encode_cursor(doc["last_id"])
+
+
+async def get_changes(after: Optional[str] = None, limit: int = DEFAULT_BATCH_SIZE, full: bool = False) -> dict:
+    """
+    Next batch of entity changes after a watermark, in history order.
+    Each change carries either the stored snapshot or delta; with full=True deltas are resolved
+    into the complete entity state at that version.
+    """
+    id_range = {"$lt": settled_history_id()}
+    if after:
+        id_range["$gt"] = _decode_watermark(after)
+    # Replays in full mode must see at least what the page read saw, even on another secondary
+    async with causal_session() as session:
+        cursor = heavy_reads(get_entity_history_collection()).find({"_id": id_range}, session=session)
+        records = await cursor.sort("_id", 1).limit(limit + 1).to_list(limit + 1)
+        has_more = len(records) > limit
+        records = records[:limit]
+
+        states = {}
+        if full:
+            wanted = [(record["entity_id"], record["version"]) for record in records if not is_snapshot(record)]
+            states = await materialize_versions(wanted, session=session)
+
+    changes = []
+    for record in records:
+        change = {
+            "id": encode_cursor(record["_id"]),
+            "entity_id": str(record["entity_id"]),
+            "version": record["version"],
+            "operation": record["operation"],
+            "timestamp": record["timestamp"],
+            "kind": "snapshot" if is_snapshot(record) else "delta",
+        }
+        if is_snapshot(record):
+            change["data"] = record["data"]
+        elif full:
+            change["data"] = states.get((record["entity_id"], record["version"]))
+        else:
+            change["delta"] = record["delta"]
+        changes.append(change)
+
+    watermark = changes[-1]["id"] if changes else after
+    return {"changes": changes, "watermark": watermark, "has_more": has_more}
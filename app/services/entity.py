@@ -1,9 +1,27 @@
 from app.core.database import mongodb
+from app.core.cache import entity_cache
+from app.core.config import settings
+from app.core.metrics import validation_phase
+from app.services import aggregates
+from app.services.matching import matching_index
+from app.services.search import search_index
 from bson import ObjectId
 from datetime import datetime
-from app.schemas.entity import CustomerUpdate, CustomerHistoryOut
+from typing import AsyncIterable, Optional
+from pydantic import ValidationError
+from bson.errors import InvalidId
+from pymongo import InsertOne, ReturnDocument, UpdateOne
+from pymongo.errors import BulkWriteError
+import logging
+import time
+from app.schemas.entity import CustomerCreate, CustomerUpdate, CustomerHistoryOut
+from app.schemas.fieldsets import allowed_paths, build_projection, parse_fields, project_document
 from fastapi import HTTPException
-from app.utils.utils import serialize_doc, get_entity_collection, get_entity_history_collection, save_history
+from app.services.history import materialize_versions
+from app.utils.serialization import CUSTOMER_OUT_FIELDS, trusted_customer
+from app.utils.utils import serialize_doc, get_entity_collection, get_entity_history_collection, heavy_reads, live, save_history, build_history_doc, encode_cursor, decode_cursor, to_ndjson_line, get_by_path, format_validation_error
+
+logger = logging.getLogger(__name__)
 
 async def create_entity(data: dict):
     collection = get_entity_collection()
@@ -12,91 +30,19 @@ async def create_entity(data: dict):
     data["customerId"] = str(object_id)
 
     data["created_at"] = datetime.utcnow()
+    data["version"] = 1
+    data["deleted"] = False
 
-    result = collection.insert_one(data)
+    result = await collection.insert_one(data)
     await save_history(data, "create")
+    await aggregates.apply_changes([(None, data)])
+    if settings.MATCHING_ENABLED:
+        matching_index.add(str(object_id), data)
+    if settings.SEARCH_ENABLED:
+        search_index.add(str(object_id), data)
     return str(result.inserted_id)
 
-def list_entities():
-    collection = get_entity_collection()
-    entities = []
-    for entity in collection.find():
-        entity["id"] = str(entity["_id"])
-        del entity["_id"]
-        entities.append(entity)
-    return entities
-
-def get_entity_by_id(entity_id: str):
-    collection = get_entity_collection()
-    try:
-        object_id = ObjectId(entity_id)
-        entity = collection.find_one({"_id": object_id})
-        if entity:
-            entity["id"] = str(entity["_id"])
-            del entity["_id"]
-        return entity
-    except Exception:
-        return None
-
-async def update_entity(entity_id: str, update_data: CustomerUpdate):
-    collection = get_entity_collection()
-    existing = collection.find_one({"_id": ObjectId(entity_id)})
-    if not existing:
-        raise HTTPException(status_code=404, detail="Entity not found")
-
-    new_version = existing.get("version", 1) + 1
-    update_doc = update_data.model_dump(exclude_unset=True)
-    update_doc["version"] = new_version
-    updated_entity = {**existing, **update_doc}
-    await save_history(updated_entity, operation="update")
-
-    collection.update_one(
-        {"_id": ObjectId(entity_id)},
-        {"$set": update_doc}
-    )
-
-    updated = collection.find_one({"_id": ObjectId(entity_id)})
-    return updated
-
-async def delete_entity(entity_id: str):
-    collection = get_entity_collection()
-    collection_history = get_entity_history_collection()
-    try:
-        object_id = ObjectId(entity_id)
-        entity = collection.find_one({"_id": object_id})
-        entity_history = collection_history.find_one({"entity_id": object_id})
-        if not entity and not entity_history:
-            return False
-        try:
-            collection.delete_one({"_id": object_id})
-            collection_history.delete_one({"entity_id": object_id})
-            deletion_successful = True
-        except Exception:
-            deletion_successful = False
-        if deletion_successful:
-            return True
-        return False
-        
-
-    except Exception:
-        return False
-
-def get_entity_history_by_id(entity_id: str) -> list[CustomerHistoryOut]:
-    history_collection = get_entity_history_collection()
-    object_id = ObjectId(entity_id)
-
-    cursor = history_collection.find({"entity_id": object_id}).sort("version", 1)
-
-    history = []
-    for doc in cursor:
-        doc = serialize_doc(doc)
-
-        history.append(CustomerHistoryOut(**doc))
-
-    return history
-
-def get_entity_by_attribute(entity_attribute: str, entity_value: str):
-    ALLOWED_FIELDS = {
+ALLOWED_FIELDS = {
     "customerId",
     "personalInfo.firstName",
     "personalInfo.lastName",
@@ -133,8 +79,443 @@ def get_entity_by_attribute(entity_attribute: str, entity_value: str):
     "identifiers.socialIds.twitter",
     "identifiers.externalSystemIds.system",
     "identifiers.externalSystemIds.id",
+}
+
+# Paths accepted by fields= on the read endpoints: every searchable field, its parents, and version
+FIELDSET_PATHS = allowed_paths(ALLOWED_FIELDS) | {"version"}
+
+def parse_entity_fields(fields: Optional[str]) -> Optional[tuple[str, ...]]:
+    try:
+        return parse_fields(fields, FIELDSET_PATHS)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+def _projection(fields: Optional[tuple[str, ...]]) -> Optional[dict]:
+    return build_projection(fields) if fields else None
+
+def _read_projection(fields: Optional[tuple[str, ...]]) -> Optional[dict]:
+    # Reads that answer with an ETag always need the version, whatever fields were asked for
+    return {**build_projection(fields), "version": 1} if fields else None
+
+DEFAULT_BULK_CHUNK_SIZE = 1000
+MAX_BULK_CHUNK_SIZE = 10000
+
+def _row_error(index: int, message: str) -> dict:
+    return {"index": index, "status": "error", "error": message}
+
+async def _bulk_insert(valid: list, results: dict) -> list:
+    collection = get_entity_collection()
+    now = datetime.utcnow()
+    for _, data in valid:
+        object_id = ObjectId()
+        data["_id"] = object_id
+        data["customerId"] = str(object_id)
+        data["created_at"] = now
+        data["version"] = 1
+        data["deleted"] = False
+
+    failed = {}
+    try:
+        await collection.insert_many([data for _, data in valid], ordered=False)
+    except BulkWriteError as e:
+        failed = {err["index"]: err["errmsg"] for err in e.details.get("writeErrors", [])}
+
+    history = []
+    for position, (index, data) in enumerate(valid):
+        if position in failed:
+            results[index] = _row_error(index, failed[position])
+        else:
+            results[index] = {"index": index, "status": "created", "id": data["customerId"]}
+            if settings.MATCHING_ENABLED:
+                matching_index.add(data["customerId"], data)
+            if settings.SEARCH_ENABLED:
+                search_index.add(data["customerId"], data)
+            history.append(build_history_doc(data, "create"))
+    await aggregates.apply_changes((None, data) for position, (_, data) in enumerate(valid) if position not in failed)
+    return history
+
+async def _bulk_upsert(valid: list, upsert_key: str, results: dict) -> list:
+    collection = get_entity_collection()
+    keyed = {}
+    for index, data in valid:
+        value = get_by_path(data, upsert_key)
+        if value is None or isinstance(value, (dict, list)):
+            results[index] = _row_error(index, f"Missing or non-scalar upsert key '{upsert_key}'")
+        elif value in keyed:
+            results[index] = _row_error(index, f"Duplicate {upsert_key}={value} in batch")
+        else:
+            keyed[value] = (index, data)
+
+    existing = {}
+    ambiguous = set()
+    async for doc in collection.find(live({upsert_key: {"$in": list(keyed)}})):
+        value = get_by_path(doc, upsert_key)
+        if value in existing:
+            ambiguous.add(value)
+        existing[value] = doc
+
+    now = datetime.utcnow()
+    operations = []
+    pending = []
+    for value, (index, data) in keyed.items():
+        if value in ambiguous:
+            results[index] = _row_error(index, f"Multiple entities match {upsert_key}={value}")
+            continue
+        current = existing.get(value)
+        if current is None:
+            object_id = ObjectId()
+            data["_id"] = object_id
+            data["customerId"] = str(object_id)
+            data["created_at"] = now
+            data["version"] = 1
+            data["deleted"] = False
+            operations.append(InsertOne(data))
+            pending.append((index, data, "created", None))
+        else:
+            version = current.get("version", 1)
+            update_doc = {**data, "version": version + 1}
+            # Conditional on the version read above, like update_entity. upsert=True turns a lost race
+            # into a per-row duplicate key error on _id instead of a silent no-op that bulk_write cannot
+            # attribute to a row
+            query = live({"_id": current["_id"], "version": _version_filter(version)})
+            operations.append(UpdateOne(query, {"$set": update_doc}, upsert=True))
+            pending.append((index, {**current, **update_doc}, "updated", current))
+
+    failed = {}
+    if operations:
+        try:
+            await collection.bulk_write(operations, ordered=False)
+        except BulkWriteError as e:
+            for err in e.details.get("writeErrors", []):
+                position = err["index"]
+                if err.get("code") == 11000 and pending[position][2] == "updated":
+                    value = get_by_path(pending[position][1], upsert_key)
+                    failed[position] = f"Version conflict: {upsert_key}={value} was modified concurrently, retry the row"
+                else:
+                    failed[position] = err["errmsg"]
+
+    history = []
+    for position, (index, entity, status, previous) in enumerate(pending):
+        if position in failed:
+            results[index] = _row_error(index, failed[position])
+        else:
+            results[index] = {"index": index, "status": status, "id": str(entity["_id"])}
+            if status == "updated":
+                await entity_cache.invalidate(str(entity["_id"]), entity["version"])
+            if settings.MATCHING_ENABLED:
+                matching_index.add(str(entity["_id"]), entity)
+            if settings.SEARCH_ENABLED:
+                search_index.add(str(entity["_id"]), entity)
+            history.append(build_history_doc(entity, "create" if status == "created" else "update", previous))
+    await aggregates.apply_changes((previous, entity) for position, (_, entity, _, previous) in enumerate(pending) if position not in failed)
+    return history
+
+async def _ingest_chunk(chunk: list, upsert_key: Optional[str]) -> list:
+    results = {}
+    valid = []
+    with validation_phase():
+        for index, raw in chunk:
+            if isinstance(raw, Exception):
+                results[index] = _row_error(index, str(raw))
+                continue
+            try:
+                valid.append((index, CustomerCreate.model_validate(raw).dict()))
+            except ValidationError as e:
+                results[index] = _row_error(index, format_validation_error(e))
+
+    history = []
+    if valid:
+        if upsert_key is None:
+            history = await _bulk_insert(valid, results)
+        else:
+            history = await _bulk_upsert(valid, upsert_key, results)
+    if history:
+        await get_entity_history_collection().insert_many(history, ordered=False)
+    return [results[index] for index, _ in chunk]
+
+async def bulk_create_entities(rows: AsyncIterable, upsert_key: Optional[str] = None, chunk_size: int = DEFAULT_BULK_CHUNK_SIZE) -> dict:
+    """
+    Validate and write rows chunk by chunk with unordered batch writes to entities and entity_history.
+    rows yields raw payloads; an Exception in place of a payload marks a row that could not be parsed.
+    With upsert_key, rows matching an existing entity on that field update it instead of inserting.
+    """
+    if upsert_key is not None and upsert_key not in ALLOWED_FIELDS:
+        raise HTTPException(status_code=400, detail=f"Invalid upsert field '{upsert_key}'.")
+
+    started = time.perf_counter()
+    results = []
+    chunk = []
+    index = 0
+    async for raw in rows:
+        chunk.append((index, raw))
+        index += 1
+        if len(chunk) >= chunk_size:
+            results.extend(await _ingest_chunk(chunk, upsert_key))
+            chunk = []
+    if chunk:
+        results.extend(await _ingest_chunk(chunk, upsert_key))
+
+    elapsed = time.perf_counter() - started
+    counts = {"created": 0, "updated": 0, "error": 0}
+    for result in results:
+        counts[result["status"]] += 1
+    return {
+        "total": len(results),
+        "created": counts["created"],
+        "updated": counts["updated"],
+        "failed": counts["error"],
+        "elapsed_seconds": round(elapsed, 6),
+        "rows_per_second": round(len(results) / elapsed, 2) if elapsed > 0 else 0.0,
+        "results": results,
     }
 
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+STREAM_BATCH_SIZE = 500
+
+def _after_filter(after: Optional[str]) -> dict:
+    if after is None:
+        return {}
+    try:
+        return {"_id": {"$gt": decode_cursor(after)}}
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+async def list_entities(limit: int = DEFAULT_PAGE_SIZE, after: Optional[str] = None, fields: Optional[tuple[str, ...]] = None):
+    """Return one keyset page ordered by _id and the cursor for the next page (None on the last page)"""
+    collection = heavy_reads(get_entity_collection())
+    cursor = collection.find(live(_after_filter(after)), _read_projection(fields)).sort("_id", 1).limit(limit + 1)
+    entities = []
+    async for entity in cursor:
+        entities.append(entity)
+
+    next_cursor = None
+    if len(entities) > limit:
+        entities = entities[:limit]
+        next_cursor = encode_cursor(entities[-1]["_id"])
+
+    for entity in entities:
+        entity["id"] = str(entity["_id"])
+        del entity["_id"]
+    return entities, next_cursor
+
+async def stream_entities(after: Optional[str] = None, limit: Optional[int] = None, fields: Optional[tuple[str, ...]] = None):
+    """
+    Yield entities as NDJSON lines straight from the cursor, holding at most one batch in memory.
+    Rows are shaped like the paged list: CustomerOut fields, or only the requested ones, plus _id.
+    """
+    collection = heavy_reads(get_entity_collection())
+    cursor = collection.find(live(_after_filter(after)), _projection(fields or CUSTOMER_OUT_FIELDS)).sort("_id", 1).batch_size(STREAM_BATCH_SIZE)
+    if limit is not None:
+        cursor = cursor.limit(limit)
+    async for entity in cursor:
+        yield to_ndjson_line(entity if fields else trusted_customer(entity))
+
+async def get_entity_by_id(entity_id: str, fields: Optional[tuple[str, ...]] = None):
+    cached = await entity_cache.get(entity_id)
+    if cached is not None:
+        if fields:
+            return {**project_document(cached, fields), "id": cached["id"], "version": cached.get("version", 1)}
+        return cached
+
+    collection = get_entity_collection()
+    try:
+        object_id = ObjectId(entity_id)
+        entity = await collection.find_one(live({"_id": object_id}), _read_projection(fields))
+        if entity:
+            entity["id"] = str(entity["_id"])
+            del entity["_id"]
+            # Only full documents are cached; a projected read must not poison later full reads
+            if not fields:
+                await entity_cache.set(entity_id, entity)
+        return entity
+    except Exception:
+        return None
+
+async def get_entity_version(entity_id: str) -> Optional[int]:
+    """Current version of a live entity, read with a version-only projection; None if it does not exist"""
+    cached = await entity_cache.get(entity_id)
+    if cached is not None:
+        return cached.get("version", 1)
+    try:
+        object_id = ObjectId(entity_id)
+    except (InvalidId, TypeError):
+        return None
+    entity = await get_entity_collection().find_one(live({"_id": object_id}), {"version": 1})
+    return entity.get("version", 1) if entity else None
+
+async def list_entity_versions(limit: int = DEFAULT_PAGE_SIZE, after: Optional[str] = None) -> list[tuple[str, int]]:
+    """(id, version) of the entities list_entities would return for the same page, plus the one after it"""
+    collection = heavy_reads(get_entity_collection())
+    cursor = collection.find(live(_after_filter(after)), {"version": 1}).sort("_id", 1).limit(limit + 1)
+    return [(str(entity["_id"]), entity.get("version", 1)) async for entity in cursor]
+
+async def get_attribute_versions(entity_attribute: str, entity_value: str) -> list[tuple[str, int]]:
+    if entity_attribute not in ALLOWED_FIELDS:
+        raise HTTPException(status_code=400, detail=f"Invalid search field '{entity_attribute}'.")
+    cursor = get_entity_collection().find(live({entity_attribute: entity_value}), {"version": 1})
+    return [(str(entity["_id"]), entity.get("version", 1)) async for entity in cursor]
+
+def _version_filter(version: int):
+    # Entities written before versioning have no version field and are implicitly version 1
+    return {"$in": [1, None]} if version == 1 else version
+
+async def update_entity(entity_id: str, update_data: CustomerUpdate, expected_version: Optional[int] = None):
+    """
+    Apply the update in one conditional find_one_and_update that also bumps version.
+    With expected_version, the write only happens if the stored version still matches (409 otherwise).
+    """
+    collection = get_entity_collection()
+    try:
+        object_id = ObjectId(entity_id)
+    except InvalidId:
+        raise HTTPException(status_code=404, detail="Entity not found")
+
+    update_doc = update_data.model_dump(exclude_unset=True)
+    query = live({"_id": object_id})
+    if expected_version is not None:
+        query["version"] = _version_filter(expected_version)
+    # Pipeline form so a missing version counts as 1; $literal keeps user values from being read as expressions
+    pipeline = [{"$set": {
+        **{field: {"$literal": value} for field, value in update_doc.items()},
+        "version": {"$add": [{"$ifNull": ["$version", 1]}, 1]},
+    }}]
+
+    if settings.MONGO_TRANSACTIONS:
+        async with await mongodb.client.start_session() as session:
+            async with session.start_transaction():
+                existing = await collection.find_one_and_update(query, pipeline, return_document=ReturnDocument.BEFORE, session=session)
+                if existing:
+                    updated = {**existing, **update_doc, "version": existing.get("version", 1) + 1}
+                    await save_history(updated, operation="update", previous=existing, session=session)
+    else:
+        existing = await collection.find_one_and_update(query, pipeline, return_document=ReturnDocument.BEFORE)
+        if existing:
+            updated = {**existing, **update_doc, "version": existing.get("version", 1) + 1}
+            await save_history(updated, operation="update", previous=existing)
+
+    if not existing:
+        current = await collection.find_one(live({"_id": object_id}), {"version": 1}) if expected_version is not None else None
+        if current is None:
+            raise HTTPException(status_code=404, detail="Entity not found")
+        raise HTTPException(
+            status_code=409,
+            detail=f"Version conflict: expected {expected_version}, current {current.get('version', 1)}"
+        )
+
+    await entity_cache.invalidate(entity_id, updated["version"])
+    await aggregates.apply_changes([(existing, updated)])
+    if settings.MATCHING_ENABLED:
+        matching_index.add(entity_id, updated)
+    if settings.SEARCH_ENABLED:
+        search_index.add(entity_id, updated)
+    updated["id"] = str(updated["_id"])
+    del updated["_id"]
+    return updated
+
+async def delete_entity(entity_id: str) -> bool:
+    """
+    Soft delete: tombstone the entity (deleted, deleted_at, version bump) and record a delete in its
+    history. Tombstones drop out of every read path and are archived or purged after the retention period.
+    """
+    collection = get_entity_collection()
+    try:
+        object_id = ObjectId(entity_id)
+    except InvalidId:
+        return False
+
+    now = datetime.utcnow()
+    pipeline = [{"$set": {
+        "deleted": True,
+        "deleted_at": {"$literal": now},
+        "version": {"$add": [{"$ifNull": ["$version", 1]}, 1]},
+    }}]
+
+    if settings.MONGO_TRANSACTIONS:
+        async with await mongodb.client.start_session() as session:
+            async with session.start_transaction():
+                existing = await collection.find_one_and_update(live({"_id": object_id}), pipeline, return_document=ReturnDocument.BEFORE, session=session)
+                if existing:
+                    tombstone = {**existing, "deleted": True, "deleted_at": now, "version": existing.get("version", 1) + 1}
+                    await save_history(tombstone, operation="delete", previous=existing, session=session)
+    else:
+        existing = await collection.find_one_and_update(live({"_id": object_id}), pipeline, return_document=ReturnDocument.BEFORE)
+        if existing:
+            tombstone = {**existing, "deleted": True, "deleted_at": now, "version": existing.get("version", 1) + 1}
+            await save_history(tombstone, operation="delete", previous=existing)
+
+    if not existing:
+        return False
+    await entity_cache.invalidate(entity_id, tombstone["version"])
+    await aggregates.apply_changes([(existing, None)])
+    matching_index.remove(entity_id)
+    search_index.remove(entity_id)
+    return True
+
+DEFAULT_HISTORY_PAGE_SIZE = 100
+MAX_HISTORY_PAGE_SIZE = 1000
+
+def _history_range_query(object_id: ObjectId, from_version: Optional[int], to_version: Optional[int]) -> dict:
+    version_range = {}
+    if from_version is not None:
+        version_range["$gte"] = from_version
+    if to_version is not None:
+        version_range["$lte"] = to_version
+    return {"entity_id": object_id, **({"version": version_range} if version_range else {})}
+
+async def get_entity_history_versions(
+    entity_id: str,
+    from_version: Optional[int] = None,
+    to_version: Optional[int] = None,
+    limit: int = DEFAULT_HISTORY_PAGE_SIZE,
+    session=None,
+) -> list[int]:
+    """
+    Versions on the history page get_entity_history_by_id would return, plus the first version of the
+    next page. History records never change, so these determine the page without replaying it.
+    """
+    query = _history_range_query(ObjectId(entity_id), from_version, to_version)
+    cursor = heavy_reads(get_entity_history_collection()).find(query, {"_id": 0, "version": 1}, session=session).sort("version", 1).limit(limit + 1)
+    return [record["version"] async for record in cursor]
+
+async def get_entity_history_by_id(
+    entity_id: str,
+    from_version: Optional[int] = None,
+    to_version: Optional[int] = None,
+    limit: int = DEFAULT_HISTORY_PAGE_SIZE,
+    session=None,
+) -> tuple[list[CustomerHistoryOut], Optional[int]]:
+    """
+    One page of an entity's versions within [from_version, to_version], oldest first, and the version
+    the next page starts at (None on the last page). Only the page's records are read, plus the
+    snapshot each replay starts from. Pass a causal session: the page and the replay are separate
+    reads that may land on different secondaries, and the replay must see every record the page did.
+    """
+    history_collection = heavy_reads(get_entity_history_collection())
+    object_id = ObjectId(entity_id)
+    query = _history_range_query(object_id, from_version, to_version)
+    cursor = history_collection.find(query, {"data": 0, "delta": 0}, session=session).sort("version", 1).limit(limit + 1)
+    records = await cursor.to_list(limit + 1)
+
+    next_version = None
+    if len(records) > limit:
+        next_version = records[limit]["version"]
+        records = records[:limit]
+
+    states = await materialize_versions(((object_id, record["version"]) for record in records), session=session)
+    missing = [record["version"] for record in records if (object_id, record["version"]) not in states]
+    if missing:
+        # Within one causal session this only happens when history records were lost, leaving these
+        # versions without a snapshot to replay from; they are left off the page
+        logger.error("History of %s cannot be rebuilt at versions %s", entity_id, missing)
+    history = [
+        CustomerHistoryOut(**serialize_doc({**record, "data": dict(states[(object_id, record["version"])])}))
+        for record in records
+        if (object_id, record["version"]) in states
+    ]
+    return history, next_version
+
+async def get_entity_by_attribute(entity_attribute: str, entity_value: str, fields: Optional[tuple[str, ...]] = None):
     collection = get_entity_collection()
 
     if entity_attribute not in ALLOWED_FIELDS:
@@ -143,11 +524,11 @@ def get_entity_by_attribute(entity_attribute: str, entity_value: str):
             detail=f"Invalid search field '{entity_attribute}'."
         )
 
-    query = {entity_attribute: entity_value}
-    cursor = collection.find(query)
+    query = live({entity_attribute: entity_value})
+    cursor = collection.find(query, _read_projection(fields))
 
     results = []
-    for entity in cursor:
+    async for entity in cursor:
         entity["id"] = str(entity["_id"])
         del entity["_id"]
         results.append(entity)
@@ -0,0 +1,293 @@
+"""
+Runtime-registered entity types.
+
+Each type is a sequence of immutable schema versions in entity_schemas ({name, version, fields}),
+and its entities live in their own entities_<name> collection. A schema version is compiled into
+a Pydantic model plus a List[model] TypeAdapter once per worker and kept in an LRU keyed by
+(name, version); since versions never change, entries only leave the cache by eviction. The
+latest version per type is cached for SCHEMA_LATEST_TTL_SECONDS so versions registered by other
+workers are picked up.
+"""
+from datetime import datetime
+import re
+import time
+from typing import Any, List, NamedTuple, Optional
+
+from bson import ObjectId
+from bson.errors import InvalidId
+from fastapi import HTTPException
+from pydantic import BaseModel, ConfigDict, Field, StringConstraints, TypeAdapter, ValidationError, create_model
+from pymongo import DESCENDING
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+from typing_extensions import Annotated, Literal
+
+from app.core.cache import TTLCache
+from app.core.config import settings
+from app.core.database import mongodb
+from app.core.metrics import ENTITY_VALIDATIONS, ENTITY_VALIDATION_SECONDS, record_validation
+from app.utils.utils import decode_cursor, encode_cursor, format_validation_error, get_typed_entity_collection, live
+
+TYPE_NAME_PATTERN = re.compile(r"^[a-z][a-z0-9_]{0,47}$")
+# Names the hard-coded customer model and the collections next to it already own; entities_archive is
+# where the tombstone purger archives deleted customers
+RESERVED_TYPE_NAMES = {"customer", "archive", "history", "history_archive", "aggregates", "schemas"}
+REGISTER_ATTEMPTS = 5
+
+# Checked by pydantic-core's regex engine; EmailStr's Python-side validator costs more than the rest of a
+# typical row put together
+EMAIL_PATTERN = r"^[^@\s]+@[^@\s]+\.[A-Za-z0-9-]{2,}$"
+SCALAR_TYPES = {
+    "string": str,
+    "email": Annotated[str, StringConstraints(strip_whitespace=True, to_lower=True, pattern=EMAIL_PATTERN)],
+    "integer": int,
+    "number": float,
+    "boolean": bool,
+    "datetime": datetime,
+}
+
+
+def get_schema_collection():
+    if mongodb.db is None:
+        raise RuntimeError("Database not initialized. Did you forget to call connect_to_mongo?")
+    return mongodb.db["entity_schemas"]
+
+
+def _annotation(spec: dict, name: str):
+    kind = spec["type"]
+    if spec.get("enum"):
+        return Literal[tuple(spec["enum"])]
+    if kind == "object":
+        return _compile_model(spec["fields"], name)
+    if kind == "array":
+        return List[_annotation(spec["items"], f"{name}_item")]
+    return SCALAR_TYPES[kind]
+
+
+def _compile_model(fields: dict, name: str) -> type[BaseModel]:
+    definitions = {}
+    for field_name, spec in fields.items():
+        annotation = _annotation(spec, f"{name}_{field_name}")
+        constraints = {
+            key: spec[key] for key in ("min_length", "max_length", "pattern", "ge", "le", "description") if spec.get(key) is not None
+        }
+        if spec.get("required"):
+            definitions[field_name] = (annotation, Field(..., **constraints))
+        else:
+            definitions[field_name] = (Optional[annotation], Field(None, **constraints))
+    return create_model(name, __config__=ConfigDict(extra="forbid"), **definitions)
+
+
+class CompiledSchema(NamedTuple):
+    name: str
+    version: int
+    model: type[BaseModel]
+    list_adapter: TypeAdapter
+
+
+def compile_schema(name: str, version: int, fields: dict) -> CompiledSchema:
+    """Build the model and the bulk List[model] adapter for one schema version; this is the costly step"""
+    model = _compile_model(fields, f"{name}_v{version}")
+    return CompiledSchema(name, version, model, TypeAdapter(List[model]))
+
+
+def validate_type_name(name: str):
+    if not TYPE_NAME_PATTERN.match(name) or name in RESERVED_TYPE_NAMES:
+        raise HTTPException(status_code=400, detail=f"Invalid entity type name '{name}'")
+
+
+def schema_out(doc: dict) -> dict:
+    return {key: doc.get(key) for key in ("name", "version", "description", "fields", "created_at")}
+
+
+class SchemaRegistry:
+    def __init__(self):
+        # Compiled versions never go stale, so entries live until evicted
+        self.validators = TTLCache(settings.SCHEMA_VALIDATOR_CACHE_SIZE, float("inf"))
+        self.latest = TTLCache(settings.SCHEMA_VALIDATOR_CACHE_SIZE, settings.SCHEMA_LATEST_TTL_SECONDS)
+
+    async def register(self, name: str, fields: dict, description: Optional[str] = None) -> dict:
+        """Store fields as the type's next schema version; concurrent registrations retry on the unique index"""
+        validate_type_name(name)
+        collection = get_schema_collection()
+        for _ in range(REGISTER_ATTEMPTS):
+            current = await collection.find_one({"name": name}, {"version": 1}, sort=[("version", DESCENDING)])
+            version = current["version"] + 1 if current else 1
+            try:
+                # Compile before storing: versions are immutable, so a schema that cannot be built
+                # would leave the type unusable until the next version
+                schema = compile_schema(name, version, fields)
+            except Exception as e:
+                raise HTTPException(status_code=400, detail=f"Invalid schema for '{name}': {e}")
+            doc = {
+                "_id": f"{name}:{version}",
+                "name": name,
+                "version": version,
+                "description": description,
+                "fields": fields,
+                "created_at": datetime.utcnow(),
+            }
+            try:
+                await collection.insert_one(doc)
+            except DuplicateKeyError:
+                continue
+            self.latest.set(name, version)
+            self.validators.set((name, version), schema)
+            return schema_out(doc)
+        raise HTTPException(status_code=409, detail=f"Concurrent schema registrations for '{name}', retry")
+
+    async def get_schema(self, name: str, version: Optional[int] = None) -> Optional[dict]:
+        collection = get_schema_collection()
+        if version is None:
+            return await collection.find_one({"name": name}, sort=[("version", DESCENDING)])
+        return await collection.find_one({"_id": f"{name}:{version}"})
+
+    async def list_types(self) -> list[dict]:
+        """Latest schema of every registered type"""
+        pipeline = [
+            {"$sort": {"name": 1, "version": -1}},
+            {"$group": {"_id": "$name", "doc": {"$first": "$$ROOT"}}},
+            {"$sort": {"_id": 1}},
+        ]
+        return [schema_out(row["doc"]) async for row in get_schema_collection().aggregate(pipeline)]
+
+    async def latest_version(self, name: str) -> int:
+        version = self.latest.get(name)
+        if version is None:
+            doc = await get_schema_collection().find_one({"name": name}, {"version": 1}, sort=[("version", DESCENDING)])
+            if doc is None:
+                raise HTTPException(status_code=404, detail=f"Unknown entity type '{name}'")
+            version = doc["version"]
+            self.latest.set(name, version)
+        return version
+
+    async def compiled(self, name: str, version: Optional[int] = None) -> CompiledSchema:
+        """Compiled validators for a schema version (the latest by default), compiling on first use"""
+        if version is None:
+            version = await self.latest_version(name)
+        schema = self.validators.get((name, version))
+        if schema is None:
+            doc = await self.get_schema(name, version)
+            if doc is None:
+                raise HTTPException(status_code=404, detail=f"Unknown schema version {name} v{version}")
+            schema = compile_schema(name, version, doc["fields"])
+            self.validators.set((name, version), schema)
+        return schema
+
+    def stats(self) -> dict:
+        return self.validators.stats()
+
+
+schema_registry = SchemaRegistry()
+
+
+def _observe(name: str, started: float, valid: int, invalid: int):
+    elapsed = time.perf_counter() - started
+    ENTITY_VALIDATION_SECONDS.observe(elapsed, name)
+    record_validation(elapsed)
+    if valid:
+        ENTITY_VALIDATIONS.inc(valid, name, "valid")
+    if invalid:
+        ENTITY_VALIDATIONS.inc(invalid, name, "invalid")
+
+
+def validate_rows(schema: CompiledSchema, rows: list) -> tuple[list, dict]:
+    """
+    Validate a batch with the single compiled list adapter. Returns (valid (index, data) pairs,
+    {index: error}); rows that fail are reported by the index in the first element of each error's loc.
+    """
+    started = time.perf_counter()
+    errors = {}
+    try:
+        models = schema.list_adapter.validate_python(rows)
+        valid = list(enumerate(models))
+    except ValidationError as e:
+        for error in e.errors():
+            index = error["loc"][0]
+            location = ".".join(str(part) for part in error["loc"][1:])
+            errors.setdefault(index, []).append(f"{location}: {error['msg']}" if location else error["msg"])
+        keep = [index for index in range(len(rows)) if index not in errors]
+        valid = list(zip(keep, schema.list_adapter.validate_python([rows[index] for index in keep])))
+    _observe(schema.name, started, len(valid), len(errors))
+    data = [(index, model.model_dump(exclude_none=True)) for index, model in valid]
+    return data, {index: "; ".join(messages) for index, messages in errors.items()}
+
+
+def typed_entity_out(doc: dict) -> dict:
+    return {"id": str(doc.pop("_id")), **doc}
+
+
+def _new_document(schema: CompiledSchema, data: dict, now: datetime) -> dict:
+    return {**data, "_id": ObjectId(), "schema_version": schema.version, "version": 1, "deleted": False, "created_at": now}
+
+
+async def create_typed_entity(name: str, payload: Any) -> str:
+    schema = await schema_registry.compiled(name)
+    started = time.perf_counter()
+    try:
+        data = schema.model.model_validate(payload).model_dump(exclude_none=True)
+    except ValidationError as e:
+        _observe(name, started, 0, 1)
+        raise HTTPException(status_code=422, detail=format_validation_error(e))
+    _observe(name, started, 1, 0)
+    doc = _new_document(schema, data, datetime.utcnow())
+    await get_typed_entity_collection(name).insert_one(doc)
+    return str(doc["_id"])
+
+
+async def bulk_create_typed_entities(name: str, rows: list) -> dict:
+    """Validate rows against the type's latest schema in one adapter call and insert the valid ones unordered"""
+    schema = await schema_registry.compiled(name)
+    started = time.perf_counter()
+    valid, errors = validate_rows(schema, rows)
+    results = {index: {"index": index, "status": "error", "error": message} for index, message in errors.items()}
+    now = datetime.utcnow()
+    docs = [_new_document(schema, data, now) for _, data in valid]
+    failed = {}
+    if docs:
+        try:
+            await get_typed_entity_collection(name).insert_many(docs, ordered=False)
+        except BulkWriteError as e:
+            failed = {err["index"]: err["errmsg"] for err in e.details.get("writeErrors", [])}
+    for position, ((index, _), doc) in enumerate(zip(valid, docs)):
+        if position in failed:
+            results[index] = {"index": index, "status": "error", "error": failed[position]}
+        else:
+            results[index] = {"index": index, "status": "created", "id": str(doc["_id"])}
+
+    elapsed = time.perf_counter() - started
+    ordered = [results[index] for index in range(len(rows))]
+    created = sum(1 for result in ordered if result["status"] == "created")
+    return {
+        "total": len(rows),
+        "created": created,
+        "updated": 0,
+        "failed": len(rows) - created,
+        "elapsed_seconds": round(elapsed, 6),
+        "rows_per_second": round(len(rows) / elapsed, 2) if elapsed > 0 else 0.0,
+        "results": ordered,
+    }
+
+
+async def get_typed_entity(name: str, entity_id: str) -> Optional[dict]:
+    await schema_registry.latest_version(name)
+    try:
+        object_id = ObjectId(entity_id)
+    except (InvalidId, TypeError):
+        raise HTTPException(status_code=400, detail=f"Invalid entity id: {entity_id}")
+    doc = await get_typed_entity_collection(name).find_one(live({"_id": object_id}))
+    return typed_entity_out(doc) if doc else None
+
+
+async def list_typed_entities(name: str, limit: int, after: Optional[str] = None) -> tuple[list, Optional[str]]:
+    """One keyset page of the type's entities ordered by _id, and the cursor for the next page"""
+    await schema_registry.latest_version(name)
+    query = {}
+    if after is not None:
+        try:
+            query = {"_id": {"$gt": decode_cursor(after)}}
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+    cursor = get_typed_entity_collection(name).find(live(query)).sort("_id", 1).limit(limit + 1)
+    docs = [doc async for doc in cursor]
+    next_cursor = encode_cursor(docs[limit - 1]["_id"]) if len(docs) > limit else None
+    return [typed_entity_out(doc) for doc in docs[:limit]], next_cursor
@@ -0,0 +1,94 @@
+from datetime import datetime, timezone
+from typing import Iterable
+from app.core.database import causal_session
+from app.utils.history import DELTA, apply_delta, is_snapshot
+from app.utils.utils import get_entity_history_collection, heavy_reads, serialize_doc
+
+
+async def materialize_versions(wanted: Iterable[tuple], session=None) -> dict[tuple, dict]:
+    """
+    Rebuild the full entity state for each (entity_id, version) pair.
+    Two indexed queries per call regardless of how many pairs: the newest snapshot at or before the
+    oldest wanted version of each entity, then every record from there up to its newest wanted version.
+    """
+    wanted = list(wanted)
+    low, high = {}, {}
+    for entity_id, version in wanted:
+        low[entity_id] = min(version, low.get(entity_id, version))
+        high[entity_id] = max(version, high.get(entity_id, version))
+    if not low:
+        return {}
+
+    collection = heavy_reads(get_entity_history_collection())
+    base = {}
+    snapshot_query = {"$or": [
+        {"entity_id": entity_id, "version": {"$lte": version}, "kind": {"$ne": DELTA}}
+        for entity_id, version in low.items()
+    ]}
+    async for record in collection.find(snapshot_query, {"entity_id": 1, "version": 1}, session=session).sort("version", -1):
+        base.setdefault(record["entity_id"], record["version"])
+
+    range_query = {"$or": [
+        {"entity_id": entity_id, "version": {"$gte": base[entity_id], "$lte": high[entity_id]}}
+        for entity_id in low if entity_id in base
+    ]}
+    states = {}
+    if not range_query["$or"]:
+        return states
+    current, last = {}, {}
+    async for record in collection.find(range_query, session=session).sort([("entity_id", 1), ("version", 1)]):
+        entity_id = record["entity_id"]
+        if is_snapshot(record):
+            current[entity_id] = record["data"]
+        elif entity_id in current and last[entity_id] == record["version"] - 1:
+            current[entity_id] = apply_delta(current[entity_id], record["delta"])
+        else:
+            # No base, or a version is missing below this delta: applying it would build a wrong state
+            current.pop(entity_id, None)
+            continue
+        last[entity_id] = record["version"]
+        states[(entity_id, record["version"])] = current[entity_id]
+    return {key: states[key] for key in wanted if key in states}
+
+
+def to_naive_utc(moment: datetime) -> datetime:
+    """History timestamps are stored as naive UTC; bring aware datetimes onto the same clock"""
+    if moment.tzinfo is not None:
+        return moment.astimezone(timezone.utc).replace(tzinfo=None)
+    return moment
+
+
+async def resolve_versions_as_of(entity_ids: list, as_of: datetime, session=None) -> dict:
+    """
+    Version in effect at as_of for each entity, in one aggregation. The sort is the
+    (entity_id, timestamp, version) index walked backwards, so it needs no in-memory sort and $group
+    takes each entity's first record off the index; version breaks ties between equal timestamps.
+    Entities created after as_of are absent from the result.
+    """
+    pipeline = [
+        {"$match": {"entity_id": {"$in": entity_ids}, "timestamp": {"$lte": to_naive_utc(as_of)}}},
+        {"$sort": {"entity_id": -1, "timestamp": -1, "version": -1}},
+        {"$group": {
+            "_id": "$entity_id",
+            "version": {"$first": "$version"},
+            "timestamp": {"$first": "$timestamp"},
+            "operation": {"$first": "$operation"},
+        }},
+    ]
+    collection = heavy_reads(get_entity_history_collection())
+    return {row["_id"]: row async for row in collection.aggregate(pipeline, session=session)}
+
+
+async def get_entities_as_of(entity_ids: list, as_of: datetime) -> list[dict]:
+    """Full state of each entity as it was at as_of; entities that did not exist then are left out"""
+    async with causal_session() as session:
+        in_effect = await resolve_versions_as_of(entity_ids, as_of, session=session)
+        in_effect = {entity_id: row for entity_id, row in in_effect.items() if row["operation"] != "delete"}
+        states = await materialize_versions(((entity_id, row["version"]) for entity_id, row in in_effect.items()), session=session)
+    results = []
+    for entity_id in entity_ids:
+        row = in_effect.get(entity_id)
+        state = states.get((entity_id, row["version"])) if row else None
+        if state is not None:
+            results.append({"id": str(entity_id), "version": row["version"], "valid_from": row["timestamp"], "data": serialize_doc(dict(state))})
+    return results
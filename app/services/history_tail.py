@@ -0,0 +1,88 @@
+"""
+Base for the in-process entity indexes (matching, typeahead) that every worker keeps in memory.
+
+An index is loaded from the entities collection at startup. This worker's writes update it
+directly; writes made by other workers are picked up by tailing entity_history. The tail only
+reads records older than the settle window, like the change feed: history _ids are allocated by
+the writing worker before the insert commits, so a younger id may still be joined by a slower write
+with a smaller one, which a plain _id > watermark tail would skip for good.
+"""
+from abc import ABC, abstractmethod
+import asyncio
+import logging
+from typing import Optional
+
+from bson import ObjectId
+
+from app.utils.utils import get_entity_collection, get_entity_history_collection, heavy_reads, live, settled_history_id
+
+logger = logging.getLogger(__name__)
+
+
+class HistoryTailIndex(ABC):
+    #: Used in log messages
+    name = "Index"
+    #: Entity fields the index needs; the tail re-reads only these
+    projection: dict = {}
+
+    def __init__(self):
+        self.ready = False
+        self._watermark: Optional[ObjectId] = None
+
+    @property
+    @abstractmethod
+    def refresh_seconds(self) -> float:
+        ...
+
+    @abstractmethod
+    def add(self, entity_id: str, doc: dict):
+        ...
+
+    @abstractmethod
+    def remove(self, entity_id: str):
+        ...
+
+    def loaded(self):
+        """Called once the initial load has been applied"""
+
+    async def load(self, batch_size: int = 5000):
+        """Build the index from the entities collection, streaming only the projected fields"""
+        # Anything not yet settled when the load starts may be missing from the snapshot read below,
+        # so the first refresh replays it; re-applying an entity's current state is idempotent
+        self._watermark = settled_history_id()
+        count = 0
+        cursor = heavy_reads(get_entity_collection()).find(live({}), self.projection).batch_size(batch_size)
+        async for doc in cursor:
+            self.add(str(doc["_id"]), doc)
+            count += 1
+            if count % batch_size == 0:
+                # Yield to request handlers while a large collection loads
+                await asyncio.sleep(0)
+        self.ready = True
+        self.loaded()
+
+    async def refresh(self):
+        """Apply entity changes recorded in entity_history between the watermark and the settle window"""
+        query = {"_id": {"$gt": self._watermark, "$lt": settled_history_id()}}
+        changed = set()
+        async for record in get_entity_history_collection().find(query, {"entity_id": 1}).sort("_id", 1):
+            changed.add(record["entity_id"])
+            self._watermark = record["_id"]
+        if not changed:
+            return
+        found = set()
+        async for doc in get_entity_collection().find(live({"_id": {"$in": list(changed)}}), self.projection):
+            self.add(str(doc["_id"]), doc)
+            found.add(doc["_id"])
+        for entity_id in changed - found:
+            self.remove(str(entity_id))
+
+    async def run(self):
+        """Load, then keep refreshing until cancelled; started from the lifespan hook"""
+        await self.load()
+        while True:
+            await asyncio.sleep(self.refresh_seconds)
+            try:
+                await self.refresh()
+            except Exception as e:
+                logger.warning("%s refresh failed: %s", self.name, e)
@@ -0,0 +1,224 @@
+"""
+Deterministic and fuzzy matching of customer entities.
+
+Entities are reduced to a compact MatchRecord and filed under blocking keys (normalized email,
+phone, external/loyalty ids, and name + date-of-birth combinations) in an in-memory inverted index.
+Candidates for a new entity are the union of the postings of its keys, so lookups cost
+O(block size) instead of a collection scan; they are then scored with trigram similarity.
+"""
+import logging
+import re
+import unicodedata
+from datetime import datetime
+from typing import Iterable, NamedTuple, Optional
+from app.core.config import settings
+from app.services.history_tail import HistoryTailIndex
+from app.utils.utils import get_by_path
+
+logger = logging.getLogger(__name__)
+
+MATCH_PROJECTION = {
+    "personalInfo.firstName": 1,
+    "personalInfo.lastName": 1,
+    "personalInfo.dateOfBirth": 1,
+    "contactInfo.email": 1,
+    "contactInfo.phoneNumber": 1,
+    "identifiers.loyaltyId": 1,
+    "identifiers.externalSystemIds": 1,
+}
+
+# Identifiers that decide a match on their own
+DETERMINISTIC_PREFIXES = ("email:", "phone:", "ext:", "loyalty:")
+
+FUZZY_WEIGHTS = {"name": 0.5, "dob": 0.2, "email": 0.15, "phone": 0.15}
+
+
+class MatchRecord(NamedTuple):
+    entity_id: str
+    first: str
+    last: str
+    name_grams: frozenset
+    dob: Optional[str]
+    email: Optional[str]
+    phone: Optional[str]
+    identifiers: frozenset
+
+
+def normalize_name(value: Optional[str]) -> str:
+    if not value:
+        return ""
+    value = unicodedata.normalize("NFKD", value).encode("ascii", "ignore").decode()
+    return re.sub(r"[^a-z]", "", value.lower())
+
+
+def normalize_email(value: Optional[str]) -> Optional[str]:
+    if not value or "@" not in value:
+        return None
+    local, _, domain = value.strip().lower().rpartition("@")
+    return f"{local.split('+', 1)[0]}@{domain}"
+
+
+def normalize_phone(value: Optional[str]) -> Optional[str]:
+    digits = re.sub(r"\D", "", value or "")
+    # Compare national significant numbers so +44 7700 and 07700 agree
+    return digits[-9:] if len(digits) >= 7 else None
+
+
+def normalize_date(value) -> Optional[str]:
+    if isinstance(value, datetime):
+        return value.date().isoformat()
+    if isinstance(value, str) and len(value) >= 10:
+        return value[:10]
+    return None
+
+
+def trigrams(value: str) -> frozenset:
+    padded = f"  {value} "
+    return frozenset(padded[i:i + 3] for i in range(len(padded) - 2))
+
+
+def to_record(entity_id: str, doc: dict) -> MatchRecord:
+    first = normalize_name(get_by_path(doc, "personalInfo.firstName"))
+    last = normalize_name(get_by_path(doc, "personalInfo.lastName"))
+    identifiers = set()
+    loyalty = get_by_path(doc, "identifiers.loyaltyId")
+    if loyalty:
+        identifiers.add(f"loyalty:{loyalty.strip().lower()}")
+    for external in get_by_path(doc, "identifiers.externalSystemIds") or []:
+        if isinstance(external, dict) and external.get("system") and external.get("id"):
+            identifiers.add(f"ext:{external['system'].strip().lower()}:{external['id'].strip().lower()}")
+    return MatchRecord(
+        entity_id=entity_id,
+        first=first,
+        last=last,
+        name_grams=trigrams(f"{first} {last}"),
+        dob=normalize_date(get_by_path(doc, "personalInfo.dateOfBirth")),
+        email=normalize_email(get_by_path(doc, "contactInfo.email")),
+        phone=normalize_phone(get_by_path(doc, "contactInfo.phoneNumber")),
+        identifiers=frozenset(identifiers),
+    )
+
+
+def blocking_keys(record: MatchRecord) -> set[str]:
+    keys = set(record.identifiers)
+    if record.email:
+        keys.add(f"email:{record.email}")
+    if record.phone:
+        keys.add(f"phone:{record.phone}")
+    if record.last:
+        if record.dob:
+            keys.add(f"last_dob:{record.last}|{record.dob}")
+        if record.first:
+            # Initial + surname prefix tolerates typos in the rest of either name
+            keys.add(f"name:{record.first[0]}|{record.last[:4]}")
+            if record.dob:
+                keys.add(f"first_dob:{record.first}|{record.dob}")
+    return keys
+
+
+def score(a: MatchRecord, b: MatchRecord) -> tuple[float, str, list[str]]:
+    """Return (score in [0, 1], rule, signals that agreed)"""
+    matched = []
+    shared = a.identifiers & b.identifiers
+    if shared:
+        matched.extend(sorted(key.split(":", 1)[0] for key in shared))
+    if a.email and a.email == b.email:
+        matched.append("email")
+    if a.phone and a.phone == b.phone:
+        matched.append("phone")
+    if matched and (shared or "email" in matched):
+        return 1.0, "deterministic", matched
+
+    union = len(a.name_grams | b.name_grams)
+    name_similarity = len(a.name_grams & b.name_grams) / union if union else 0.0
+    total = FUZZY_WEIGHTS["name"] * name_similarity
+    if name_similarity >= 0.5:
+        matched.append("name")
+    if a.dob and a.dob == b.dob:
+        total += FUZZY_WEIGHTS["dob"]
+        matched.append("dob")
+    if "email" in matched:
+        total += FUZZY_WEIGHTS["email"]
+    if "phone" in matched:
+        total += FUZZY_WEIGHTS["phone"]
+    return round(total, 4), "fuzzy", matched
+
+
+class MatchingIndex(HistoryTailIndex):
+    """
+    Inverted index from blocking key to entity ids, kept in each worker's memory.
+    Local writes update it immediately; writes made by other workers are picked up by
+    tailing entity_history every MATCHING_REFRESH_SECONDS.
+    """
+
+    name = "Matching index"
+    projection = MATCH_PROJECTION
+
+    def __init__(self, max_block_size: int = 1000):
+        super().__init__()
+        self.max_block_size = max_block_size
+        self.postings: dict[str, set[str]] = {}
+        self.records: dict[str, MatchRecord] = {}
+
+    @property
+    def refresh_seconds(self) -> float:
+        return settings.MATCHING_REFRESH_SECONDS
+
+    def __len__(self) -> int:
+        return len(self.records)
+
+    def add(self, entity_id: str, doc: dict):
+        self.remove(entity_id)
+        record = to_record(entity_id, doc)
+        self.records[entity_id] = record
+        for key in blocking_keys(record):
+            self.postings.setdefault(key, set()).add(entity_id)
+
+    def remove(self, entity_id: str):
+        record = self.records.pop(entity_id, None)
+        if record is None:
+            return
+        for key in blocking_keys(record):
+            posting = self.postings.get(key)
+            if posting is not None:
+                posting.discard(entity_id)
+                if not posting:
+                    del self.postings[key]
+
+    def candidates(self, record: MatchRecord) -> set[str]:
+        found = set()
+        for key in blocking_keys(record):
+            posting = self.postings.get(key)
+            # Oversized non-identifier blocks (very common names) say little and would dominate latency
+            if posting and (len(posting) <= self.max_block_size or key.startswith(DETERMINISTIC_PREFIXES)):
+                found.update(posting)
+        found.discard(record.entity_id)
+        return found
+
+    def match(self, doc: dict, threshold: Optional[float] = None, limit: int = 10, entity_id: str = "") -> list[dict]:
+        threshold = settings.MATCHING_THRESHOLD if threshold is None else threshold
+        record = to_record(entity_id, doc)
+        results = []
+        for candidate_id in self.candidates(record):
+            candidate = self.records.get(candidate_id)
+            if candidate is None:
+                continue
+            value, rule, matched = score(record, candidate)
+            if value >= threshold:
+                results.append({"id": candidate_id, "score": value, "rule": rule, "matched_on": matched})
+        results.sort(key=lambda result: (-result["score"], result["id"]))
+        return results[:limit]
+
+    def stats(self) -> dict:
+        return {
+            "ready": self.ready,
+            "entities": len(self.records),
+            "blocking_keys": len(self.postings),
+            "largest_block": max((len(posting) for posting in self.postings.values()), default=0),
+        }
+
+    def loaded(self):
+        logger.info("Matching index loaded %d entities under %d keys", len(self.records), len(self.postings))
+
+
+matching_index = MatchingIndex(max_block_size=settings.MATCHING_MAX_BLOCK_SIZE)
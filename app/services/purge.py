@@ -0,0 +1,76 @@
+import asyncio
+from datetime import datetime, timedelta
+import logging
+
+from pymongo import ReplaceOne
+
+from app.core.config import settings
+from app.core.database import mongodb
+from app.utils.utils import get_entity_collection, get_entity_history_collection
+
+logger = logging.getLogger(__name__)
+
+
+class TombstonePurger:
+    """
+    Removes entities soft-deleted more than SOFT_DELETE_RETENTION_DAYS ago together with their full
+    history, a batch at a time. In archive mode both are first copied to entities_archive and
+    entity_history_archive. Each step is idempotent and the tombstone is removed last, so several
+    workers running the purger, or a crash mid-batch, only repeat work.
+    """
+
+    def __init__(self):
+        self.purged = 0
+        self.last_run = None
+
+    async def purge_batch(self, cutoff: datetime) -> int:
+        entities = get_entity_collection()
+        history = get_entity_history_collection()
+        tombstones = await entities.find(
+            {"deleted": True, "deleted_at": {"$lt": cutoff}},
+        ).sort("deleted_at", 1).limit(settings.PURGE_BATCH_SIZE).to_list(settings.PURGE_BATCH_SIZE)
+        if not tombstones:
+            return 0
+        ids = [doc["_id"] for doc in tombstones]
+
+        if settings.PURGE_MODE == "archive":
+            records = await history.find({"entity_id": {"$in": ids}}).to_list(None)
+            if records:
+                await mongodb.db["entity_history_archive"].bulk_write(
+                    [ReplaceOne({"_id": record["_id"]}, record, upsert=True) for record in records], ordered=False
+                )
+            await mongodb.db["entities_archive"].bulk_write(
+                [ReplaceOne({"_id": doc["_id"]}, doc, upsert=True) for doc in tombstones], ordered=False
+            )
+
+        await history.delete_many({"entity_id": {"$in": ids}})
+        result = await entities.delete_many({"_id": {"$in": ids}, "deleted": True})
+        return result.deleted_count
+
+    async def purge(self) -> int:
+        """Work through every expired tombstone, pausing between batches"""
+        cutoff = datetime.utcnow() - timedelta(days=settings.SOFT_DELETE_RETENTION_DAYS)
+        total = 0
+        while True:
+            count = await self.purge_batch(cutoff)
+            total += count
+            if count < settings.PURGE_BATCH_SIZE:
+                break
+            await asyncio.sleep(settings.PURGE_BATCH_PAUSE_SECONDS)
+        self.purged += total
+        self.last_run = datetime.utcnow()
+        if total:
+            logger.info("%s %d tombstoned entities", "Archived" if settings.PURGE_MODE == "archive" else "Purged", total)
+        return total
+
+    async def run(self):
+        """Purge on an interval until cancelled; started from the lifespan hook"""
+        while True:
+            try:
+                await self.purge()
+            except Exception as e:
+                logger.warning("Tombstone purge failed: %s", e)
+            await asyncio.sleep(settings.PURGE_INTERVAL_SECONDS)
+
+
+tombstone_purger = TombstonePurger()
@@ -0,0 +1,126 @@
+from datetime import datetime
+from functools import lru_cache
+from typing import Optional, Union
+from fastapi import HTTPException
+from pydantic import EmailStr, TypeAdapter, ValidationError
+from app.core.indexes import indexed_fields
+from app.schemas.fieldsets import build_projection, leaf_type
+from app.schemas.query import BooleanFilter, Condition, EntityQuery
+from app.services.entity import ALLOWED_FIELDS
+from app.utils.utils import get_entity_collection, format_validation_error, live
+
+RANGE_OPS = {"gt", "gte", "lt", "lte"}
+LIST_OPS = {"in", "nin"}
+# Operators an index can seek on; ne/nin still have to walk the whole index
+SEEKABLE_OPS = {"eq", "in"} | RANGE_OPS
+RANGE_TYPES = (int, float, datetime)
+SORTABLE_FIELDS = ALLOWED_FIELDS | {"_id", "version"}
+
+
+@lru_cache(maxsize=None)
+def _adapter(field: str) -> TypeAdapter:
+    value_type = leaf_type(field)
+    # Query values only need to match what is stored, not pass the write-time email checks
+    return TypeAdapter(str if value_type is EmailStr else value_type)
+
+
+def _coerce(condition: Condition):
+    if condition.field not in ALLOWED_FIELDS:
+        raise HTTPException(status_code=400, detail=f"Invalid query field '{condition.field}'.")
+    if condition.op in RANGE_OPS and leaf_type(condition.field) not in RANGE_TYPES:
+        raise HTTPException(status_code=400, detail=f"Range operator '{condition.op}' is not supported on '{condition.field}'.")
+    adapter = _adapter(condition.field)
+    try:
+        if condition.op in LIST_OPS:
+            if not isinstance(condition.value, list):
+                raise HTTPException(status_code=400, detail=f"Operator '{condition.op}' on '{condition.field}' needs a list value.")
+            return [adapter.validate_python(item) for item in condition.value]
+        return adapter.validate_python(condition.value)
+    except ValidationError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid value for '{condition.field}': {format_validation_error(e)}")
+
+
+def compile_filter(node: Union[Condition, BooleanFilter]) -> dict:
+    """Translate a typed filter tree into a MongoDB query document, coercing values to the schema types"""
+    if isinstance(node, Condition):
+        value = _coerce(node)
+        if node.op == "eq":
+            return {node.field: value}
+        return {node.field: {f"${node.op}": value}}
+    if (node.and_ is None) == (node.or_ is None):
+        raise HTTPException(status_code=400, detail="Each filter group needs exactly one of 'and' or 'or'.")
+    if node.and_ is not None:
+        return {"$and": [compile_filter(child) for child in node.and_]}
+    return {"$or": [compile_filter(child) for child in node.or_]}
+
+
+def can_use_index(node: Union[Condition, BooleanFilter], indexed: set[str]) -> bool:
+    """
+    Whether the registered indexes let MongoDB avoid a collection scan:
+    an AND needs one seekable branch, an OR needs every branch to be seekable.
+    """
+    if isinstance(node, Condition):
+        return node.field in indexed and node.op in SEEKABLE_OPS
+    if node.and_ is not None:
+        return any(can_use_index(child, indexed) for child in node.and_)
+    return all(can_use_index(child, indexed) for child in node.or_ or [])
+
+
+def _walk_plan(stage: dict, stages: list, indexes: list):
+    stages.append(stage.get("stage", "?"))
+    if "indexName" in stage:
+        indexes.append(stage["indexName"])
+    for key in ("inputStage", "outerStage", "innerStage"):
+        if key in stage:
+            _walk_plan(stage[key], stages, indexes)
+    for child in stage.get("inputStages", []):
+        _walk_plan(child, stages, indexes)
+
+
+def summarize_explain(explain: dict) -> dict:
+    planner = explain.get("queryPlanner", {})
+    winning = planner.get("winningPlan", {})
+    # Slot-based engine plans nest the classic plan under queryPlan
+    winning = winning.get("queryPlan", winning)
+    stages, indexes = [], []
+    _walk_plan(winning, stages, indexes)
+    execution = explain.get("executionStats", {})
+    return {
+        "stages": stages,
+        "indexes": indexes,
+        "collection_scan": "COLLSCAN" in stages,
+        "keys_examined": execution.get("totalKeysExamined"),
+        "docs_examined": execution.get("totalDocsExamined"),
+        "returned": execution.get("nReturned"),
+        "execution_ms": execution.get("executionTimeMillis"),
+    }
+
+
+async def query_entities(query: EntityQuery, fields: Optional[tuple[str, ...]] = None) -> dict:
+    mongo_filter = compile_filter(query.where)
+    indexed = indexed_fields("entities")
+    if not query.allow_scan and not can_use_index(query.where, indexed):
+        raise HTTPException(
+            status_code=400,
+            detail="Query cannot use an index and would scan the whole collection; "
+                   f"filter on one of {sorted(indexed & ALLOWED_FIELDS)} or set allow_scan=true.",
+        )
+    for key in query.sort:
+        if key.field not in SORTABLE_FIELDS:
+            raise HTTPException(status_code=400, detail=f"Invalid sort field '{key.field}'.")
+
+    collection = get_entity_collection()
+    cursor = collection.find(live(mongo_filter), build_projection(fields) if fields else None).limit(query.limit)
+    if query.sort:
+        cursor = cursor.sort([(key.field, 1 if key.direction == "asc" else -1) for key in query.sort])
+
+    items = []
+    async for entity in cursor:
+        entity["id"] = str(entity["_id"])
+        del entity["_id"]
+        items.append(entity)
+
+    result = {"count": len(items), "items": items, "explain": None}
+    if query.explain:
+        result["explain"] = summarize_explain(await cursor.explain())
+    return result
@@ -0,0 +1,200 @@
+"""
+Typeahead lookup on names, email and loyalty id.
+
+Each field keeps its normalized terms in a SortedList, so a prefix query is a bisect to the first
+term >= the prefix followed by a walk while terms still start with it: O(log n + matches), without
+touching MongoDB. A new or vanished term is an O(log n) insert or delete, so writes never re-sort the
+term set; the initial load collects terms unsorted and sorts them once at the end. The index is
+kept current from this worker's writes and from the entity_history tail (see app.services.history_tail).
+"""
+import logging
+import re
+import unicodedata
+from typing import NamedTuple, Optional
+
+from sortedcontainers import SortedList
+
+from app.core.config import settings
+from app.services.history_tail import HistoryTailIndex
+from app.utils.utils import get_by_path
+
+logger = logging.getLogger(__name__)
+
+SEARCH_PROJECTION = {
+    "personalInfo.firstName": 1,
+    "personalInfo.lastName": 1,
+    "contactInfo.email": 1,
+    "identifiers.loyaltyId": 1,
+}
+
+# Searchable field -> weight; an exact hit on a unique identifier outranks any name prefix
+FIELD_WEIGHTS = {"loyaltyId": 4.0, "email": 3.0, "name": 2.0, "lastName": 1.5, "firstName": 1.0}
+SEARCH_FIELDS = tuple(FIELD_WEIGHTS)
+EXACT_BONUS = 1.0
+# Terms examined per field for one query; bounds the cost of one- or two-letter prefixes
+MAX_TERMS_SCANNED = 256
+
+
+def normalize_term(value) -> str:
+    """Case-folded ASCII with punctuation other than @ . _ - removed; spaces collapse to one"""
+    if not isinstance(value, str):
+        return ""
+    value = unicodedata.normalize("NFKD", value).encode("ascii", "ignore").decode().casefold()
+    value = re.sub(r"[^a-z0-9@._\- ]", "", value)
+    return " ".join(value.split())
+
+
+class SearchRecord(NamedTuple):
+    entity_id: str
+    first_name: Optional[str]
+    last_name: Optional[str]
+    email: Optional[str]
+    loyalty_id: Optional[str]
+
+
+def record_terms(record: SearchRecord) -> dict[str, str]:
+    first, last = normalize_term(record.first_name), normalize_term(record.last_name)
+    terms = {
+        "firstName": first,
+        "lastName": last,
+        "name": f"{first} {last}".strip(),
+        "email": normalize_term(record.email),
+        "loyaltyId": normalize_term(record.loyalty_id),
+    }
+    return {field: term for field, term in terms.items() if term}
+
+
+class PrefixList:
+    """Sorted unique terms, mapping each term to the entities that carry it"""
+
+    def __init__(self):
+        self.terms = SortedList()
+        self.postings: dict[str, set[str]] = {}
+        # While deferred (bulk load), only postings are kept and build() sorts the terms in one go
+        self.deferred = False
+
+    def add(self, term: str, entity_id: str):
+        posting = self.postings.get(term)
+        if posting is None:
+            posting = self.postings[term] = set()
+            if not self.deferred:
+                self.terms.add(term)
+        posting.add(entity_id)
+
+    def remove(self, term: str, entity_id: str):
+        posting = self.postings.get(term)
+        if posting is not None:
+            posting.discard(entity_id)
+            if not posting:
+                del self.postings[term]
+                if not self.deferred:
+                    self.terms.remove(term)
+
+    def build(self):
+        self.terms = SortedList(self.postings)
+        self.deferred = False
+
+    def prefix(self, prefix: str, max_terms: int):
+        """Yield (term, entity ids) for up to max_terms terms starting with prefix"""
+        for scanned, term in enumerate(self.terms.irange(minimum=prefix)):
+            if not term.startswith(prefix) or scanned >= max_terms:
+                break
+            yield term, self.postings[term]
+
+    def __len__(self) -> int:
+        return len(self.postings)
+
+
+class TypeaheadIndex(HistoryTailIndex):
+    name = "Typeahead index"
+    projection = SEARCH_PROJECTION
+
+    def __init__(self):
+        super().__init__()
+        self.fields = {field: PrefixList() for field in SEARCH_FIELDS}
+        self.records: dict[str, SearchRecord] = {}
+
+    @property
+    def refresh_seconds(self) -> float:
+        return settings.SEARCH_REFRESH_SECONDS
+
+    def add(self, entity_id: str, doc: dict):
+        self.remove(entity_id)
+        record = SearchRecord(
+            entity_id=entity_id,
+            first_name=get_by_path(doc, "personalInfo.firstName"),
+            last_name=get_by_path(doc, "personalInfo.lastName"),
+            email=get_by_path(doc, "contactInfo.email"),
+            loyalty_id=get_by_path(doc, "identifiers.loyaltyId"),
+        )
+        self.records[entity_id] = record
+        for field, term in record_terms(record).items():
+            self.fields[field].add(term, entity_id)
+
+    def remove(self, entity_id: str):
+        record = self.records.pop(entity_id, None)
+        if record is not None:
+            for field, term in record_terms(record).items():
+                self.fields[field].remove(term, entity_id)
+
+    def search(self, query: str, limit: int = 10, fields: tuple = SEARCH_FIELDS) -> list[dict]:
+        """
+        Rank entities by their best hit: the field weight, a bonus for an exact match, and a
+        closeness term that prefers terms barely longer than the query. Matching terms are ranked
+        first and their postings drained best-first, so a common name shared by thousands of
+        entities costs no more than limit lookups.
+        """
+        prefix = normalize_term(query)
+        if not prefix:
+            return []
+        candidates = []
+        for field in fields:
+            weight = FIELD_WEIGHTS[field]
+            for term, posting in self.fields[field].prefix(prefix, MAX_TERMS_SCANNED):
+                value = weight + len(prefix) / len(term) + (EXACT_BONUS if term == prefix else 0.0)
+                candidates.append((value, field, posting))
+        candidates.sort(key=lambda candidate: -candidate[0])
+        best: dict[str, tuple[float, str]] = {}
+        for value, field, posting in candidates:
+            for entity_id in posting:
+                if entity_id not in best:
+                    best[entity_id] = (value, field)
+                    if len(best) >= limit:
+                        break
+            if len(best) >= limit:
+                break
+        hits = []
+        for entity_id, (value, field) in best.items():
+            record = self.records[entity_id]
+            hits.append({
+                "id": entity_id,
+                "score": round(value, 4),
+                "matched_field": field,
+                "firstName": record.first_name,
+                "lastName": record.last_name,
+                "email": record.email,
+                "loyaltyId": record.loyalty_id,
+            })
+        return hits
+
+    def stats(self) -> dict:
+        return {
+            "ready": self.ready,
+            "entities": len(self.records),
+            "terms": {field: len(terms) for field, terms in self.fields.items()},
+        }
+
+    async def load(self, batch_size: int = 5000):
+        for terms in self.fields.values():
+            terms.deferred = True
+        try:
+            await super().load(batch_size)
+        finally:
+            for terms in self.fields.values():
+                terms.build()
+
+    def loaded(self):
+        logger.info("Typeahead index loaded %d entities", len(self.records))
+
+
+search_index = TypeaheadIndex()
@@ -10,11 +10,11 @@ async def create_user(user_data: UserCreate) -> str:
     collection = get_user_collection()
     
     # Check if username already exists
-    if collection.find_one({"username": user_data.username}):
+    if await collection.find_one({"username": user_data.username}):
         raise HTTPException(status_code=400, detail="Username already exists")
     
     # Check if email already exists
-    if collection.find_one({"email": user_data.email}):
+    if await collection.find_one({"email": user_data.email}):
         raise HTTPException(status_code=400, detail="Email already exists")
     
     # Hash the password
@@ -32,24 +32,24 @@ async def create_user(user_data: UserCreate) -> str:
     
     try:
         # Insert the user
-        result = collection.insert_one(user_doc)
+        result = await collection.insert_one(user_doc)
         return str(result.inserted_id)
     except DuplicateKeyError:
         raise HTTPException(status_code=400, detail="User with this username or email already exists")
 
 
-def get_user_by_username(username: str) -> Optional[dict]:
+async def get_user_by_username(username: str) -> Optional[dict]:
     collection = get_user_collection()
-    return collection.find_one({"username": username})
+    return await collection.find_one({"username": username})
 
 
-def get_user_by_email(email: str) -> Optional[dict]:
+async def get_user_by_email(email: str) -> Optional[dict]:
     collection = get_user_collection()
-    return collection.find_one({"email": email})
+    return await collection.find_one({"email": email})
 
 
 async def authenticate_user(username: str, password: str) -> dict:
-    user = get_user_by_username(username)
+    user = await get_user_by_username(username)
     if not user:
         raise HTTPException(status_code=401, detail="Invalid credentials")
     
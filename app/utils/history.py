@@ -0,0 +1,70 @@
+"""Field-level delta encoding for entity_history records"""
+from typing import Optional
+from app.core.config import settings
+
+SNAPSHOT = "snapshot"
+DELTA = "delta"
+
+
+def diff_documents(before: dict, after: dict, prefix: tuple = ()) -> dict:
+    """
+    Field-level difference turning before into after.
+    Nested dicts are diffed recursively; any other value, lists included, is replaced whole.
+    Paths are stored as lists of segments so keys never need to contain dots.
+    """
+    delta = {"set": [], "unset": []}
+    for key, value in after.items():
+        path = prefix + (key,)
+        if key not in before:
+            delta["set"].append([list(path), value])
+        elif isinstance(value, dict) and isinstance(before[key], dict):
+            nested = diff_documents(before[key], value, path)
+            delta["set"].extend(nested["set"])
+            delta["unset"].extend(nested["unset"])
+        elif before[key] != value or type(before[key]) is not type(value):
+            delta["set"].append([list(path), value])
+    for key in before:
+        if key not in after:
+            delta["unset"].append(list(prefix + (key,)))
+    return delta
+
+
+def apply_delta(state: dict, delta: dict) -> dict:
+    """
+    Return a new document with delta applied to state.
+    Only the dicts along modified paths are copied, so state itself is never mutated.
+    """
+    result = dict(state)
+    for path, value in delta.get("set", []):
+        _copy_path(result, path)[path[-1]] = value
+    for path in delta.get("unset", []):
+        _copy_path(result, path).pop(path[-1], None)
+    return result
+
+
+def _copy_path(root: dict, path: list) -> dict:
+    node = root
+    for key in path[:-1]:
+        child = node.get(key)
+        child = dict(child) if isinstance(child, dict) else {}
+        node[key] = child
+        node = child
+    return node
+
+
+def is_snapshot(record: dict) -> bool:
+    # Records written before delta encoding carry a full "data" copy and no "kind"
+    return record.get("kind", SNAPSHOT) == SNAPSHOT
+
+
+def is_snapshot_version(version: int) -> bool:
+    interval = settings.HISTORY_SNAPSHOT_INTERVAL
+    return interval <= 1 or version % interval == 1
+
+
+def encode_history_data(entity: dict, previous: Optional[dict]) -> dict:
+    """The data-bearing fields of a history record: a full snapshot or a delta against previous"""
+    if previous is None or is_snapshot_version(entity.get("version", 1)):
+        return {"kind": SNAPSHOT, "data": dict(entity)}
+    return {"kind": DELTA, "delta": diff_documents(previous, entity)}
+
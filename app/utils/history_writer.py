@@ -0,0 +1,162 @@
+import asyncio
+import logging
+from typing import Optional
+
+from bson import ObjectId
+from pymongo.errors import BulkWriteError, PyMongoError
+
+from app.core.config import settings
+from app.core.database import mongodb
+
+logger = logging.getLogger(__name__)
+
+FLUSH_RETRIES = 5
+# First retry delay; doubles on each further attempt
+RETRY_BACKOFF_SECONDS = 0.1
+
+
+class HistoryWriter:
+    """
+    Write-behind buffer for entity_history (HISTORY_WRITE_MODE=write_behind).
+    Requests enqueue their history record and return; one background task group-commits the queue
+    with insert_many once HISTORY_FLUSH_BATCH_SIZE records are waiting or HISTORY_FLUSH_INTERVAL_MS
+    has passed. A full queue blocks submitters (backpressure) instead of growing without bound.
+    Records still queued when the process dies are lost, which is the tradeoff against sync mode.
+    A batch that still fails after FLUSH_RETRIES attempts is logged as an error and counted in
+    "failed"; the affected entities write their next record as a full snapshot so the delta chain
+    restarts instead of building on the lost versions.
+    """
+
+    def __init__(self, max_queue: int, batch_size: int, flush_interval: float):
+        self.max_queue = max_queue
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.queue: Optional[asyncio.Queue] = None
+        self.accepting = False
+        self.flushes = 0
+        self.written = 0
+        self.failed = 0
+        self.blocked = 0
+        self.resync: set = set()
+
+    async def submit(self, doc: dict):
+        if not self.accepting:
+            # Not started (CLI jobs) or shutting down: fall back to a synchronous insert
+            await mongodb.db["entity_history"].insert_one(doc)
+            return
+        if self.queue.full():
+            self.blocked += 1
+        await self.queue.put(doc)
+
+    def needs_snapshot(self, entity_id) -> bool:
+        """True once for an entity whose history records were dropped, so its next record is a snapshot"""
+        if entity_id in self.resync:
+            self.resync.discard(entity_id)
+            return True
+        return False
+
+    async def _unwritten(self, collection, records: list) -> list:
+        """The records whose (entity_id, version) is not stored yet"""
+        query = {"$or": [{"entity_id": record["entity_id"], "version": record["version"]} for record in records]}
+        stored = {(doc["entity_id"], doc["version"]) async for doc in collection.find(query, {"entity_id": 1, "version": 1})}
+        return [record for record in records if (record["entity_id"], record["version"]) not in stored]
+
+    def _drop(self, records: list, reason: str):
+        """Give up on records: count and log them, and make each entity's next record a snapshot"""
+        self.failed += len(records)
+        entity_ids = {record.get("entity_id") for record in records} - {None}
+        self.resync.update(entity_ids)
+        logger.error(
+            "Dropped %d history records %s; next versions of %d entities will be snapshots: %s",
+            len(records), reason, len(entity_ids),
+            ", ".join(f"{record.get('entity_id')} v{record.get('version')}" for record in records[:20]),
+        )
+
+    async def _flush(self, batch: list):
+        collection = mongodb.db["entity_history"]
+        pending = batch
+        uncertain = False
+        for attempt in range(FLUSH_RETRIES):
+            try:
+                if uncertain:
+                    # The failed attempt may have stored part of the batch before the error
+                    pending = await self._unwritten(collection, pending)
+                    uncertain = False
+                # Fresh _ids on every attempt: change-feed readers only wait CHANGE_FEED_SETTLE_SECONDS
+                # for an _id to commit, so ids allocated before the backoff may already be behind them
+                for record in pending:
+                    record["_id"] = ObjectId()
+                if pending:
+                    await collection.insert_many(pending, ordered=False)
+                pending = []
+                break
+            except BulkWriteError as e:
+                # Unordered: everything not reported in writeErrors was inserted
+                errors = e.details.get("writeErrors", [])
+                pending = [pending[err["index"]] for err in errors]
+                logger.warning("History flush attempt %d: %d records failed: %s", attempt + 1, len(errors), errors[0].get("errmsg") if errors else e)
+            except PyMongoError as e:
+                uncertain = True
+                logger.warning("History flush attempt %d failed: %s", attempt + 1, e)
+            await asyncio.sleep(RETRY_BACKOFF_SECONDS * 2 ** attempt)
+        if pending:
+            self._drop(pending, f"after {FLUSH_RETRIES} failed flushes")
+        if len(pending) < len(batch):
+            self.flushes += 1
+            self.written += len(batch) - len(pending)
+
+    async def run(self):
+        """Group-commit loop; started from the lifespan hook"""
+        self.queue = asyncio.Queue(maxsize=self.max_queue)
+        self.accepting = True
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self.queue.get()]
+            deadline = loop.time() + self.flush_interval
+            while len(batch) < self.batch_size:
+                if not self.queue.empty():
+                    batch.append(self.queue.get_nowait())
+                    continue
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self.queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            try:
+                await self._flush(batch)
+            except Exception as e:
+                # Anything _flush does not handle itself (e.g. a record bson cannot encode) must not end
+                # the task: producers would block on the full queue and close() would never return
+                logger.exception("History flush failed")
+                self._drop(batch, f"after an unexpected {type(e).__name__}")
+            finally:
+                for _ in batch:
+                    self.queue.task_done()
+
+    async def close(self):
+        """Stop buffering and wait until everything already queued has been written"""
+        self.accepting = False
+        if self.queue is not None:
+            await self.queue.join()
+
+    def stats(self) -> dict:
+        return {
+            "mode": settings.HISTORY_WRITE_MODE,
+            "queued": self.queue.qsize() if self.queue is not None else 0,
+            "max_queue": self.max_queue,
+            "flushes": self.flushes,
+            "written": self.written,
+            "failed": self.failed,
+            "resync_pending": len(self.resync),
+            "blocked_submits": self.blocked,
+            "mean_batch_size": round(self.written / self.flushes, 2) if self.flushes else 0.0,
+        }
+
+
+history_writer = HistoryWriter(
+    max_queue=settings.HISTORY_QUEUE_MAX_SIZE,
+    batch_size=settings.HISTORY_FLUSH_BATCH_SIZE,
+    flush_interval=settings.HISTORY_FLUSH_INTERVAL_MS / 1000,
+)
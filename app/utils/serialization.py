@@ -0,0 +1,43 @@
+from typing import Any
+from bson import ObjectId
+from fastapi.responses import ORJSONResponse
+import orjson
+from app.schemas.entity import CustomerOut
+
+# Top-level CustomerOut fields in declaration order, with the value used when a document lacks one
+CUSTOMER_OUT_DEFAULTS = {
+    name: field.default if field.default is not None and not field.is_required() else None
+    for name, field in CustomerOut.model_fields.items()
+    if name != "id"
+}
+CUSTOMER_OUT_FIELDS = tuple(CUSTOMER_OUT_DEFAULTS)
+
+
+def _default(value: Any):
+    if isinstance(value, ObjectId):
+        return str(value)
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def dumps(content: Any) -> bytes:
+    """Encode documents in one pass; datetimes natively, ObjectIds as strings"""
+    return orjson.dumps(content, default=_default)
+
+
+def trusted_customer(doc: dict) -> dict:
+    """
+    Shape a stored entity like CustomerOut without re-validating it.
+    Only for documents that were validated on write; nested values are passed through as stored.
+    """
+    shaped = {"_id": doc["id"] if "id" in doc else str(doc["_id"])}
+    for name, default in CUSTOMER_OUT_DEFAULTS.items():
+        value = doc.get(name)
+        shaped[name] = default if value is None else value
+    return shaped
+
+
+class TrustedJSONResponse(ORJSONResponse):
+    """ORJSONResponse that also understands the BSON types left in trusted documents"""
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
@@ -1,8 +1,15 @@
-from app.core.database import mongodb
+from app.core.config import settings
+from app.core.database import heavy_read_preference, mongodb
+from app.utils.history_writer import history_writer
+from app.utils.history import encode_history_data
 from bson import ObjectId
-import copy
-from datetime import datetime
+from bson.errors import InvalidId
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+import base64
+import binascii
 import hashlib
+import orjson
 import secrets
 
 def serialize_doc(doc):
@@ -16,6 +23,30 @@ def serialize_doc(doc):
         doc["customer_id"] = doc["_id"]
     return doc
 
+def json_default(value):
+    """JSON encoder fallback for the BSON types stored in entity documents"""
+    if isinstance(value, ObjectId):
+        return str(value)
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+def to_ndjson_line(doc: dict) -> bytes:
+    """Encode a single document as one NDJSON line"""
+    return orjson.dumps(doc, default=json_default) + b"\n"
+
+def encode_cursor(object_id: ObjectId) -> str:
+    """Encode an _id as an opaque, URL-safe pagination cursor"""
+    return base64.urlsafe_b64encode(object_id.binary).decode().rstrip("=")
+
+def decode_cursor(cursor: str) -> ObjectId:
+    """Decode a cursor produced by encode_cursor, raising ValueError if malformed"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        return ObjectId(raw)
+    except (binascii.Error, InvalidId, TypeError, ValueError) as e:
+        raise ValueError(f"Invalid cursor '{cursor}'") from e
+
 def get_entity_collection():
     if mongodb.db is None:
         raise RuntimeError("Database not initialized. Did you forget to call connect_to_mongo?")
@@ -26,17 +57,105 @@ def get_entity_history_collection():
         raise RuntimeError("Database not initialized. Did you forget to call connect_to_mongo?")
     return mongodb.db["entity_history"]
 
-async def save_history(entity: dict, operation: str):
-    entity_history_collection = get_entity_history_collection()
-    history_doc = {
+def get_typed_entity_collection(type_name: str):
+    """Collection holding the entities of a runtime-registered type"""
+    if mongodb.db is None:
+        raise RuntimeError("Database not initialized. Did you forget to call connect_to_mongo?")
+    return mongodb.db[f"entities_{type_name}"]
+
+def settled_history_id() -> ObjectId:
+    """
+    History _ids are generated by the writing worker before the insert commits, so the newest few may
+    still be joined by concurrent writes with slightly smaller ids. Ids below this bound, allocated
+    more than CHANGE_FEED_SETTLE_SECONDS ago, are taken to be final.
+    """
+    cutoff = datetime.now(timezone.utc) - timedelta(seconds=settings.CHANGE_FEED_SETTLE_SECONDS)
+    return ObjectId.from_datetime(cutoff)
+
+def live(query: dict) -> dict:
+    """Restrict a filter to entities that are not tombstoned; this is also what the partial indexes cover"""
+    return {**query, "deleted": False}
+
+def heavy_reads(collection):
+    """The collection routed by MONGO_HEAVY_READ_PREFERENCE, for large reads that tolerate replication lag"""
+    return collection.with_options(read_preference=heavy_read_preference())
+
+def build_history_doc(entity: dict, operation: str, previous: Optional[dict] = None) -> dict:
+    if previous is not None and history_writer.needs_snapshot(entity["_id"]):
+        # An earlier record of this entity was dropped by the write-behind buffer; restart the delta chain
+        previous = None
+    return {
         "entity_id": entity["_id"],
         "version": entity.get("version", 1),
-        "data": copy.deepcopy(entity),
+        **encode_history_data(entity, previous),
         "operation": operation,
         "timestamp": datetime.utcnow()
     }
 
-    entity_history_collection.insert_one(history_doc)
+async def save_history(entity: dict, operation: str, previous: Optional[dict] = None, session=None):
+    history_doc = build_history_doc(entity, operation, previous)
+    # Records written inside a transaction must commit with it, so they never go through the buffer
+    if settings.HISTORY_WRITE_MODE == "write_behind" and session is None:
+        await history_writer.submit(history_doc)
+        return
+
+    entity_history_collection = get_entity_history_collection()
+    await entity_history_collection.insert_one(history_doc, session=session)
+
+def make_etag(entity_id, version: int, variant: Optional[str] = None) -> str:
+    """
+    Strong ETag for one version of an entity. variant tells representations of the same version apart
+    (e.g. a fields= projection); it sits before the version so parse_expected_version still reads it.
+    """
+    return f'"{entity_id}.{variant}-{version}"' if variant else f'"{entity_id}-{version}"'
+
+def make_page_etag(*parts) -> str:
+    """Strong ETag for a page of entities or history, from the (id, version) pairs and parameters that determine it"""
+    return '"p' + hashlib.blake2b(repr(parts).encode(), digest_size=16).hexdigest() + '"'
+
+def fields_variant(fields: Optional[tuple]) -> Optional[str]:
+    return hashlib.blake2b(",".join(fields).encode(), digest_size=4).hexdigest() if fields else None
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """If-None-Match uses the weak comparison: W/ prefixes are ignored and * matches any current representation"""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    tags = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+    return etag in tags
+
+def parse_expected_version(if_match: Optional[str]) -> Optional[int]:
+    """
+    Extract the version from an If-Match header holding an ETag from make_etag or a bare version number.
+    Returns None for a missing header or "*"; raises ValueError if it cannot be parsed.
+    """
+    if if_match is None or if_match.strip() == "*":
+        return None
+    tag = if_match.split(",")[0].strip()
+    if tag.startswith("W/"):
+        tag = tag[2:]
+    tag = tag.strip('"')
+    try:
+        return int(tag.rsplit("-", 1)[-1])
+    except ValueError:
+        raise ValueError(f"Invalid If-Match value '{if_match}'")
+
+def get_by_path(doc: dict, path: str):
+    """Resolve a dotted field path against a nested dict, returning None when any segment is missing"""
+    value = doc
+    for part in path.split("."):
+        if not isinstance(value, dict):
+            return None
+        value = value.get(part)
+    return value
+
+def format_validation_error(error) -> str:
+    """Flatten a pydantic ValidationError into a single readable line"""
+    return "; ".join(
+        f"{'.'.join(str(loc) for loc in err['loc'])}: {err['msg']}" if err["loc"] else err["msg"]
+        for err in error.errors()
+    )
 
 def get_user_collection():
     """Get the users collection from MongoDB"""
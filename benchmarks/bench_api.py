@@ -0,0 +1,289 @@
+"""
+Concurrent load test of the entity API: throughput and p50/p95/p99 latency per endpoint.
+
+By default the app runs in-process against the MongoDB configured in .env, in a scratch database
+that is dropped afterwards. --base-url drives an already running server instead (it must share
+SECRET_KEY with this process), and --in-memory swaps MongoDB for mongomock-motor so the harness
+runs anywhere (absolute numbers are then not representative):
+
+    python -m benchmarks.bench_api --seed 5000 --requests 20000 --concurrency 1000 --out results.json
+    python -m benchmarks.bench_api --baseline baseline.json --tolerance 15
+
+Results are written as JSON; with --baseline, any endpoint whose p95 latency or throughput is more
+than --tolerance percent worse than the baseline is reported and the exit status is 1.
+
+Requires the packages in benchmarks/requirements.txt.
+"""
+import argparse
+import asyncio
+import json
+import platform
+import random
+import sys
+import time
+from collections import defaultdict
+from contextlib import asynccontextmanager, nullcontext
+from datetime import datetime
+
+import httpx
+
+from app.core.config import settings
+from benchmarks.bench_auth import make_token
+from benchmarks.fixtures import make_customer
+
+ENTITIES = "/api/v1/entities"
+SEED_CHUNK_SIZE = 1000
+DEFAULT_MIX = "get_by_id=40,get_by_attribute=15,update=15,create=10,history=10,list=10"
+
+
+def parse_mix(mix: str) -> dict:
+    weights = {}
+    for item in mix.split(","):
+        name, _, weight = item.partition("=")
+        if name not in OPERATIONS:
+            raise SystemExit(f"Unknown operation {name!r}; expected one of {', '.join(OPERATIONS)}")
+        weights[name] = float(weight or 1)
+    return weights
+
+
+def percentile(sorted_values: list, pct: float) -> float:
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return 0.0
+    rank = max(0, min(len(sorted_values) - 1, round(pct / 100 * len(sorted_values)) - 1))
+    return sorted_values[rank]
+
+
+class Workload:
+    """Entity ids and emails known to exist, shared by all workers"""
+
+    def __init__(self, rng: random.Random):
+        self.rng = rng
+        self.ids = []
+        self.emails = []
+        self.next_index = 0
+
+    def new_customer(self) -> dict:
+        customer = make_customer(self.next_index, random.Random(self.next_index))
+        self.next_index += 1
+        return customer
+
+    def pick(self) -> int:
+        return self.rng.randrange(len(self.ids))
+
+
+async def op_create(client, workload):
+    customer = workload.new_customer()
+    response = await client.post(f"{ENTITIES}/create_entity/", json=customer)
+    if response.status_code == 200:
+        workload.ids.append(response.json())
+        workload.emails.append(customer["contactInfo"]["email"])
+    return response
+
+
+async def op_get_by_id(client, workload):
+    return await client.get(f"{ENTITIES}/get_entity/id/{workload.ids[workload.pick()]}")
+
+
+async def op_get_by_attribute(client, workload):
+    return await client.get(f"{ENTITIES}/get_entity/contactInfo.email,{workload.emails[workload.pick()]}")
+
+
+async def op_update(client, workload):
+    consent = {"marketing": workload.rng.random() < 0.5, "profiling": workload.rng.random() < 0.5}
+    return await client.patch(f"{ENTITIES}/{workload.ids[workload.pick()]}", json={"consent": consent})
+
+
+async def op_history(client, workload):
+    return await client.get(f"{ENTITIES}/entities/{workload.ids[workload.pick()]}/history")
+
+
+async def op_list(client, workload):
+    return await client.get(f"{ENTITIES}/", params={"limit": 100})
+
+
+OPERATIONS = {
+    "create": op_create,
+    "get_by_id": op_get_by_id,
+    "get_by_attribute": op_get_by_attribute,
+    "update": op_update,
+    "history": op_history,
+    "list": op_list,
+}
+
+
+async def seed(client, workload: Workload, count: int):
+    started = time.perf_counter()
+    while len(workload.ids) < count:
+        rows = [workload.new_customer() for _ in range(min(SEED_CHUNK_SIZE, count - len(workload.ids)))]
+        response = await client.post(f"{ENTITIES}/bulk_create_entity/", json=rows, params={"chunk_size": SEED_CHUNK_SIZE})
+        response.raise_for_status()
+        for result in response.json()["results"]:
+            if result["status"] == "created":
+                workload.ids.append(result["id"])
+                workload.emails.append(rows[result["index"]]["contactInfo"]["email"])
+    print(f"[seed] {count:,} entities in {time.perf_counter() - started:,.1f}s")
+
+
+async def drive(client, workload: Workload, weights: dict, requests: int, concurrency: int) -> tuple[dict, float]:
+    names = list(weights)
+    plan = workload.rng.choices(names, weights=[weights[name] for name in names], k=requests)
+    latencies = defaultdict(list)
+    errors = defaultdict(int)
+    position = 0
+
+    async def worker():
+        nonlocal position
+        while position < len(plan):
+            name = plan[position]
+            position += 1
+            started = time.perf_counter()
+            try:
+                response = await OPERATIONS[name](client, workload)
+                failed = response.status_code >= 400
+            except httpx.HTTPError:
+                failed = True
+            latencies[name].append((time.perf_counter() - started) * 1000)
+            if failed:
+                errors[name] += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    return summarize(latencies, errors, elapsed), elapsed
+
+
+def summarize(latencies: dict, errors: dict, elapsed: float) -> dict:
+    def stats(values: list, error_count: int) -> dict:
+        values = sorted(values)
+        return {
+            "count": len(values),
+            "errors": error_count,
+            "throughput_rps": round(len(values) / elapsed, 1),
+            "mean_ms": round(sum(values) / len(values), 3) if values else 0.0,
+            "p50_ms": round(percentile(values, 50), 3),
+            "p95_ms": round(percentile(values, 95), 3),
+            "p99_ms": round(percentile(values, 99), 3),
+            "max_ms": round(values[-1], 3) if values else 0.0,
+        }
+
+    summary = {name: stats(values, errors[name]) for name, values in sorted(latencies.items())}
+    summary["overall"] = stats([v for values in latencies.values() for v in values], sum(errors.values()))
+    return summary
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> list[str]:
+    """Return a line per endpoint whose p95 latency or throughput regressed beyond tolerance percent"""
+    regressions = []
+    for name, current in results["operations"].items():
+        previous = baseline.get("operations", {}).get(name)
+        if not previous:
+            continue
+        if previous["p95_ms"] and current["p95_ms"] > previous["p95_ms"] * (1 + tolerance / 100):
+            regressions.append(f"{name}: p95 {previous['p95_ms']:.2f}ms -> {current['p95_ms']:.2f}ms")
+        if previous["throughput_rps"] and current["throughput_rps"] < previous["throughput_rps"] * (1 - tolerance / 100):
+            regressions.append(f"{name}: throughput {previous['throughput_rps']:,.0f} -> {current['throughput_rps']:,.0f} req/s")
+    return regressions
+
+
+@asynccontextmanager
+async def in_process_client(args, headers: dict):
+    from app.core.database import mongodb
+    from app.main import app
+
+    if args.in_memory:
+        from mongomock_motor import AsyncMongoMockClient, AsyncMongoMockCollection
+
+        # mongomock-motor's with_options returns an unwrapped sync collection; there is no
+        # replica set to route heavy reads to, so keep the async collection as is
+        AsyncMongoMockCollection.with_options = lambda self, **options: self
+        # The rollup writes are UpdateOne batches, which PyMongo hands to the bulk builder with a sort
+        # argument mongomock does not accept; rollups are not part of the measured paths
+        settings.AGGREGATES_ENABLED = False
+        # mongomock has no sessions; a single in-memory node is consistent anyway, so the causal and
+        # snapshot sessions the history reads open become no-ops
+        async def start_session(self, **options):
+            return nullcontext()
+        AsyncMongoMockClient.start_session = start_session
+
+        def connect():
+            mongodb.client = AsyncMongoMockClient()
+            mongodb.db = mongodb.client[settings.MONGO_DB]
+        mongodb.connect = connect
+    else:
+        settings.MONGO_DB = f"{settings.MONGO_DB}_bench_api"
+
+    async with app.router.lifespan_context(app):
+        try:
+            transport = httpx.ASGITransport(app=app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://bench", headers=headers, timeout=args.timeout) as client:
+                yield client
+        finally:
+            if not args.in_memory:
+                await mongodb.client.drop_database(settings.MONGO_DB)
+
+
+@asynccontextmanager
+async def remote_client(args, headers: dict):
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    async with httpx.AsyncClient(base_url=args.base_url, headers=headers, timeout=args.timeout, limits=limits) as client:
+        yield client
+
+
+async def main(args):
+    weights = parse_mix(args.mix)
+    headers = {"Authorization": f"Bearer {make_token('bench')}"}
+    workload = Workload(random.Random(args.random_seed))
+    open_client = remote_client if args.base_url else in_process_client
+    async with open_client(args, headers) as client:
+        await seed(client, workload, args.seed)
+        if args.warmup:
+            await drive(client, workload, weights, args.warmup, args.concurrency)
+        operations, elapsed = await drive(client, workload, weights, args.requests, args.concurrency)
+
+    results = {
+        "meta": {
+            "timestamp": datetime.utcnow().isoformat(),
+            "target": args.base_url or ("in-process (in-memory)" if args.in_memory else "in-process"),
+            "python": platform.python_version(),
+            "seed_entities": args.seed,
+            "requests": args.requests,
+            "concurrency": args.concurrency,
+            "mix": weights,
+            "elapsed_seconds": round(elapsed, 3),
+        },
+        "operations": operations,
+    }
+    for name, row in operations.items():
+        print(f"{name:>17}: {row['count']:>7,} req {row['throughput_rps']:>9,.0f} req/s  p50 {row['p50_ms']:8.2f}ms  "
+              f"p95 {row['p95_ms']:8.2f}ms  p99 {row['p99_ms']:8.2f}ms  errors {row['errors']}")
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"[bench] results written to {args.out}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        for line in regressions:
+            print(f"[regression] {line}")
+        if regressions:
+            sys.exit(1)
+        print(f"[bench] no regressions beyond {args.tolerance:g}% of {args.baseline}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--seed", type=int, default=5000, help="entities created before the measured run")
+    parser.add_argument("--requests", type=int, default=20000)
+    parser.add_argument("--warmup", type=int, default=1000, help="unmeasured requests before the run")
+    parser.add_argument("--concurrency", type=int, default=1000)
+    parser.add_argument("--mix", default=DEFAULT_MIX, help="comma-separated operation=weight pairs")
+    parser.add_argument("--base-url", help="drive a running server instead of the in-process app")
+    parser.add_argument("--in-memory", action="store_true", help="run in-process against mongomock-motor")
+    parser.add_argument("--timeout", type=float, default=30.0)
+    parser.add_argument("--random-seed", type=int, default=42)
+    parser.add_argument("--out", help="write results JSON here")
+    parser.add_argument("--baseline", help="results JSON to compare against")
+    parser.add_argument("--tolerance", type=float, default=10.0, help="allowed regression, in percent")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,61 @@
+"""
+Compare bulk ingest throughput against one create_entity call per row.
+
+Runs against the MongoDB configured in .env, in a scratch database that is dropped afterwards:
+
+    python -m benchmarks.bench_bulk_ingest --rows 20000 --chunk-size 1000
+"""
+import argparse
+import asyncio
+import time
+
+from app.core.database import connect_to_mongo, close_mongo_connection, mongodb
+from app.schemas.entity import CustomerCreate
+from app.services.entity import bulk_create_entities, create_entity
+from benchmarks.fixtures import make_customer
+
+
+async def _rows(n: int, offset: int = 0):
+    for i in range(offset, offset + n):
+        yield make_customer(i)
+
+
+async def bench_single(n: int) -> float:
+    started = time.perf_counter()
+    for i in range(n):
+        await create_entity(CustomerCreate.model_validate(make_customer(i)).dict())
+    return n / (time.perf_counter() - started)
+
+
+async def bench_bulk(n: int, chunk_size: int, upsert_key: str = None) -> dict:
+    return await bulk_create_entities(_rows(n), upsert_key=upsert_key, chunk_size=chunk_size)
+
+
+async def main(args):
+    connect_to_mongo()
+    db_name = f"{mongodb.db.name}_bench_bulk"
+    mongodb.db = mongodb.client[db_name]
+    try:
+        single = await bench_single(args.single_rows)
+        print(f"create_entity x{args.single_rows}: {single:,.0f} rows/s")
+
+        await mongodb.db.drop_collection("entities")
+        await mongodb.db.drop_collection("entity_history")
+        result = await bench_bulk(args.rows, args.chunk_size)
+        print(f"bulk insert x{result['total']} (chunk {args.chunk_size}): {result['rows_per_second']:,.0f} rows/s, "
+              f"{result['failed']} failed, {result['rows_per_second'] / single:.1f}x single-row")
+
+        result = await bench_bulk(args.rows, args.chunk_size, upsert_key="identifiers.loyaltyId")
+        print(f"bulk upsert x{result['total']} (all updates): {result['rows_per_second']:,.0f} rows/s, "
+              f"{result['failed']} failed")
+    finally:
+        await mongodb.client.drop_database(db_name)
+        close_mongo_connection()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=20000)
+    parser.add_argument("--single-rows", type=int, default=1000)
+    parser.add_argument("--chunk-size", type=int, default=1000)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,62 @@
+"""
+Typeahead latency of the in-memory prefix index, without the API or MongoDB in the way.
+
+The index is built from synthetic customers and queried with random 1-6 character prefixes of
+names, emails and loyalty ids drawn from the same data:
+
+    python -m benchmarks.bench_search --entities 1000000 --queries 20000
+"""
+import argparse
+import random
+import time
+
+from app.services.search import TypeaheadIndex, normalize_term
+from benchmarks.fixtures import make_customer
+
+
+def percentile(sorted_values: list, pct: float) -> float:
+    rank = max(0, min(len(sorted_values) - 1, round(pct / 100 * len(sorted_values)) - 1))
+    return sorted_values[rank]
+
+
+def build(entities: int) -> tuple[TypeaheadIndex, list[str]]:
+    index = TypeaheadIndex()
+    for terms in index.fields.values():
+        terms.deferred = True
+    sources = []
+    for i in range(entities):
+        customer = make_customer(i, bookings=0)
+        index.add(str(i), customer)
+        if i < 10000:
+            sources.append(normalize_term(customer["personalInfo"]["lastName"]))
+            sources.append(normalize_term(customer["contactInfo"]["email"]))
+            sources.append(normalize_term(customer["identifiers"].get("loyaltyId")))
+    for terms in index.fields.values():
+        terms.build()
+    return index, [source for source in sources if source]
+
+
+def main(args):
+    rng = random.Random(args.random_seed)
+    started = time.perf_counter()
+    index, sources = build(args.entities)
+    print(f"[build] {args.entities:,} entities in {time.perf_counter() - started:,.1f}s: {index.stats()['terms']}")
+
+    queries = [rng.choice(sources)[:rng.randint(1, 6)] for _ in range(args.queries)]
+    latencies = []
+    for query in queries:
+        started = time.perf_counter()
+        index.search(query, args.limit)
+        latencies.append((time.perf_counter() - started) * 1e6)
+    latencies.sort()
+    print(f"search: {len(latencies):,} queries  p50 {percentile(latencies, 50):8.1f}us  "
+          f"p95 {percentile(latencies, 95):8.1f}us  p99 {percentile(latencies, 99):8.1f}us  max {latencies[-1]:8.1f}us")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--entities", type=int, default=100000)
+    parser.add_argument("--queries", type=int, default=20000)
+    parser.add_argument("--limit", type=int, default=10)
+    parser.add_argument("--random-seed", type=int, default=42)
+    main(parser.parse_args())
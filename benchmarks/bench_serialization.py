@@ -0,0 +1,69 @@
+"""
+Encode a large entity list through the default response path and the FAST_SERIALIZATION path.
+
+No database is needed; stored documents are synthesized in memory:
+
+    python -m benchmarks.bench_serialization --entities 10000
+"""
+import argparse
+import asyncio
+from datetime import datetime
+import time
+
+from bson import ObjectId
+from fastapi.responses import JSONResponse
+from fastapi.routing import serialize_response
+from fastapi.utils import create_model_field
+from typing import List
+
+from app.schemas.entity import CustomerCreate, CustomerOut
+from app.utils.serialization import TrustedJSONResponse, trusted_customer
+from benchmarks.fixtures import make_customer
+
+
+def stored_documents(n: int) -> list[dict]:
+    """Documents as list_entities returns them: validated on write, then read back from Mongo"""
+    docs = []
+    for i in range(n):
+        doc = CustomerCreate.model_validate(make_customer(i)).dict()
+        object_id = ObjectId()
+        doc.update({"id": str(object_id), "customerId": str(object_id), "created_at": datetime.utcnow(), "version": 1})
+        docs.append(doc)
+    return docs
+
+
+def default_path(docs: list[dict], field) -> bytes:
+    """What FastAPI does for response_model=List[CustomerOut]: validate, serialize, json.dumps"""
+    content = asyncio.run(serialize_response(field=field, response_content=docs))
+    return JSONResponse(content).body
+
+
+def fast_path(docs: list[dict]) -> bytes:
+    return TrustedJSONResponse([trusted_customer(doc) for doc in docs]).body
+
+
+def timed(fn, repeat: int) -> tuple[float, int]:
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        body = fn()
+        best = min(best, time.perf_counter() - started)
+    return best, len(body)
+
+
+def main(args):
+    docs = stored_documents(args.entities)
+    field = create_model_field(name="Response_get_entities", type_=List[CustomerOut], mode="serialization")
+    default_seconds, default_bytes = timed(lambda: default_path(docs, field), args.repeat)
+    fast_seconds, fast_bytes = timed(lambda: fast_path(docs), args.repeat)
+    print(f"{args.entities} entities, best of {args.repeat}")
+    print(f"response_model + JSONResponse: {default_seconds * 1000:8.1f} ms ({default_bytes:,} bytes)")
+    print(f"trusted + orjson:              {fast_seconds * 1000:8.1f} ms ({fast_bytes:,} bytes), "
+          f"{default_seconds / fast_seconds:.1f}x faster")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--entities", type=int, default=10000)
+    parser.add_argument("--repeat", type=int, default=5)
+    main(parser.parse_args())
@@ -0,0 +1,77 @@
+"""Synthetic but realistic CustomerCreate payloads shared by the benchmark scripts"""
+from datetime import datetime, timedelta
+import random
+
+FIRST_NAMES = ["James", "Mary", "John", "Patricia", "Robert", "Jennifer", "Michael", "Linda", "William", "Elizabeth",
+               "David", "Barbara", "Richard", "Susan", "Joseph", "Jessica", "Thomas", "Sarah", "Charles", "Karen",
+               "Aarav", "Priya", "Wei", "Mei", "Mohammed", "Fatima", "Lucas", "Sofia", "Mateo", "Olivia"]
+LAST_NAMES = ["Smith", "Johnson", "Williams", "Brown", "Jones", "Garcia", "Miller", "Davis", "Rodriguez", "Martinez",
+              "Hernandez", "Lopez", "Gonzalez", "Wilson", "Anderson", "Thomas", "Taylor", "Moore", "Jackson", "Martin",
+              "Sharma", "Patel", "Wang", "Li", "Khan", "Ahmed", "Silva", "Rossi", "Muller", "Dubois"]
+CITIES = [("London", "UK"), ("Manchester", "UK"), ("Paris", "France"), ("Lyon", "France"), ("Berlin", "Germany"),
+          ("Munich", "Germany"), ("Madrid", "Spain"), ("Mumbai", "India"), ("Bengaluru", "India"), ("New York", "USA"),
+          ("Chicago", "USA"), ("Austin", "USA"), ("Toronto", "Canada"), ("Sydney", "Australia"), ("Singapore", "Singapore")]
+SERVICES = ["spa", "dining", "room", "golf", "conference", "fitness"]
+INTERESTS = ["travel", "food", "wellness", "sports", "music", "art", "technology", "fashion"]
+CHANNELS = ["email", "sms", "push", "phone", "in_person"]
+GENDERS = ["male", "female", "other", "prefer_not_to_say"]
+EPOCH = datetime(2020, 1, 1)
+
+
+def make_customer(i: int, rng: random.Random = None, bookings: int = 5) -> dict:
+    """Build the i-th synthetic customer; the same i and seed always produce the same document"""
+    rng = rng or random.Random(i)
+    first = rng.choice(FIRST_NAMES)
+    last = rng.choice(LAST_NAMES)
+    city, country = rng.choice(CITIES)
+    visits = rng.randint(0, 200)
+    lifetime_value = round(rng.uniform(0, 50000), 2)
+    return {
+        "personalInfo": {
+            "firstName": first,
+            "lastName": last,
+            "dateOfBirth": (datetime(1950, 1, 1) + timedelta(days=rng.randint(0, 20000))).isoformat(),
+            "gender": rng.choice(GENDERS),
+            "nationality": country,
+        },
+        "contactInfo": {
+            "email": f"{first.lower()}.{last.lower()}.{i}@example.com",
+            "countryCode": rng.choice(["GBR", "FRA", "DEU", "ESP", "IND", "USA", "CAN", "AUS", "SGP"]),
+            "phoneNumber": f"+{rng.randint(10, 99)}{rng.randint(10**8, 10**9 - 1)}",
+            "address": {
+                "street": f"{rng.randint(1, 999)} High Street",
+                "city": city,
+                "state": None,
+                "postalCode": f"{rng.randint(10000, 99999)}",
+                "country": country,
+            },
+        },
+        "preferences": {
+            "language": rng.choice(["en", "fr", "de", "es", "hi"]),
+            "currency": rng.choice(["GBP", "EUR", "USD", "INR"]),
+            "interests": rng.sample(INTERESTS, rng.randint(0, 3)),
+            "communicationChannels": rng.sample(CHANNELS, rng.randint(1, 2)),
+        },
+        "behavioralData": {
+            "lastVisitDate": (EPOCH + timedelta(days=rng.randint(0, 1800))).isoformat(),
+            "lifetimeValue": lifetime_value,
+            "visitsCount": visits,
+            "averageSpend": round(lifetime_value / visits, 2) if visits else 0.0,
+            "preferredLocation": city,
+            "recentBookings": [
+                {
+                    "bookingId": f"B-{i}-{n}",
+                    "date": (EPOCH + timedelta(days=rng.randint(0, 1800))).isoformat(),
+                    "location": city,
+                    "serviceType": rng.choice(SERVICES),
+                }
+                for n in range(bookings)
+            ],
+        },
+        "consent": {"marketing": rng.random() < 0.5, "profiling": rng.random() < 0.3, "thirdPartySharing": False},
+        "identifiers": {
+            "loyaltyId": f"LOY-{i:09d}",
+            "socialIds": None,
+            "externalSystemIds": [{"system": "crm", "id": f"CRM-{i}"}],
+        },
+    }
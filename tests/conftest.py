@@ -0,0 +1,87 @@
+"""
+Shared fixtures: the app runs in-process against mongomock-motor, with a fresh in-memory database per test.
+
+    pip install -r tests/requirements.txt
+    python -m pytest -q
+"""
+import os
+
+os.environ.setdefault("MONGO_URI", "mongodb://localhost:27017")
+os.environ.setdefault("MONGO_DB", "mdm_test")
+os.environ.setdefault("SECRET_KEY", "test-secret-key-of-at-least-32-bytes")
+os.environ.setdefault("ALGORITHM", "HS256")
+os.environ.setdefault("ACCESS_TOKEN_EXPIRE_MINUTES", "30")
+
+from contextlib import nullcontext
+
+import mongomock.collection
+import pytest
+from fastapi.testclient import TestClient
+from mongomock_motor import AsyncMongoMockClient, AsyncMongoMockCollection
+
+from app.core.database import MongoDB, mongodb
+from app.main import app
+from app.services.entity_types import schema_registry
+from app.services.matching import matching_index
+from app.services.search import search_index
+from benchmarks.fixtures import make_customer
+
+ENTITIES = "/api/v1/entities"
+
+
+def _without_sort(add):
+    # PyMongo passes UpdateOne/ReplaceOne's sort option to the bulk builder, which mongomock does not accept
+    def wrapped(self, *args, sort=None, **kwargs):
+        return add(self, *args, **kwargs)
+    return wrapped
+
+
+@pytest.fixture
+def in_memory_mongo(monkeypatch):
+    def connect(self):
+        self.client = AsyncMongoMockClient()
+        self.db = self.client[os.environ["MONGO_DB"]]
+
+    async def start_session(self, **options):
+        # A single in-memory node is always consistent, so causal and snapshot sessions are no-ops
+        return nullcontext()
+
+    builder = mongomock.collection.BulkOperationBuilder
+    monkeypatch.setattr(MongoDB, "connect", connect)
+    monkeypatch.setattr(AsyncMongoMockClient, "start_session", start_session, raising=False)
+    # with_options would return mongomock's sync collection; there are no secondaries to route reads to
+    monkeypatch.setattr(AsyncMongoMockCollection, "with_options", lambda self, **options: self, raising=False)
+    monkeypatch.setattr(builder, "add_update", _without_sort(builder.add_update))
+    monkeypatch.setattr(builder, "add_replace", _without_sort(builder.add_replace))
+    # Compiled schemas are cached per process and would outlive the database they were read from
+    schema_registry.validators.clear()
+    schema_registry.latest.clear()
+    # So are the in-memory matching and typeahead indexes; start each test from empty ones
+    matching_index.__init__()
+    search_index.__init__()
+
+
+@pytest.fixture
+def client(in_memory_mongo):
+    with TestClient(app) as test_client:
+        test_client.post("/api/v1/signup", json={"username": "alice", "email": "alice@example.com", "password": "secret1"})
+        token = test_client.post("/api/v1/login", json={"username": "alice", "password": "secret1"}).json()["access_token"]
+        test_client.headers["Authorization"] = f"Bearer {token}"
+        yield test_client
+        # mongomock clients share one in-memory server per process
+        test_client.portal.call(mongodb.client.drop_database, mongodb.db.name)
+
+
+@pytest.fixture
+def db(client):
+    return mongodb.db
+
+
+@pytest.fixture
+def create(client):
+    """Create the i-th synthetic customer through the API and return its id"""
+    def create_customer(i: int, **overrides) -> str:
+        response = client.post(f"{ENTITIES}/create_entity/", json={**make_customer(i), **overrides})
+        assert response.status_code == 200, response.text
+        return response.json()
+    return create_customer
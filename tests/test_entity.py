@@ -0,0 +1,569 @@
+from datetime import datetime
+import json
+import time
+from types import SimpleNamespace
+from unittest.mock import MagicMock
+
+import pytest
+from bson import ObjectId
+from jose import jwt
+from mongomock_motor import AsyncMongoMockCollection
+from pymongo.errors import OperationFailure
+
+import app.core.cache as cache_module
+import app.core.database as database_module
+import app.core.metrics as metrics_module
+import app.services.entity as entity_service
+from app.api.v1.endpoints import token as token_endpoint
+from app.api.v1.endpoints.token import _verify_token, token_cache
+from app.core.cache import InMemoryVersionBackend, VersionedCache
+from app.core.config import settings
+from app.core.database import MongoDB
+from app.core.indexes import ensure_indexes
+from app.rebuild_aggregates import rebuild
+from app.schemas.query import EntityQuery
+from app.services.matching import MatchingIndex
+from app.services.purge import tombstone_purger
+from app.services.query import compile_filter
+from app.services.search import PrefixList
+from benchmarks.fixtures import make_customer
+from tests.conftest import ENTITIES
+
+# The real connect, before the in_memory_mongo fixture swaps it for mongomock
+mongo_connect = MongoDB.connect
+
+
+def _bulk(client, rows, **params):
+    response = client.post(f"{ENTITIES}/bulk_create_entity/", json=rows, params=params)
+    assert response.status_code == 200, response.text
+    return response.json()
+
+
+# Bulk create / upsert
+
+def test_bulk_create_reports_each_row(client):
+    rows = [make_customer(i) for i in range(3)] + [{"personalInfo": {}}]
+    result = _bulk(client, rows, chunk_size=2)
+    assert (result["total"], result["created"], result["failed"]) == (4, 3, 1)
+    assert [row["status"] for row in result["results"]] == ["created", "created", "created", "error"]
+    assert result["results"][3]["index"] == 3
+
+
+def test_bulk_upsert_updates_matching_rows_and_records_history(client):
+    rows = [make_customer(i) for i in range(2)]
+    created = _bulk(client, rows)["results"]
+    changed = [{**rows[0], "consent": {"marketing": True}}, make_customer(2)]
+    result = _bulk(client, changed, upsert_key="contactInfo.email")
+    assert (result["created"], result["updated"]) == (1, 1)
+    assert result["results"][0]["id"] == created[0]["id"]
+
+    entity = client.get(f"{ENTITIES}/get_entity/id/{created[0]['id']}").json()
+    assert entity["version"] == 2
+    assert entity["consent"]["marketing"] is True
+    history = client.get(f"{ENTITIES}/entities/{created[0]['id']}/history").json()
+    assert [(record["version"], record["operation"]) for record in history] == [(1, "create"), (2, "update")]
+
+
+def test_bulk_upsert_rejects_duplicate_keys_in_one_batch(client):
+    row = make_customer(0)
+    result = _bulk(client, [row, row], upsert_key="contactInfo.email")
+    assert result["results"][1]["status"] == "error"
+    assert "Duplicate" in result["results"][1]["error"]
+
+
+def test_bulk_upsert_reports_concurrent_update_as_row_conflict(client, db, monkeypatch):
+    rows = [make_customer(i) for i in range(2)]
+    ids = [client.post(f"{ENTITIES}/create_entity/", json=row).json() for row in rows]
+    bulk_write = AsyncMongoMockCollection.bulk_write
+
+    async def racing(self, operations, **options):
+        # Another writer bumps the version between the upsert's read and its write
+        await db.entities.update_one({"_id": ObjectId(ids[1])}, {"$inc": {"version": 1}})
+        return await bulk_write(self, operations, **options)
+
+    monkeypatch.setattr(AsyncMongoMockCollection, "bulk_write", racing)
+    result = _bulk(client, [{**row, "consent": {"marketing": True}} for row in rows], upsert_key="contactInfo.email")
+    monkeypatch.setattr(AsyncMongoMockCollection, "bulk_write", bulk_write)
+
+    assert (result["updated"], result["failed"]) == (1, 1)
+    assert "modified concurrently" in result["results"][1]["error"]
+    assert client.get(f"{ENTITIES}/get_entity/id/{ids[1]}").json()["version"] == 2
+    assert client.portal.call(db.entities.count_documents, {}) == 2
+
+
+def test_bulk_ndjson_reports_unparseable_lines(client):
+    body = json.dumps(make_customer(0)) + "\nnot json\n"
+    response = client.post(f"{ENTITIES}/bulk_create_entity/", content=body, headers={"content-type": "application/x-ndjson"})
+    result = response.json()
+    assert (result["created"], result["failed"]) == (1, 1)
+
+
+# Keyset pagination
+
+def test_keyset_cursor_walks_every_entity_once(client, create):
+    ids = [create(i) for i in range(5)]
+    seen, after = [], None
+    while True:
+        params = {"limit": 2} if after is None else {"limit": 2, "after": after}
+        response = client.get(f"{ENTITIES}/", params=params)
+        seen += [entity["_id"] for entity in response.json()]
+        after = response.headers.get("x-next-cursor")
+        if after is None:
+            break
+    assert seen == ids
+
+
+def test_keyset_cursor_rejects_malformed_cursor(client):
+    assert client.get(f"{ENTITIES}/", params={"after": "zzz"}).status_code == 400
+
+
+def _stream(client, **params) -> list:
+    response = client.get(f"{ENTITIES}/", params={"stream": True, **params})
+    assert response.headers["content-type"] == "application/x-ndjson"
+    return [json.loads(line) for line in response.text.splitlines()]
+
+
+def test_stream_rows_are_shaped_like_the_paged_list(client, create):
+    for i in range(3):
+        create(i)
+    rows = _stream(client)
+    assert rows == client.get(f"{ENTITIES}/").json()
+    assert not {"deleted", "created_at"} & rows[0].keys()
+    assert _stream(client, fields="contactInfo.email", limit=2) == [
+        {"_id": row["_id"], "contactInfo": {"email": row["contactInfo"]["email"]}} for row in rows[:2]
+    ]
+
+
+# ETag / If-Match / If-None-Match
+
+def test_if_match_applies_update_on_current_version(client, create):
+    entity_id = create(0)
+    etag = client.get(f"{ENTITIES}/get_entity/id/{entity_id}").headers["etag"]
+    response = client.patch(f"{ENTITIES}/{entity_id}", json={"consent": {"marketing": True}}, headers={"If-Match": etag})
+    assert response.status_code == 200
+    assert response.json()["version"] == 2
+    assert response.headers["etag"] != etag
+
+
+def test_if_match_on_stale_version_conflicts(client, create):
+    entity_id = create(0)
+    stale = client.get(f"{ENTITIES}/get_entity/id/{entity_id}").headers["etag"]
+    client.patch(f"{ENTITIES}/{entity_id}", json={"consent": {"marketing": True}})
+    response = client.patch(f"{ENTITIES}/{entity_id}", json={"consent": {"profiling": True}}, headers={"If-Match": stale})
+    assert response.status_code == 409
+    assert client.get(f"{ENTITIES}/get_entity/id/{entity_id}").json()["consent"]["profiling"] is False
+
+
+def test_if_none_match_returns_304_until_entity_changes(client, create):
+    entity_id = create(0)
+    url = f"{ENTITIES}/get_entity/id/{entity_id}"
+    etag = client.get(url).headers["etag"]
+    not_modified = client.get(url, headers={"If-None-Match": etag})
+    assert not_modified.status_code == 304
+    assert not_modified.content == b""
+
+    client.patch(f"{ENTITIES}/{entity_id}", json={"consent": {"marketing": True}})
+    assert client.get(url, headers={"If-None-Match": etag}).status_code == 200
+
+
+def test_projected_reads_have_their_own_etag(client, create):
+    entity_id = create(0)
+    url = f"{ENTITIES}/get_entity/id/{entity_id}"
+    full = client.get(url).headers["etag"]
+    projected = client.get(url, params={"fields": "contactInfo.email"}).headers["etag"]
+    assert full != projected
+    assert client.get(url, params={"fields": "contactInfo.email"}, headers={"If-None-Match": full}).status_code == 200
+
+
+def test_list_page_etag_changes_when_a_member_changes(client, create):
+    ids = [create(i) for i in range(3)]
+    etag = client.get(f"{ENTITIES}/", params={"limit": 2}).headers["etag"]
+    assert client.get(f"{ENTITIES}/", params={"limit": 2}, headers={"If-None-Match": etag}).status_code == 304
+    client.patch(f"{ENTITIES}/{ids[1]}", json={"consent": {"marketing": True}})
+    assert client.get(f"{ENTITIES}/", params={"limit": 2}, headers={"If-None-Match": etag}).status_code == 200
+
+
+# Entity cache
+
+@pytest.fixture
+def cache(monkeypatch):
+    """The entity cache switched on, starting empty"""
+    cache = VersionedCache(maxsize=100, ttl=60)
+    monkeypatch.setattr(entity_service, "entity_cache", cache)
+    return cache
+
+
+def test_writes_invalidate_cached_entities(client, create, cache):
+    entity_id = create(0)
+    url = f"{ENTITIES}/get_entity/id/{entity_id}"
+    client.get(url)
+    assert client.get(url).json()["version"] == 1
+    assert cache.stats()["hits"] >= 1
+
+    client.patch(f"{ENTITIES}/{entity_id}", json={"consent": {"marketing": True}})
+    entity = client.get(url).json()
+    assert (entity["version"], entity["consent"]["marketing"]) == (2, True)
+
+    assert client.delete(f"{ENTITIES}/delete_entity/{entity_id}").status_code == 200
+    assert client.get(url).status_code == 404
+
+
+def test_cache_refuses_versions_older_than_the_last_write(client, cache):
+    client.portal.call(cache.invalidate, "a", 3)
+    client.portal.call(cache.set, "a", {"id": "a", "version": 2})
+    assert client.portal.call(cache.get, "a") is None
+    client.portal.call(cache.set, "a", {"id": "a", "version": 3})
+    assert client.portal.call(cache.get, "a")["version"] == 3
+
+
+def test_shared_backend_invalidates_other_workers(client):
+    backend = InMemoryVersionBackend()
+    workers = [VersionedCache(maxsize=10, ttl=60, backend=backend) for _ in range(2)]
+    for worker in workers:
+        client.portal.call(worker.set, "a", {"id": "a", "version": 1})
+    client.portal.call(workers[0].invalidate, "a", 2)
+    assert client.portal.call(workers[1].get, "a") is None
+    assert workers[1].stats()["stale"] == 1
+
+
+# Structured queries
+
+def _query(client, where: dict, **options):
+    return client.post(f"{ENTITIES}/query/", json={"where": where, **options})
+
+
+def test_query_filters_compile_with_schema_types():
+    where = EntityQuery.model_validate({"where": {"and": [
+        {"field": "behavioralData.visitsCount", "op": "gte", "value": "5"},
+        {"or": [
+            {"field": "contactInfo.email", "value": "a@example.com"},
+            {"field": "personalInfo.dateOfBirth", "op": "lt", "value": "1990-01-01T00:00:00"},
+        ]},
+    ]}}).where
+    assert compile_filter(where) == {"$and": [
+        {"behavioralData.visitsCount": {"$gte": 5}},
+        {"$or": [{"contactInfo.email": "a@example.com"}, {"personalInfo.dateOfBirth": {"$lt": datetime(1990, 1, 1)}}]},
+    ]}
+
+
+def test_query_runs_on_indexed_fields_and_sorts(client, create):
+    ids = [create(i) for i in range(3)]
+    emails = [make_customer(i)["contactInfo"]["email"] for i in range(3)]
+    response = _query(client, {"field": "contactInfo.email", "op": "in", "value": emails[:2]}, sort=[{"field": "_id", "direction": "desc"}])
+    assert response.status_code == 200, response.text
+    assert [item["_id"] for item in response.json()["items"]] == ids[1::-1]
+
+
+def test_query_rejects_unindexed_scans_unless_allowed(client, create):
+    for i in range(3):
+        create(i)
+    visits = {"field": "behavioralData.visitsCount", "op": "gte", "value": 0}
+    response = _query(client, visits)
+    assert response.status_code == 400
+    assert "contactInfo.email" in response.json()["detail"]
+    assert "_id" not in response.json()["detail"] and "deleted_at" not in response.json()["detail"]
+
+    email = {"field": "contactInfo.email", "value": make_customer(0)["contactInfo"]["email"]}
+    assert _query(client, {"or": [email, visits]}).status_code == 400
+    assert _query(client, {"and": [email, visits]}).json()["count"] == 1
+    assert _query(client, visits, allow_scan=True).json()["count"] == 3
+
+
+def test_query_rejects_unknown_fields_and_mistyped_values(client):
+    assert _query(client, {"field": "password", "value": "x"}).status_code == 400
+    assert _query(client, {"field": "contactInfo.address.city", "op": "gt", "value": "A"}, allow_scan=True).status_code == 400
+    assert _query(client, {"field": "behavioralData.visitsCount", "value": "many"}, allow_scan=True).status_code == 400
+    assert _query(client, {"field": "contactInfo.email", "op": "in", "value": "a@example.com"}).status_code == 400
+    assert _query(client, {"field": "contactInfo.email", "value": "a@example.com"}, sort=[{"field": "password"}]).status_code == 400
+
+
+# Soft delete
+
+def test_deleted_entity_disappears_from_reads(client, create):
+    ids = [create(i) for i in range(2)]
+    email = make_customer(0)["contactInfo"]["email"]
+    assert client.delete(f"{ENTITIES}/delete_entity/{ids[0]}").status_code == 200
+    assert client.delete(f"{ENTITIES}/delete_entity/{ids[0]}").status_code == 404
+    assert client.get(f"{ENTITIES}/get_entity/id/{ids[0]}").status_code == 404
+    assert client.get(f"{ENTITIES}/get_entity/contactInfo.email,{email}").status_code == 404
+    assert client.patch(f"{ENTITIES}/{ids[0]}", json={"consent": {"marketing": True}}).status_code == 404
+    assert [entity["_id"] for entity in client.get(f"{ENTITIES}/").json()] == [ids[1]]
+
+
+def test_delete_keeps_a_tombstone_and_history(client, db, create):
+    entity_id = create(0)
+    client.delete(f"{ENTITIES}/delete_entity/{entity_id}")
+    tombstone = client.portal.call(db.entities.find_one, {"_id": ObjectId(entity_id)})
+    assert tombstone["deleted"] is True
+    assert tombstone["version"] == 2
+    history = client.get(f"{ENTITIES}/entities/{entity_id}/history").json()
+    assert [record["operation"] for record in history] == ["create", "delete"]
+
+
+def test_purge_archives_tombstones_past_retention(client, db, create, monkeypatch):
+    ids = [create(i) for i in range(2)]
+    client.delete(f"{ENTITIES}/delete_entity/{ids[0]}")
+    assert client.portal.call(tombstone_purger.purge) == 0
+
+    monkeypatch.setattr(settings, "SOFT_DELETE_RETENTION_DAYS", -1)
+    monkeypatch.setattr(settings, "PURGE_BATCH_PAUSE_SECONDS", 0)
+    assert client.portal.call(tombstone_purger.purge) == 1
+    assert client.portal.call(db.entities.count_documents, {}) == 1
+    assert client.portal.call(db.entities_archive.count_documents, {"_id": ObjectId(ids[0])}) == 1
+    assert client.portal.call(db.entity_history.count_documents, {"entity_id": ObjectId(ids[0])}) == 0
+
+
+def _index_names(client, collection) -> set:
+    return set(client.portal.call(collection.index_information))
+
+
+def test_startup_replaces_pre_soft_delete_indexes(client, db):
+    client.portal.call(lambda: db.entities.create_index("customerId", name="customerId_1"))
+    client.portal.call(ensure_indexes, db)
+    names = _index_names(client, db.entities)
+    assert "customerId_1_live" in names
+    assert "customerId_1" not in names
+
+
+def test_index_failures_are_handled_per_index(client, db, monkeypatch):
+    create_indexes = AsyncMongoMockCollection.create_indexes
+
+    async def like_the_server(self, models, **options):
+        # A real server refuses a second index on the same keys, and here one definition is broken
+        info = await self.index_information()
+        for model in models:
+            keys = list(model.document["key"].items())
+            if model.document["name"] == "entity_id_1_version_1" or any(index["key"] == keys for index in info.values()):
+                raise OperationFailure("Index already exists with a different name", code=85)
+        return await create_indexes(self, models, **options)
+
+    monkeypatch.setattr(AsyncMongoMockCollection, "create_indexes", like_the_server, raising=False)
+    client.portal.call(db.entities.drop_indexes)
+    client.portal.call(lambda: db.entities.create_index("contactInfo.email", name="contactInfo.email_1"))
+    client.portal.call(ensure_indexes, db)
+
+    names = _index_names(client, db.entities)
+    assert {"contactInfo.email_1_live", "customerId_1_live", "deleted_at_1_tombstones"} <= names
+    assert "contactInfo.email_1" not in names
+    assert "entity_id_1_timestamp_1_version_1" in _index_names(client, db.entity_history)
+
+
+# Matching
+
+def _match(client, customer: dict, **params) -> list:
+    response = client.post(f"{ENTITIES}/match_entity/", json=customer, params=params)
+    assert response.status_code == 200, response.text
+    return response.json()["matches"]
+
+
+def test_normalized_email_matches_deterministically(client, create):
+    entity_id = create(0)
+    customer = make_customer(0)
+    local, domain = customer["contactInfo"]["email"].split("@")
+    duplicate = {**make_customer(1), "contactInfo": {**customer["contactInfo"], "email": f"{local.upper()}+promo@{domain}"}}
+    matches = _match(client, duplicate)
+    assert [(match["id"], match["rule"], match["score"]) for match in matches] == [(entity_id, "deterministic", 1.0)]
+    assert "email" in matches[0]["matched_on"]
+
+
+def test_misspelled_name_with_same_birth_date_matches_fuzzily(client, create):
+    personal = {**make_customer(0)["personalInfo"], "firstName": "Katherine", "lastName": "Johnson"}
+    entity_id = create(0, personalInfo=personal)
+    create(1)
+    misspelled = {**make_customer(2), "personalInfo": {**personal, "firstName": "Katharine"}}
+    matches = _match(client, misspelled, threshold=0.5)
+    assert [(match["id"], match["rule"]) for match in matches] == [(entity_id, "fuzzy")]
+    assert {"name", "dob"} <= set(matches[0]["matched_on"])
+    assert _match(client, {**misspelled, "personalInfo": {**personal, "firstName": "Bob", "lastName": "Smith"}}, threshold=0.5) == []
+
+
+def test_create_reports_duplicates_and_delete_unindexes(client, create):
+    entity_id = create(0)
+    response = client.post(f"{ENTITIES}/create_entity/", json=make_customer(0), params={"include_matches": True}).json()
+    assert [match["id"] for match in response["matches"]] == [entity_id]
+    client.delete(f"{ENTITIES}/delete_entity/{entity_id}")
+    assert entity_id not in [match["id"] for match in _match(client, make_customer(0))]
+
+
+def test_oversized_name_blocks_are_skipped_but_identifiers_are_not():
+    index = MatchingIndex(max_block_size=1)
+    personal = {"firstName": "Ann", "lastName": "Lee", "dateOfBirth": "1980-01-01"}
+    for i in range(2):
+        index.add(f"e{i}", {"personalInfo": personal, "contactInfo": {"email": f"ann{i}@example.com"}})
+    assert index.match({"personalInfo": personal}, threshold=0) == []
+    assert [match["id"] for match in index.match({"contactInfo": {"email": "ann1@example.com"}})] == ["e1"]
+
+
+# Aggregate rollups
+
+AGGREGATES = "/api/v1/analytics/aggregates"
+
+
+def _in_city(i: int, city: str, visits: int) -> dict:
+    customer = make_customer(i)
+    return {
+        **customer,
+        "contactInfo": {**customer["contactInfo"], "address": {**customer["contactInfo"]["address"], "city": city}},
+        "behavioralData": {**customer["behavioralData"], "visitsCount": visits},
+    }
+
+
+def _rollup(client, city: str) -> dict:
+    return client.get(f"{AGGREGATES}/city/{city}").json()
+
+
+def test_rollups_follow_creates_updates_and_deletes(client):
+    ids = [client.post(f"{ENTITIES}/create_entity/", json=_in_city(i, "Atlantis", 10 * (i + 1))).json() for i in range(3)]
+    rollup = _rollup(client, "Atlantis")
+    assert rollup["entities"] == 3
+    assert rollup["metrics"]["visitsCount"] == {"sum": 60, "count": 3, "mean": 20.0}
+
+    moved = _in_city(0, "Lemuria", 10)
+    client.patch(f"{ENTITIES}/{ids[0]}", json={"contactInfo": moved["contactInfo"]})
+    client.delete(f"{ENTITIES}/delete_entity/{ids[1]}")
+    assert _rollup(client, "Atlantis")["metrics"]["visitsCount"]["sum"] == 30
+    assert _rollup(client, "Lemuria")["entities"] == 1
+    assert [rollup["value"] for rollup in client.get(f"{AGGREGATES}/city", params={"limit": 2}).json()] == ["Atlantis", "Lemuria"]
+
+
+def test_rebuild_corrects_drift_with_increments(client, db):
+    for i in range(2):
+        client.post(f"{ENTITIES}/create_entity/", json=_in_city(i, "Atlantis", 5))
+    aggregates = db.entity_aggregates
+    client.portal.call(aggregates.update_one, {"_id": "city:Atlantis"}, {"$inc": {"entities": 3, "sums.visitsCount": -5}})
+    client.portal.call(aggregates.insert_one, {"_id": "city:Nowhere", "dimension": "city", "value": "Nowhere", "entities": 1})
+
+    drift = client.portal.call(rebuild, True, 1e-6)
+    assert {(key, counter) for key, counter, *_ in drift} >= {("city:Atlantis", "entities"), ("city:Atlantis", "sums.visitsCount"), ("city:Nowhere", "entities")}
+    assert _rollup(client, "Atlantis")["entities"] == 5
+
+    client.portal.call(rebuild, False, 1e-6)
+    assert client.portal.call(rebuild, True, 1e-6) == []
+    rollup = _rollup(client, "Atlantis")
+    assert (rollup["entities"], rollup["metrics"]["visitsCount"]["sum"]) == (2, 10)
+    assert client.portal.call(aggregates.find_one, {"_id": "city:Nowhere"}) is None
+
+
+def test_rollups_reject_unknown_dimensions(client):
+    assert client.get(f"{AGGREGATES}/shoeSize").status_code == 400
+    assert client.get(f"{AGGREGATES}/city/Atlantis").status_code == 404
+
+
+# Typeahead search
+
+def _search(client, q: str, **params) -> list:
+    response = client.get(f"{ENTITIES}/search/", params={"q": q, **params})
+    assert response.status_code == 200, response.text
+    return response.json()["hits"]
+
+
+def test_search_finds_entities_by_prefix(client, create):
+    entity_id = create(0, personalInfo={**make_customer(0)["personalInfo"], "firstName": "Zelda", "lastName": "Quartermain"})
+    create(1)
+    hits = _search(client, "quarter")
+    assert [(hit["id"], hit["matched_field"]) for hit in hits] == [(entity_id, "lastName")]
+    assert [hit["id"] for hit in _search(client, "Zelda Q")] == [entity_id]
+    assert _search(client, "quarter", fields="email") == []
+
+
+def test_search_ranks_exact_identifier_first(client, create):
+    ids = [create(i, identifiers={**make_customer(i)["identifiers"], "loyaltyId": f"LY-{i}"}) for i in (1, 10, 11)]
+    hits = _search(client, "LY-1")
+    assert hits[0]["id"] == ids[0]
+    assert {hit["id"] for hit in hits} == set(ids)
+    assert hits[0]["score"] > hits[1]["score"]
+
+
+def test_search_follows_updates_and_deletes(client, create):
+    customer = make_customer(0)
+    entity_id = create(0)
+    client.patch(f"{ENTITIES}/{entity_id}", json={"personalInfo": {**customer["personalInfo"], "lastName": "Yggdrasil"}})
+    assert [hit["id"] for hit in _search(client, "yggd")] == [entity_id]
+    assert _search(client, customer["personalInfo"]["lastName"], fields="lastName") == []
+    client.delete(f"{ENTITIES}/delete_entity/{entity_id}")
+    assert _search(client, "yggd") == []
+
+
+def test_search_rejects_unknown_fields(client):
+    assert client.get(f"{ENTITIES}/search/", params={"q": "a", "fields": "phone"}).status_code == 400
+
+
+def test_prefix_list_bulk_build_matches_incremental_adds():
+    incremental, bulk = PrefixList(), PrefixList()
+    bulk.deferred = True
+    for i, term in enumerate(["bob", "alice", "bobby", "al", "carol", "bob"]):
+        incremental.add(term, str(i))
+        bulk.add(term, str(i))
+    for prefix_list in (incremental, bulk):
+        prefix_list.remove("carol", "4")
+    bulk.build()
+    assert list(bulk.terms) == list(incremental.terms) == ["al", "alice", "bob", "bobby"]
+    assert [term for term, _ in incremental.prefix("bo", 10)] == ["bob", "bobby"]
+    assert [term for term, _ in incremental.prefix("a", 1)] == ["al"]
+    assert dict(incremental.prefix("bob", 1))["bob"] == {"0", "5"}
+
+
+# Token verification cache
+
+def _token(subject: str, lifetime: float) -> str:
+    return jwt.encode({"sub": subject, "exp": int(time.time() + lifetime)}, settings.SECRET_KEY, algorithm=settings.ALGORITHM)
+
+
+def _counting_decode(monkeypatch) -> list:
+    calls = []
+    decode = token_endpoint.jwt.decode
+
+    def counting(*args, **kwargs):
+        calls.append(1)
+        return decode(*args, **kwargs)
+
+    monkeypatch.setattr(token_endpoint.jwt, "decode", counting)
+    return calls
+
+
+def test_verified_token_is_served_from_cache(monkeypatch):
+    token_cache.clear()
+    calls = _counting_decode(monkeypatch)
+    token = _token("bob", 600)
+    assert [_verify_token(token) for _ in range(3)] == ["bob"] * 3
+    assert len(calls) == 1
+
+
+def test_cached_token_expires_with_the_token(monkeypatch):
+    token_cache.clear()
+    calls = _counting_decode(monkeypatch)
+    token = _token("bob", 120)
+    _verify_token(token)
+    monotonic = cache_module.time.monotonic
+    monkeypatch.setattr(cache_module, "time", SimpleNamespace(monotonic=lambda: monotonic() + 121))
+    _verify_token(token)
+    assert len(calls) == 2
+
+
+def test_expired_and_forged_tokens_are_rejected(client):
+    headers = {"Authorization": f"Bearer {_token('bob', -10)}"}
+    assert client.get(f"{ENTITIES}/", headers=headers).status_code == 401
+    forged = jwt.encode({"sub": "bob", "exp": int(time.time() + 600)}, "not-the-secret-key-not-the-secret-key", algorithm=settings.ALGORITHM)
+    assert client.get(f"{ENTITIES}/", headers={"Authorization": f"Bearer {forged}"}).status_code == 401
+    assert client.get(f"{ENTITIES}/").status_code == 200
+
+
+# Request metrics
+
+def test_response_validation_is_timed_in_its_own_phase(client, create, monkeypatch):
+    entity_id = create(0)
+    timed = []
+    monkeypatch.setattr(metrics_module, "record_validation", timed.append)
+    entity = client.get(f"{ENTITIES}/get_entity/id/{entity_id}").json()
+    assert entity["_id"] == entity_id
+    assert len(timed) == 1
+    assert 'phase="validation"' in client.get("/metrics").text
+
+
+def test_pool_stats_are_tracked_with_request_metrics_off(monkeypatch):
+    options = {}
+    monkeypatch.setattr(settings, "METRICS_ENABLED", False)
+    monkeypatch.setattr(database_module, "AsyncIOMotorClient", lambda uri, **kwargs: options.update(kwargs) or MagicMock())
+    mongo = MongoDB()
+    mongo_connect(mongo)
+    assert options["event_listeners"] == [mongo.pool_listener]
@@ -0,0 +1,94 @@
+import pytest
+
+from app.services.entity_types import schema_registry
+
+TYPES = "/api/v1/types"
+ORDER_FIELDS = {
+    "orderId": {"type": "string", "required": True, "pattern": "^O-[0-9]+$"},
+    "email": {"type": "email", "required": True},
+    "status": {"type": "string", "enum": ["open", "paid"]},
+    "total": {"type": "number", "ge": 0},
+    "lines": {
+        "type": "array",
+        "min_length": 1,
+        "items": {"type": "object", "fields": {"sku": {"type": "string", "required": True}, "quantity": {"type": "integer", "ge": 1}}},
+    },
+}
+
+
+def _order(i: int, **overrides) -> dict:
+    return {"orderId": f"O-{i}", "email": f"Buyer{i}@Example.com", "status": "open", "total": 10.0, "lines": [{"sku": "A", "quantity": 1}], **overrides}
+
+
+@pytest.fixture
+def order_type(client):
+    response = client.post(f"{TYPES}/order/schemas", json={"description": "orders", "fields": ORDER_FIELDS})
+    assert response.status_code == 200, response.text
+    return response.json()
+
+
+def test_register_assigns_increasing_versions(client, order_type):
+    assert order_type["version"] == 1
+    second = client.post(f"{TYPES}/order/schemas", json={"fields": {**ORDER_FIELDS, "note": {"type": "string"}}}).json()
+    assert second["version"] == 2
+    assert client.get(f"{TYPES}/order/schemas", params={"version": 1}).json()["fields"].keys() == ORDER_FIELDS.keys()
+    assert "note" in client.get(f"{TYPES}/order/schemas").json()["fields"]
+    assert [(entry["name"], entry["version"]) for entry in client.get(f"{TYPES}/").json()] == [("order", 2)]
+
+
+@pytest.mark.parametrize("name", ["customer", "archive", "history", "Order", "1order", "a" * 60])
+def test_reserved_and_malformed_type_names(client, name):
+    assert client.post(f"{TYPES}/{name}/schemas", json={"fields": ORDER_FIELDS}).status_code == 400
+
+
+@pytest.mark.parametrize("fields", [
+    {"a": {"type": "string", "pattern": "["}},
+    {"a": {"type": "integer", "min_length": 2}},
+    {"a": {"type": "object", "pattern": "x", "fields": {"b": {"type": "string"}}}},
+    {"a": {"type": "integer", "enum": [1, "x"]}},
+    {"a": {"type": "object"}},
+    {"version": {"type": "integer"}},
+    {"_hidden": {"type": "integer"}},
+])
+def test_schemas_that_cannot_be_compiled_are_rejected(client, fields):
+    response = client.post(f"{TYPES}/thing/schemas", json={"fields": fields})
+    assert response.status_code in (400, 422), response.text
+    assert client.get(f"{TYPES}/thing/schemas").status_code == 404
+
+
+def test_create_validates_against_latest_schema(client, order_type):
+    response = client.post(f"{TYPES}/order/entities/", json=_order(1))
+    assert response.status_code == 200, response.text
+    entity = client.get(f"{TYPES}/order/entities/{response.json()}").json()
+    assert entity["email"] == "buyer1@example.com"
+    assert entity["schema_version"] == 1
+
+    assert client.post(f"{TYPES}/order/entities/", json=_order(2, extra=1)).status_code == 422
+    assert client.post(f"{TYPES}/order/entities/", json=_order(3, orderId="X")).status_code == 422
+    assert client.post(f"{TYPES}/nope/entities/", json=_order(4)).status_code == 404
+
+
+def test_bulk_create_reports_invalid_rows_by_index(client, order_type):
+    rows = [_order(i) for i in range(4)]
+    rows[1]["lines"][0]["quantity"] = 0
+    rows[3] = "not an object"
+    result = client.post(f"{TYPES}/order/entities/bulk/", json=rows).json()
+    assert (result["created"], result["failed"]) == (2, 2)
+    assert [row["status"] for row in result["results"]] == ["created", "error", "created", "error"]
+    assert "quantity" in result["results"][1]["error"]
+
+
+def test_typed_entities_page_by_cursor(client, order_type):
+    ids = [client.post(f"{TYPES}/order/entities/", json=_order(i)).json() for i in range(3)]
+    first = client.get(f"{TYPES}/order/entities/", params={"limit": 2})
+    rest = client.get(f"{TYPES}/order/entities/", params={"limit": 2, "after": first.headers["x-next-cursor"]})
+    assert [entity["id"] for entity in first.json() + rest.json()] == ids
+    assert "x-next-cursor" not in rest.headers
+
+
+def test_compiled_schemas_are_cached(client, order_type):
+    client.post(f"{TYPES}/order/entities/", json=_order(1))
+    client.post(f"{TYPES}/order/entities/", json=_order(2))
+    stats = schema_registry.stats()
+    assert stats["size"] == 1
+    assert stats["hits"] >= 2
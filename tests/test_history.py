@@ -0,0 +1,305 @@
+from datetime import datetime, timedelta
+import time
+
+import pytest
+from bson import ObjectId
+from mongomock_motor import AsyncMongoMockCollection
+from pymongo.errors import AutoReconnect
+
+import app.utils.history_writer as history_writer_module
+import app.utils.utils as utils_module
+from app.core.config import settings
+from app.services.history import materialize_versions
+from app.utils.history_writer import HistoryWriter
+from app.utils.utils import build_history_doc
+from app.utils.history import DELTA, SNAPSHOT, apply_delta, diff_documents, encode_history_data
+from benchmarks.fixtures import make_customer
+from tests.conftest import ENTITIES
+
+
+def _visits(client, entity_id: str, **params) -> list:
+    response = client.get(f"{ENTITIES}/entities/{entity_id}/history", params=params)
+    assert response.status_code == 200, response.text
+    return [(record["version"], record["data"]["behavioralData"]["visitsCount"]) for record in response.json()]
+
+
+def _patch_visits(client, entity_id: str, customer: dict, visits: int):
+    behavioral = {**customer["behavioralData"], "visitsCount": visits}
+    assert client.patch(f"{ENTITIES}/{entity_id}", json={"behavioralData": behavioral}).status_code == 200
+
+
+# Delta encoding
+
+def test_diff_and_apply_round_trip():
+    before = {"a": 1, "nested": {"b": 2, "c": [1, 2]}, "gone": True}
+    after = {"a": 1, "nested": {"b": 3, "c": [1]}, "new": {"x": None}}
+    delta = diff_documents(before, after)
+    assert apply_delta(before, delta) == after
+    assert before["nested"] == {"b": 2, "c": [1, 2]}
+
+
+def test_snapshot_every_interval(monkeypatch):
+    monkeypatch.setattr(settings, "HISTORY_SNAPSHOT_INTERVAL", 3)
+    previous = {"_id": 1, "version": 1, "a": 1}
+    kinds = [encode_history_data({**previous, "version": version, "a": version}, previous)["kind"] for version in range(2, 8)]
+    assert kinds == [DELTA, DELTA, SNAPSHOT, DELTA, DELTA, SNAPSHOT]
+    assert encode_history_data({"version": 5}, None)["kind"] == SNAPSHOT
+
+
+# Replay through the API
+
+def test_replay_stops_at_a_missing_version(client, db):
+    entity_id = ObjectId()
+    records = [
+        {"version": 1, "kind": SNAPSHOT, "data": {"n": 1}},
+        {"version": 2, "kind": DELTA, "delta": {"set": [[["n"], 2]], "unset": []}},
+        {"version": 4, "kind": DELTA, "delta": {"set": [[["n"], 4]], "unset": []}},
+        {"version": 5, "kind": SNAPSHOT, "data": {"n": 5}},
+    ]
+    client.portal.call(db.entity_history.insert_many, [{**record, "entity_id": entity_id} for record in records])
+    states = client.portal.call(materialize_versions, [(entity_id, version) for version in range(1, 6)])
+    assert [(version, state["n"]) for (_, version), state in states.items()] == [(1, 1), (2, 2), (5, 5)]
+
+
+@pytest.fixture
+def patched_entity(client, monkeypatch):
+    """An entity updated 11 times with snapshots every 4 versions, and its visitsCount per version"""
+    monkeypatch.setattr(settings, "HISTORY_SNAPSHOT_INTERVAL", 4)
+    customer = make_customer(0)
+    entity_id = client.post(f"{ENTITIES}/create_entity/", json=customer).json()
+    for visits in range(1, 12):
+        _patch_visits(client, entity_id, customer, visits * 10)
+    expected = [(1, customer["behavioralData"]["visitsCount"])] + [(version, (version - 1) * 10) for version in range(2, 13)]
+    return entity_id, expected
+
+
+def test_history_replays_every_version(client, patched_entity):
+    entity_id, expected = patched_entity
+    assert _visits(client, entity_id) == expected
+
+
+def test_history_pages_start_between_snapshots(client, patched_entity):
+    entity_id, expected = patched_entity
+    response = client.get(f"{ENTITIES}/entities/{entity_id}/history", params={"from_version": 7, "limit": 3})
+    assert response.headers["x-next-version"] == "10"
+    assert _visits(client, entity_id, from_version=7, limit=3) == expected[6:9]
+    assert _visits(client, entity_id, from_version=10, to_version=11) == expected[9:11]
+
+
+def test_materialize_versions_matches_full_replay(client, db, patched_entity):
+    entity_id, expected = patched_entity
+    object_id = ObjectId(entity_id)
+    wanted = [(object_id, 3), (object_id, 6), (object_id, 12), (ObjectId(), 1)]
+    states = client.portal.call(materialize_versions, wanted)
+    assert sorted(states) == sorted(wanted[:3])
+    assert [states[key]["behavioralData"]["visitsCount"] for key in wanted[:3]] == [expected[2][1], expected[5][1], expected[11][1]]
+    assert client.portal.call(db.entity_history.count_documents, {"entity_id": object_id, "kind": SNAPSHOT}) == 3
+
+
+def test_lost_delta_hides_versions_until_next_snapshot(client, db, patched_entity):
+    entity_id, expected = patched_entity
+    client.portal.call(db.entity_history.delete_one, {"entity_id": ObjectId(entity_id), "version": 6})
+    assert [version for version, _ in _visits(client, entity_id)] == [1, 2, 3, 4, 5, 9, 10, 11, 12]
+
+
+def test_legacy_full_copies_replay(client, db):
+    entity_id = ObjectId()
+    records = [
+        {"entity_id": entity_id, "version": version, "operation": "update", "timestamp": datetime.utcnow(),
+         "data": {**make_customer(0), "_id": entity_id, "version": version}}
+        for version in (1, 2)
+    ]
+    client.portal.call(db.entity_history.insert_many, records)
+    assert [record["version"] for record in client.get(f"{ENTITIES}/entities/{entity_id}/history").json()] == [1, 2]
+
+
+def test_history_etag_and_bad_id(client, patched_entity):
+    entity_id, _ = patched_entity
+    url = f"{ENTITIES}/entities/{entity_id}/history"
+    etag = client.get(url, params={"limit": 5}).headers["etag"]
+    assert client.get(url, params={"limit": 5}, headers={"If-None-Match": etag}).status_code == 304
+    assert client.get(f"{ENTITIES}/entities/not-an-id/history").status_code == 400
+
+
+# As-of reads
+
+START = datetime(2024, 1, 1)
+
+
+def _spread_timestamps(client, db, entity_id: str):
+    """Move version v of the entity's history to START + v minutes"""
+    for record in client.portal.call(lambda: db.entity_history.find({"entity_id": ObjectId(entity_id)}).to_list(None)):
+        timestamp = START + timedelta(minutes=record["version"])
+        client.portal.call(db.entity_history.update_one, {"_id": record["_id"]}, {"$set": {"timestamp": timestamp}})
+
+
+def _as_of(client, entity_id: str, timestamp: str):
+    return client.get(f"{ENTITIES}/entities/{entity_id}/as_of", params={"timestamp": timestamp})
+
+
+def test_as_of_returns_the_version_in_effect(client, db, patched_entity):
+    entity_id, expected = patched_entity
+    _spread_timestamps(client, db, entity_id)
+    entity = _as_of(client, entity_id, "2024-01-01T00:06:30").json()
+    assert (entity["version"], entity["data"]["behavioralData"]["visitsCount"]) == expected[5]
+    assert entity["valid_from"].startswith("2024-01-01T00:06:00")
+    assert _as_of(client, entity_id, "2024-01-01T01:08:00+01:00").json()["version"] == 8
+    assert _as_of(client, entity_id, "2024-01-01T00:00:30").status_code == 404
+
+
+def test_bulk_as_of_leaves_out_deleted_and_unknown_entities(client, db, create):
+    kept, deleted = create(0), create(1)
+    client.delete(f"{ENTITIES}/delete_entity/{deleted}")
+    for entity_id in (kept, deleted):
+        _spread_timestamps(client, db, entity_id)
+    unknown = str(ObjectId())
+
+    def as_of(timestamp: str) -> dict:
+        response = client.post(f"{ENTITIES}/as_of/", json={"ids": [kept, deleted, unknown, kept], "timestamp": timestamp})
+        assert response.status_code == 200, response.text
+        return response.json()
+
+    before_delete = as_of("2024-01-01T00:01:30")
+    assert [entity["id"] for entity in before_delete["entities"]] == [kept, deleted]
+    assert before_delete["missing"] == [unknown]
+    assert as_of("2024-01-01T00:05:00")["missing"] == [deleted, unknown]
+    assert client.post(f"{ENTITIES}/as_of/", json={"ids": ["nope"], "timestamp": "2024-01-01T00:00:00"}).status_code == 400
+
+
+# Change feed
+
+CHANGES = "/api/v1/changes"
+
+
+def _changes(client, **params) -> dict:
+    response = client.get(f"{CHANGES}/", params=params)
+    assert response.status_code == 200, response.text
+    return response.json()
+
+
+@pytest.fixture
+def settled(monkeypatch):
+    """Every history record counts as settled as soon as it is written"""
+    monkeypatch.setattr(settings, "CHANGE_FEED_SETTLE_SECONDS", -5)
+
+
+def test_change_feed_walks_history_in_batches(client, patched_entity, settled):
+    entity_id, expected = patched_entity
+    seen, after = [], None
+    while True:
+        batch = _changes(client, limit=5, **({"after": after} if after else {}))
+        seen += batch["changes"]
+        after = batch["watermark"]
+        if not batch["has_more"]:
+            break
+    assert [change["version"] for change in seen] == [version for version, _ in expected]
+    assert {change["entity_id"] for change in seen} == {entity_id}
+    assert [change["kind"] for change in seen[:5]] == ["snapshot", "delta", "delta", "delta", "snapshot"]
+    assert _changes(client, after=after)["changes"] == []
+
+
+def test_full_change_feed_resolves_deltas(client, patched_entity, settled):
+    _, expected = patched_entity
+    changes = _changes(client, full=True)["changes"]
+    assert [(change["version"], change["data"]["behavioralData"]["visitsCount"]) for change in changes] == expected
+    assert "delta" not in changes[1]
+
+
+def test_consumer_resumes_from_acknowledged_watermark(client, patched_entity, settled):
+    first = _changes(client, limit=4)
+    ack = client.post(f"{CHANGES}/exporter/ack", json={"watermark": first["watermark"]})
+    assert ack.json()["watermark"] == first["watermark"]
+    assert _changes(client, consumer="exporter", limit=1)["changes"][0]["version"] == 5
+
+    # An older watermark never moves the consumer back
+    stale = first["changes"][0]["id"]
+    assert client.post(f"{CHANGES}/exporter/ack", json={"watermark": stale}).json()["watermark"] == first["watermark"]
+    assert _changes(client, consumer="unknown", limit=1)["changes"][0]["version"] == 1
+
+
+def test_change_feed_withholds_unsettled_records(client, patched_entity):
+    assert _changes(client)["changes"] == []
+    assert client.get(f"{CHANGES}/", params={"after": "zzz"}).status_code == 400
+
+
+# Write-behind history writer
+
+def _record(entity_id, version: int, **fields) -> dict:
+    return {"entity_id": entity_id, "version": version, "kind": SNAPSHOT, "data": {}, "operation": "update", "timestamp": datetime.utcnow(), **fields}
+
+
+@pytest.fixture
+def writer(client, monkeypatch):
+    """A started write-behind writer that build_history_doc also consults, with retries that do not wait"""
+    writer = HistoryWriter(max_queue=4, batch_size=3, flush_interval=0.01)
+    monkeypatch.setattr(history_writer_module, "RETRY_BACKOFF_SECONDS", 0)
+    monkeypatch.setattr(utils_module, "history_writer", writer)
+    task = client.portal.start_task_soon(writer.run)
+    while not writer.accepting:
+        time.sleep(0.001)
+    yield writer
+    task.cancel()
+
+
+def _history_count(client, db, entity_id) -> int:
+    return client.portal.call(db.entity_history.count_documents, {"entity_id": entity_id})
+
+
+def test_writer_group_commits_and_drains_on_close(client, db, writer):
+    entity_id = ObjectId()
+    for version in range(1, 8):
+        client.portal.call(writer.submit, _record(entity_id, version))
+    client.portal.call(writer.close)
+    assert _history_count(client, db, entity_id) == 7
+    stats = writer.stats()
+    assert (stats["written"], stats["failed"]) == (7, 0)
+    assert stats["flushes"] < 7
+
+
+def test_writer_retries_only_unwritten_records_with_fresh_ids(client, db, writer, monkeypatch):
+    insert_many = AsyncMongoMockCollection.insert_many
+    first_ids = []
+
+    async def drops_connection_once(self, records, **options):
+        if not first_ids:
+            first_ids.extend(record["_id"] for record in records)
+            await insert_many(self, records[:1], **options)
+            raise AutoReconnect("connection reset")
+        return await insert_many(self, records, **options)
+
+    monkeypatch.setattr(AsyncMongoMockCollection, "insert_many", drops_connection_once, raising=False)
+    entity_id = ObjectId()
+    client.portal.call(writer._flush, [_record(entity_id, version) for version in (1, 2, 3)])
+    stored = client.portal.call(lambda: db.entity_history.find({"entity_id": entity_id}).sort("version", 1).to_list(None))
+    assert [record["version"] for record in stored] == [1, 2, 3]
+    assert stored[0]["_id"] == first_ids[0]
+    assert not {record["_id"] for record in stored[1:]} & set(first_ids)
+    assert writer.stats()["written"] == 3
+
+
+def test_dropped_records_make_the_next_version_a_snapshot(client, db, writer, monkeypatch):
+    async def unavailable(self, records, **options):
+        raise AutoReconnect("no primary")
+
+    monkeypatch.setattr(AsyncMongoMockCollection, "insert_many", unavailable, raising=False)
+    entity_id = ObjectId()
+    client.portal.call(writer._flush, [_record(entity_id, 4, kind=DELTA, delta={})])
+    assert (writer.stats()["failed"], writer.stats()["resync_pending"]) == (1, 1)
+    assert "resync_pending" in client.get("/api/v1/admin/history_writer/stats").json()
+
+    previous = {"_id": entity_id, "version": 4, "a": 1}
+    assert build_history_doc({**previous, "version": 5, "a": 2}, "update", previous)["kind"] == SNAPSHOT
+    assert build_history_doc({**previous, "version": 6, "a": 3}, "update", {**previous, "version": 5})["kind"] == DELTA
+
+
+def test_writer_survives_a_record_that_cannot_be_encoded(client, db, writer):
+    broken, healthy = ObjectId(), ObjectId()
+    client.portal.call(writer.submit, _record(broken, 1, data={"bad": object()}))
+    client.portal.call(writer.close)
+    assert writer.stats()["failed"] == 1
+    assert broken in writer.resync
+
+    writer.accepting = True
+    client.portal.call(writer.submit, _record(healthy, 1))
+    client.portal.call(writer.close)
+    assert _history_count(client, db, healthy) == 1